@@ -1,48 +1,95 @@
 import os
+import socket
 import hashlib
-import re
 import time
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
-from flask import Flask, request, jsonify
+import uuid
+from flask import Flask, g, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import json
-from typing import TypedDict, List, Dict, Tuple
+from typing import List, Dict
 from dotenv import load_dotenv
 
+from ingest import StageStats, start_pools
+from jobs import UploadJobManager, QueueFullError
+from index_registry import IndexRegistry, shared_vector_path
+from embeddings import EmbeddingService, served_model_name
+from fakes import fake_llm_factories_from_env, fake_embeddings_from_env
+from web_context import WebContextFetcher
+from response_cache import SemanticResponseCache, chunk_id, context_id
+from context_assembly import assemble_context, budget_for, count_tokens, truncate_to_tokens
+from context_orchestrator import ContextOrchestrator
+from llm_gateway import LLMGateway, ModelUnavailable
+from doc_router import DocumentFilter
+from exam_spec import generate_exam_paper_prompt, parse_exam_spec
+from exam_papers import EXAM_GENERATION_MODE, EXAM_MAX_PAPERS, generate_papers, iter_papers, slice_docs, slice_text
+from chat_pipeline import (
+    ChatPipeline, OverloadedError, DeadlineExceeded, ClientDisconnected, ainvoke_model, astream_model
+)
+from startup import LazyComponent, STARTUP_MODE, start_components
+from metrics import REGISTRY, REQUEST_ID_HEADER, REQUEST_SECONDS, REQUESTS, observe_stages, request_id_from
+
 # Load environment variables from .env file
 load_dotenv(override=True)
 
-# Optional LangChain and related imports. These libraries are heavy and may
-# not be available in all development environments. Attempt imports and
-# fall back to a demo mode if unavailable so the Flask app can still run.
-SUPPORTS_LANGCHAIN = True
-try:
-    from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, BaseMessage
-    from langchain_community.vectorstores import FAISS
-    from langchain_community.document_loaders import PyMuPDFLoader
-    from langchain_text_splitters import CharacterTextSplitter
-    from langgraph.graph import StateGraph, END
-    from langgraph.prebuilt import ToolNode
-    from langchain_core.tools import tool
-    from langchain_community.utilities import GoogleSearchAPIWrapper
-    from langchain_core.runnables import RunnableLambda
-    from langchain_groq import ChatGroq
-    from langchain_huggingface import HuggingFaceEmbeddings
-except Exception as e:
-    SUPPORTS_LANGCHAIN = False
-    FAISS = None
-    PyMuPDFLoader = None
-    CharacterTextSplitter = None
-    GoogleSearchAPIWrapper = None
-    ChatGroq = None
-    HuggingFaceEmbeddings = None
-    print(f"⚠️ LangChain (or related) imports failed — running in limited/demo mode: {e}")
+# Fork the PDF parse workers before anything below starts a thread.
+start_pools()
+
+# LangChain model classes are heavy imports (torch, transformers, provider
+# SDKs), so they are imported when the models are first built rather than
+# here; see startup.py for when that happens. Missing packages still fall
+# back to a limited/demo mode.
+def _import_langchain_models():
+    """Return (ChatGroq, HuggingFaceEmbeddings), either of which may be None."""
+    try:
+        from langchain_groq import ChatGroq
+    except Exception as e:
+        ChatGroq = None
+        print(f"⚠️ langchain_groq unavailable — running without Groq models: {e}")
+    try:
+        from langchain_huggingface import HuggingFaceEmbeddings
+    except Exception as e:
+        HuggingFaceEmbeddings = None
+        print(f"⚠️ langchain_huggingface unavailable — embedding model disabled: {e}")
+    return ChatGroq, HuggingFaceEmbeddings
 
 app = Flask(__name__)
-CORS(app, origins=["http://localhost:3000"])
+CORS(app, origins=["http://localhost:3000"], expose_headers=[REQUEST_ID_HEADER])
+
+@app.before_request
+def start_request():
+    # The caller's X-Request-ID is kept (so a request can be followed across
+    # services); otherwise one is assigned. It is echoed on the response,
+    # carried in chat state and upload jobs, and prefixed to their log lines.
+    g.request_id = request_id_from(request.headers.get(REQUEST_ID_HEADER))
+    g.started = time.perf_counter()
+
+@app.after_request
+def finish_request(response):
+    response.headers[REQUEST_ID_HEADER] = g.request_id
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    REQUEST_SECONDS.observe(time.perf_counter() - g.started, route=route)
+    return response
+
+def profiling_requested():
+    """``?profile=1`` (or ``"profile": true`` in a chat body) asks for a per-stage timing breakdown."""
+    if request.args.get('profile') in ('1', 'true'):
+        return True
+    data = request.get_json(silent=True) if request.is_json else None
+    return bool(isinstance(data, dict) and data.get('profile'))
+
+def timing_profile(request_id: str, started: float, timings: Dict) -> Dict:
+    """
+    Stage timings of one request next to its total time. Stages that run
+    concurrently (speculative web search, per-paper exam calls) overlap, so
+    they need not add up to the total.
+    """
+    return {
+        'request_id': request_id,
+        'total_seconds': round(time.perf_counter() - started, 4),
+        'stages': {k: v for k, v in timings.items() if isinstance(v, (int, float))},
+    }
 
 UPLOAD_FOLDER = 'uploads'
 VECTOR_DIR = 'vector_store'
@@ -61,22 +108,43 @@ API_KEYS = {
     "GROQ_API_KEY": os.environ.get("GROQ_API_KEY")
 }
 
-models = {}
-embedding_model = None
-retrievers = {}
-all_dbs = {}
-LLM_AUTH_OK = False
+# Groq chat models offered, as "Display-Name=model-id" pairs; the LLM
+# gateway fails over between them (see LLM_FAILOVER).
+GROQ_MODELS = dict(
+    pair.split('=', 1) for pair in os.environ.get("GROQ_MODELS", "GPT-OSS-120B=openai/gpt-oss-120b").split(',')
+    if '=' in pair
+)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_pdf_hash(file_path):
-    with open(file_path, "rb") as f:
-        pdf_bytes = f.read()
-    return hashlib.md5(pdf_bytes).hexdigest()
+# Files are hashed in fixed-size reads so memory stays flat for large PDFs.
+HASH_CHUNK_SIZE = 1024 * 1024
 
-def create_embedding_model_with_retry(model_name="sentence-transformers/all-MiniLM-L6-v2", retries=3, backoff_factor=2):
-    if not SUPPORTS_LANGCHAIN or HuggingFaceEmbeddings is None:
+def get_pdf_hash(file_path, chunk_size=HASH_CHUNK_SIZE):
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def save_and_hash(file, file_path, chunk_size=HASH_CHUNK_SIZE):
+    """Stream an uploaded file to disk and hash it in the same pass."""
+    md5 = hashlib.md5()
+    with open(file_path, "wb") as out:
+        for chunk in iter(lambda: file.stream.read(chunk_size), b""):
+            md5.update(chunk)
+            out.write(chunk)
+    return md5.hexdigest()
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_CACHE_PATH = os.path.join(VECTOR_DIR, '_embedding_cache.sqlite')
+# Shared embedding server (see embedding_server.py); unset, every worker loads its own model.
+EMBEDDING_SERVER_SOCKET = os.environ.get("EMBEDDING_SERVER_SOCKET")
+
+def create_embedding_model_with_retry(model_name=EMBEDDING_MODEL_NAME, retries=3, backoff_factor=2):
+    _, HuggingFaceEmbeddings = _import_langchain_models()
+    if HuggingFaceEmbeddings is None:
         print("⚠️ HuggingFaceEmbeddings not available — embedding model disabled")
         return None
 
@@ -95,51 +163,92 @@ def create_embedding_model_with_retry(model_name="sentence-transformers/all-Mini
                 print(f"❌ Failed to initialize embedding model after {retries} attempts: {str(e)}")
                 return None
 
-def initialize_models():
-    global models, embedding_model, LLM_AUTH_OK
-    model_options = {
-        "GPT-OSS-120B": "openai/gpt-oss-120b"
-    }
+def load_llm_models():
+    """Build the LLM gateway over every usable chat model; None means no LLM is usable."""
+    factories = {}
 
     # Initialize chat/LLM models only if supported and an API key is provided
-    LLM_AUTH_OK = False
-    if SUPPORTS_LANGCHAIN and ChatGroq is not None:
-        groq_key = API_KEYS.get("GROQ_API_KEY")
-        if groq_key:
-            for name, model_id in model_options.items():
-                if name == "GPT-OSS-120B":
-                    try:
-                        models[name] = ChatGroq(
-                            model_name=model_id,
-                            api_key=groq_key,
-                            temperature=0.3,
-                            max_tokens=2048
-                        )
-                        LLM_AUTH_OK = True
-                        print(f"Initialized LLM model: {name}")
-                    except Exception as e:
-                        LLM_AUTH_OK = False
-                        print(f"Failed to initialize {name}: {e}")
+    groq_key = API_KEYS.get("GROQ_API_KEY")
+    if groq_key:
+        ChatGroq, _ = _import_langchain_models()
+        if ChatGroq is not None:
+            for name, model_id in GROQ_MODELS.items():
+                factories[name.strip()] = lambda model_id=model_id.strip(): ChatGroq(
+                    model_name=model_id,
+                    api_key=groq_key,
+                    temperature=0.3,
+                    max_tokens=2048
+                )
         else:
-            print("⚠️ GROQ_API_KEY not set; skipping Groq LLM initialization")
+            print("⚠️ LLM/chat models not available in this environment")
     else:
-        print("⚠️ LLM/chat models not available in this environment")
-
-    # Initialize embedding model if available
-    embedding_model = create_embedding_model_with_retry()
-    if embedding_model:
-        print("Embedding model initialized successfully")
+        print("⚠️ GROQ_API_KEY not set; skipping Groq LLM initialization")
+
+    # Local offline models for development and tests (FAKE_LLM=1)
+    factories.update(fake_llm_factories_from_env())
+    # Each model gets a pool of clients, deadlines, retries and a circuit breaker.
+    return LLMGateway.from_factories(factories)
+
+def load_embedding_model():
+    # With several workers, one embedding server holds the model and batches
+    # for all of them; the in-process model is only built if it is needed.
+    fallback = LazyComponent(
+        'embedding-fallback', lambda: fake_embeddings_from_env() or create_embedding_model_with_retry()
+    )
+    remote_model = None
+    if EMBEDDING_SERVER_SOCKET and not hasattr(socket, 'AF_UNIX'):
+        print("⚠️ EMBEDDING_SERVER_SOCKET needs Unix sockets, which this platform lacks; embedding in-process")
+    elif EMBEDDING_SERVER_SOCKET:
+        # Imported here: the server module is Unix-only.
+        from embedding_server import RemoteEmbeddings, server_model
+        remote_model = server_model(EMBEDDING_SERVER_SOCKET)
+    if remote_model:
+        print(f"Using shared embedding server at {EMBEDDING_SERVER_SOCKET} ({remote_model})")
+        embedding_model = RemoteEmbeddings(EMBEDDING_SERVER_SOCKET, fallback=fallback, model_name=remote_model)
     else:
+        embedding_model = fallback.get()
+    if not embedding_model:
         print("⚠️ Embedding model not initialized; upload and search endpoints will be limited")
+        return None
+    print("Embedding model initialized successfully")
+    # All callers go through the service so chunk and query embeddings
+    # are cached and concurrent uploads share model batches. The cache is
+    # keyed by the model actually serving (a fake, or the server's model).
+    model_name = served_model_name(embedding_model, EMBEDDING_MODEL_NAME)
+    return EmbeddingService(embedding_model, model_name, cache_path=EMBEDDING_CACHE_PATH)
+
+llm_component = LazyComponent('llm', load_llm_models)
+embedding_component = LazyComponent('embedding', load_embedding_model)
+COMPONENTS = [llm_component, embedding_component]
+
+def get_llm_gateway():
+    return llm_component.get()
+
+def get_embedding_model():
+    return embedding_component.get()
 
-initialize_models()
+start_components(COMPONENTS)
+
+def register_user_documents(user_email, documents):
+    added = index_registry.add_documents(user_email, documents)
+    print(f"Appended {len(added)} new documents to {user_email}'s index")
+
+response_cache = SemanticResponseCache()
+index_registry = IndexRegistry(VECTOR_DIR, get_embedding_model, on_change=response_cache.invalidate_user)
+web_fetcher = WebContextFetcher(API_KEYS["GOOGLE_API_KEY"], API_KEYS["GOOGLE_CSE_ID"])
+upload_jobs = UploadJobManager(get_embedding_model, register_user_documents, pins=index_registry.pins)
+chat_pipeline = ChatPipeline()
 
 @app.route('/api/models', methods=['GET'])
 def get_available_models():
+    # Models whose circuit is open are listed under `unavailable` (with the
+    # seconds until they are tried again) rather than offered.
+    gateway = get_llm_gateway()
     return jsonify({
-        'models': list(models.keys()),
-        'embedding_available': embedding_model is not None,
-        'llm_auth': LLM_AUTH_OK
+        'models': gateway.available() if gateway else [],
+        'unavailable': gateway.unavailable() if gateway else {},
+        'embedding_available': get_embedding_model() is not None,
+        'llm_auth': gateway is not None
     })
 
 @app.route('/api/upload', methods=['POST'])
@@ -155,388 +264,132 @@ def upload_files():
     if not files or files[0].filename == '':
         return jsonify({'error': 'No files selected'}), 400
 
-    if not embedding_model:
+    if not get_embedding_model():
         return jsonify({'error': 'Embedding model not available'}), 500
 
-    processed_files = []
-    user_dbs = []
+    stats = StageStats()
+    save_seconds = {}
+    items = []
+    # Saved names get a per-request token so concurrent uploads of the same
+    # filename cannot overwrite each other while they wait in the queue.
+    upload_token = uuid.uuid4().hex[:8]
 
     for file in files:
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(UPLOAD_FOLDER, f"{user_email}_{filename}")
-            file.save(filepath)
-
-            try:
-                pdf_hash = get_pdf_hash(filepath)
-                vector_path = os.path.join(VECTOR_DIR, f"{user_email}_{pdf_hash}")
-
-                if os.path.exists(vector_path):
-                    print(f"Reusing existing embeddings for {filename}")
-                    db = FAISS.load_local(
-                        vector_path,
-                        embeddings=embedding_model,
-                        allow_dangerous_deserialization=True
-                    )
-                else:
-                    print(f"Creating new embeddings for {filename}")
-                    loader = PyMuPDFLoader(filepath)
-                    documents = loader.load()
-
-                    for doc in documents:
-                        doc.metadata.update({
-                            "source": filename,
-                            "user_email": user_email,
-                            "hash": pdf_hash,
-                            "uploaded_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        })
-
-                    splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-                    docs = splitter.split_documents(documents)
-                    db = FAISS.from_documents(docs, embedding_model)
-                    db.save_local(vector_path)
-
-                user_dbs.append(db)
-                processed_files.append(filename)
-
-                os.remove(filepath)
-
-            except Exception as e:
-                print(f"Error processing {filename}: {str(e)}")
-                return jsonify({'error': f'Error processing {filename}: {str(e)}'}), 500
-
-    if user_dbs:
-        combined_db = user_dbs[0]
-        for extra_db in user_dbs[1:]:
-            combined_db.merge_from(extra_db)
-
-        retrievers[user_email] = combined_db.as_retriever(search_kwargs={"k": 10})
-        all_dbs[user_email] = combined_db
+            filepath = os.path.join(UPLOAD_FOLDER, f"{upload_token}_{user_email}_{filename}")
+
+            t0 = time.perf_counter()
+            pdf_hash = save_and_hash(file, filepath)
+            save_seconds[filename] = round(time.perf_counter() - t0, 4)
+            stats.record('hash', 1, save_seconds[filename])
+            items.append({
+                'filename': filename,
+                'filepath': filepath,
+                'user_email': user_email,
+                'pdf_hash': pdf_hash,
+                'vector_path': shared_vector_path(VECTOR_DIR, pdf_hash)
+            })
 
-    return jsonify({
-        'message': f'Successfully processed {len(processed_files)} files',
-        'files': processed_files
-    })
+    if not items:
+        return jsonify({'error': 'No PDF files provided'}), 400
+
+    try:
+        job = upload_jobs.submit(user_email, items, request_id=g.request_id)
+    except QueueFullError as e:
+        for item in items:
+            os.remove(item['filepath'])
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    payload = {
+        'message': f'Accepted {len(items)} files for processing',
+        'job_id': job['job_id'],
+        'request_id': g.request_id,
+        'status': job['status'],
+        'files': [f['filename'] for f in job['files']],
+        'hash_stats': stats.summary()
+    }
+    if profiling_requested():
+        # Parse/embed/index timings follow in the job status once it runs.
+        payload['profile'] = timing_profile(g.request_id, g.started, {f"hash:{n}": s for n, s in save_seconds.items()})
+    return jsonify(payload), 202
+
+@app.route('/api/upload/jobs/<job_id>', methods=['GET'])
+def get_upload_job(job_id):
+    job = upload_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job id'}), 404
+    return jsonify(job)
+
+@app.route('/api/upload/jobs', methods=['GET'])
+def list_upload_jobs():
+    user_email = request.args.get('user_email')
+    if not user_email:
+        return jsonify({'error': 'User email is required'}), 400
+    return jsonify({'jobs': upload_jobs.list_for_user(user_email)})
+
+@app.route('/api/documents', methods=['GET'])
+def list_documents():
+    user_email = request.args.get('user_email')
+    if not user_email:
+        return jsonify({'error': 'User email is required'}), 400
+    return jsonify({'documents': index_registry.list_documents(user_email)})
 
-def get_combined_context(query: str, retriever, max_chunks=20) -> str:
+@app.route('/api/documents/<pdf_hash>', methods=['DELETE'])
+def delete_document(pdf_hash):
+    user_email = request.args.get('user_email')
+    if not user_email:
+        return jsonify({'error': 'User email is required'}), 400
+    if not index_registry.remove_document(user_email, pdf_hash):
+        return jsonify({'error': 'Document not found'}), 404
+    return jsonify({'message': 'Document removed', 'hash': pdf_hash})
+
+def retrieve_pdf_context(user_email: str, query: str, filters=None, max_chunks=20):
+    """PDF chunks for ``query`` and the best chunk's relevance (see HybridRetriever.retrieve)."""
+    retriever = index_registry.get_retriever(user_email)
     if not retriever:
-        return ""
-    docs = retriever.invoke(query)
-    if not docs:
-        return ""
-    return "\n\n".join([f"[{doc.metadata.get('source','unknown')} p.{doc.metadata.get('page','?')}] {doc.page_content}" for doc in docs[:max_chunks]])
+        return [], None
+    docs, relevance = retriever.retrieve(query, filters)
+    return docs[:max_chunks], relevance
 
-def get_web_context(query: str, num_results=5) -> str:
+def get_web_context(query: str, num_results=5, cancel=None) -> str:
     # If Google Search API credentials are not available, avoid attempting
     # the API call and return a clear message so callers can handle limited
     # functionality gracefully.
-    if not SUPPORTS_LANGCHAIN or GoogleSearchAPIWrapper is None:
-        return "Web search unavailable: LangChain/google utilities not installed."
-    if not API_KEYS.get("GOOGLE_API_KEY") or not API_KEYS.get("GOOGLE_CSE_ID"):
+    if not web_fetcher.configured:
         return "Web search unavailable: missing Google Search API credentials."
 
-    search = GoogleSearchAPIWrapper(
-        google_api_key=API_KEYS["GOOGLE_API_KEY"],
-        google_cse_id=API_KEYS["GOOGLE_CSE_ID"]
-    )
-    results = search.results(query, num_results=num_results)
-    full_contents = []
-    for res in results:
-        try:
-            response = requests.get(res['link'], timeout=5)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            text = soup.get_text(separator='\n', strip=True)[:3000]
-            full_contents.append(f"Title: {res.get('title', 'No title')}\nContent: {text}")
-        except Exception as fetch_e:
-            full_contents.append(f"Title: {res.get('title', 'No title')}\nSnippet: {res.get('snippet', 'No snippet')}")
-    return "\n\n".join(full_contents)
-
-def parse_exam_paper_params(query: str) -> Dict[str, any]:
-    """
-    Parse user query for exam paper generation parameters.
-    Returns dict with: 
-      - paper_count
-      - questions_per_paper (if uniform) OR computed from sections
-      - marks_per_question (uniform) OR handled via 'sections'
-      - difficulty (fallback uniform distribution)
-      - sections: optional list like [{count:2, marks:2, difficulties:["medium","hard"]}, ...]
-
-    Behavior:
-    - Use explicit user specifications when present
-    - Otherwise fall back to defaults (5 papers, 5 questions, 10 marks, 2-2-1 diff)
-    """
-    number_words = {
-        'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
-        'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10
-    }
-
-    def to_int(token: str) -> int:
-        token = token.lower()
-        return int(token) if token.isdigit() else number_words.get(token, 0)
-
-    params = {
-        'paper_count': 5,
-        'questions_per_paper': 5,
-        'marks_per_question': 10,
-        'difficulty': {'easy': 2, 'medium': 2, 'hard': 1}
-    }
+    try:
+        return web_fetcher.get_context(query, num_results=num_results, cancel=cancel)
+    except Exception as e:
+        print(f"⚠️ Web search failed: {e}")
+        return ""
 
-    # Paper count (supports '1 paper', '1 exam', '1 question paper')
-    paper_match = re.search(r'(\d+)\s*(?:question\s+paper|papers?|sets?|exams?)', query, re.IGNORECASE)
-    if paper_match:
-        params['paper_count'] = int(paper_match.group(1))
-
-    # Questions per paper (uniform)
-    question_match = re.search(r'(\d+)\s*(?:questions?|qs?|problems?)(?:\s+(?:each|per\s+paper))?', query, re.IGNORECASE)
-    if question_match:
-        params['questions_per_paper'] = int(question_match.group(1))
-
-    # SECTION-BASED parsing like: "two 2 marks questions, two 4 marks questions, three 10 marks questions"
-    section_pattern = re.compile(
-        r'(?:(one|two|three|four|five|six|seven|eight|nine|ten|\d+)\s+)'
-        r'((?:one|two|three|four|five|six|seven|eight|nine|ten|\d+))\s*mark[s]?\s*(?:questions?)?',
-        re.IGNORECASE
-    )
-    sections = [
-        {'count': to_int(m.group(1)) or 0, 'marks': to_int(m.group(2)) or 0}
-        for m in section_pattern.finditer(query)
-    ]
-    # If user omitted count before marks (rare), ignore those entries
-    sections = [s for s in sections if s['count'] > 0]
-
-    # Difficulty guidance like: "one medium and one hard in each section"
-    per_section_medium_hard = bool(re.search(r'one\s+medium\s+and\s+one\s+hard\s+in\s+each\s+section', query, re.IGNORECASE))
-
-    # Check for global difficulty override: "all hard", "all easy", "all medium"
-    all_difficulty_override = None
-    all_pattern = re.search(r'all\s+(easy|medium|hard)', query, re.IGNORECASE)
-    if all_pattern:
-        all_difficulty_override = all_pattern.group(1).lower()
-
-    # Time override like 'duration is 30 minutes' or 'time 30 minutes'
-    time_match = re.search(r'(?:time|duration)\s*(?:is\s*)?(\d+)\s*minutes?', query, re.IGNORECASE)
-    if time_match:
-        params['time_minutes'] = int(time_match.group(1))
-
-    if sections:
-        # Build difficulties per section
-        detailed_sections = []
-        for s in sections:
-            diff_plan: list[str] = []
-            
-            # PRIORITY 1: Global difficulty override (e.g., "all hard questions")
-            if all_difficulty_override:
-                diff_plan = [all_difficulty_override] * s['count']
-            # PRIORITY 2: Per-section medium/hard rule
-            elif per_section_medium_hard:
-                # Ensure at least one medium and one hard per section when possible
-                if s['count'] >= 2:
-                    diff_plan.extend(['medium', 'hard'])
-                # Fill remaining with easy, then cycle medium, hard
-                while len(diff_plan) < s['count']:
-                    if 'easy' not in diff_plan:
-                        diff_plan.append('easy')
-                    else:
-                        # Alternate medium/hard for the rest
-                        diff_plan.append('medium' if (len(diff_plan) % 2 == 0) else 'hard')
-            # PRIORITY 3: Default distribution based on marks
-            else:
-                # No specific guidance -> distribute roughly easy/medium/hard
-                # Prioritize medium/hard for higher marks
-                if s['marks'] >= 10:
-                    base = ['easy', 'medium', 'hard']
-                elif s['marks'] >= 4:
-                    base = ['medium', 'hard', 'easy']
-                else:
-                    base = ['medium', 'easy', 'hard']
-                i = 0
-                while len(diff_plan) < s['count']:
-                    diff_plan.append(base[i % len(base)])
-                    i += 1
-
-            detailed_sections.append({
-                'count': s['count'],
-                'marks': s['marks'],
-                'difficulties': diff_plan[:s['count']]
-            })
+context_orchestrator = ContextOrchestrator(
+    retrieve_pdf_context, lambda query, cancel: get_web_context(query, cancel=cancel),
+    lambda: web_fetcher.configured
+)
 
-        params['sections'] = detailed_sections
-        params['questions_per_paper'] = sum(s['count'] for s in detailed_sections)
-        # marks_per_question is irrelevant when using sections but keep last marks for compatibility
-        if detailed_sections:
-            params['marks_per_question'] = detailed_sections[-1]['marks']
-        return params
-
-    # If no sections, continue with uniform parsing
-    marks_match = re.search(r'(\d+)\s*marks?(?:\s+each)?', query, re.IGNORECASE)
-    if marks_match:
-        params['marks_per_question'] = int(marks_match.group(1))
-
-    # Flexible difficulty overrides
-    all_pattern = re.search(r'all\s+(?:(\d+)\s+)?(easy|medium|hard)', query, re.IGNORECASE)
-    if all_pattern:
-        count = int(all_pattern.group(1)) if all_pattern.group(1) else params['questions_per_paper']
-        difficulty_level = all_pattern.group(2).lower()
-        params['difficulty'] = {'easy': 0, 'medium': 0, 'hard': 0}
-        params['difficulty'][difficulty_level] = count
-        params['questions_per_paper'] = count
-        return params
-
-    single_difficulty = re.search(r'(\d+)\s+(easy|medium|hard)', query, re.IGNORECASE)
-    if single_difficulty and not re.search(r'(\d+)\s+easy.*?(\d+)\s+medium.*?(\d+)\s+hard', query, re.IGNORECASE):
-        count = int(single_difficulty.group(1))
-        difficulty_level = single_difficulty.group(2).lower()
-        params['difficulty'] = {'easy': 0, 'medium': 0, 'hard': 0}
-        params['difficulty'][difficulty_level] = count
-        params['questions_per_paper'] = count
-        return params
-
-    difficulty_pattern = r'(\d+)\s*easy.*?(\d+)\s*medium.*?(\d+)\s*hard'
-    difficulty_match = re.search(difficulty_pattern, query, re.IGNORECASE)
-    if difficulty_match:
-        easy_count = int(difficulty_match.group(1))
-        medium_count = int(difficulty_match.group(2))
-        hard_count = int(difficulty_match.group(3))
-        total = easy_count + medium_count + hard_count
-        params['difficulty'] = {'easy': easy_count, 'medium': medium_count, 'hard': hard_count}
-        params['questions_per_paper'] = total
-
-    return params
-
-def generate_exam_paper_prompt(query: str, context: str, params: Dict[str, any]) -> str:
+def exam_paper_prompts(state) -> List[str]:
     """
-    Generate a comprehensive prompt for exam paper generation.
-    Supports either uniform marks/difficulty or section-based variable marks.
+    One prompt per requested paper, each over its own slice of the
+    retrieved material, or None when the papers come from a single call.
     """
-    paper_count = params['paper_count']
-    questions_per_paper = params['questions_per_paper']
-    sections = params.get('sections')
-
-    if sections:
-        # Compute total marks from sections using difficulties length as question count
-        total_marks = sum(s['marks'] * len(s['difficulties']) for s in sections)
-        section_desc = ", ".join([f"{len(s['difficulties'])}×{s['marks']} marks" for s in sections])
-        time_override = params.get('time_minutes', 90)
-        prompt = f"""You are an expert exam paper creator. Generate {paper_count} complete examination papers based STRICTLY on the provided study material context below.
-
-**REQUIREMENTS:**
-- Generate exactly {paper_count} examination papers
-- Each paper must contain exactly {questions_per_paper} questions
-- Marks per paper: {total_marks} (sections: {section_desc})
-- Follow the specified difficulty per question as indicated in the template below
-- Questions MUST be based on the provided context only
-- Questions should be clear, unambiguous, and academically rigorous
-
-**DIFFICULTY LEVELS:**
-- Easy: Direct recall, definitions, basic concepts
-- Medium: Application, analysis, comparisons
-- Hard: Synthesis, critical evaluation, complex problem-solving
-
-**FORMATTING:**
-Use EXACTLY this format for each paper and for every question:
-"""
-
-        qn = 1
-        for s in sections:
-            for diff in s['difficulties']:
-                prompt += f"\n**Question {qn} ({diff.capitalize()} - {s['marks']} marks)**\n[Question text here]\n"
-                qn += 1
-
-        prompt += f"""
-
-At the very beginning of each paper include these lines:
----
-**EXAMINATION PAPER [NUMBER]**
-**Total Marks: {total_marks}**
-**Time: {time_override} minutes**
----
-
-Replace [NUMBER] with 1, 2, 3, ... for each paper.
-
-**STUDY MATERIAL CONTEXT:**
-{context}
-
-**USER REQUEST:**
-{query}
-
-⚠️ CRITICAL INSTRUCTION: You MUST generate questions with EXACTLY the difficulty levels shown in the template above. 
-- If a question shows "(Hard - 2 marks)", it MUST be a Hard question.
-- If a question shows "(Easy - 2 marks)", it MUST be an Easy question.
-- DO NOT change the difficulty levels under any circumstances.
-- DO NOT mix difficulties - follow the template exactly.
-
-Generate all {paper_count} exam papers now, following the format and difficulty requirements EXACTLY."""
-
-        return prompt
-
-    # Uniform case (backward compatible)
-    marks_per_question = params['marks_per_question']
-    difficulty = params['difficulty']
-    total_marks = questions_per_paper * marks_per_question
-    time_override = params.get('time_minutes', int(total_marks * 1.2))
-
-    # Build difficulty distribution string
-    difficulty_parts = []
-    if difficulty['easy'] > 0:
-        difficulty_parts.append(f"{difficulty['easy']} Easy")
-    if difficulty['medium'] > 0:
-        difficulty_parts.append(f"{difficulty['medium']} Medium")
-    if difficulty['hard'] > 0:
-        difficulty_parts.append(f"{difficulty['hard']} Hard")
-    difficulty_str = ", ".join(difficulty_parts) if difficulty_parts else "As specified"
-
-    prompt = f"""You are an expert exam paper creator. Generate {paper_count} complete examination papers based STRICTLY on the provided study material context below.
-
-**REQUIREMENTS:**
-- Generate exactly {paper_count} examination papers
-- Each paper must have exactly {questions_per_paper} questions
-- Each question carries {marks_per_question} marks (Total: {total_marks} marks per paper)
-- Difficulty distribution PER PAPER: {difficulty_str} questions
-- Questions MUST be based on the provided context - do not create questions on topics not covered in the context
-- Questions should be clear, unambiguous, and academically rigorous
-- Include a mix of question types: theoretical, analytical, application-based, and problem-solving
-
-**DIFFICULTY LEVELS:**
-- Easy: Direct recall, definitions, basic concepts
-- Medium: Application of concepts, analysis, comparison, moderate problem-solving
-- Hard: Synthesis, critical evaluation, complex problem-solving, advanced applications
-
-**FORMATTING:**
-For each paper, use this EXACT format:
-
----
-**EXAMINATION PAPER [NUMBER]**
-**Total Marks: {total_marks}**
-**Time: {time_override} minutes**
-"""
-
-    # Generate question template dynamically based on difficulty distribution
-    question_num = 1
-    for _ in range(difficulty['easy']):
-        prompt += f"\n**Question {question_num} (Easy - {marks_per_question} marks)**\n[Question text here]\n"
-        question_num += 1
-    for _ in range(difficulty['medium']):
-        prompt += f"\n**Question {question_num} (Medium - {marks_per_question} marks)**\n[Question text here]\n"
-        question_num += 1
-    for _ in range(difficulty['hard']):
-        prompt += f"\n**Question {question_num} (Hard - {marks_per_question} marks)**\n[Question text here]\n"
-        question_num += 1
-
-    prompt += f"""---
-
-Replace [NUMBER] with 1, 2, 3, etc. for each paper.
-
-**STUDY MATERIAL CONTEXT:**
-{context}
-
-**USER REQUEST:**
-{query}
-
-Generate all {paper_count} exam papers now, following the format exactly. Ensure questions are diverse, cover different aspects of the material, and maintain academic quality. 
-
-IMPORTANT: You MUST follow the user's difficulty requirements exactly. If they request "all 5 hard questions", generate ALL questions as Hard difficulty. Do NOT refuse or suggest alternatives - generate exactly what is requested."""
-
-    return prompt
+    spec = parse_exam_spec(state['query'])
+    count = spec.paper_count
+    if EXAM_GENERATION_MODE != 'parallel' or count <= 1:
+        return None
+    if state['docs']:
+        contexts = [assemble_context(docs, state['tool'])[0] for docs in slice_docs(state['docs'], count)]
+    else:
+        contexts = slice_text(state['context'], count)
+    single = spec.replace(paper_count=1)
+    return [
+        generate_exam_paper_prompt(state['query'], context, single, paper_number=i + 1)
+        for i, context in enumerate(contexts)
+    ]
 
 def build_prompt(tool, query, context):
     if tool == "summarizer":
@@ -563,8 +416,7 @@ def build_prompt(tool, query, context):
         )
     elif tool == "exam_paper_generator":
         # Parse parameters and generate specialized exam paper prompt
-        params = parse_exam_paper_params(query)
-        return generate_exam_paper_prompt(query, context, params)
+        return generate_exam_paper_prompt(query, context, parse_exam_spec(query))
     elif tool == "ai_chat":
         # General AI chat - can answer anything with or without context
         if context and context.strip():
@@ -589,58 +441,311 @@ def build_prompt(tool, query, context):
             f"Question: {query}\n\nContext:\n{context}"
         )
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
-    data = request.json
+def prepare_chat(data):
+    """
+    Validate a chat request.
+
+    Returns ``(state, None)`` on success, where ``state`` holds the user,
+    query, tool and model, or ``(None, (response, status))`` when the
+    request should be rejected. Context is gathered later, on the chat
+    pipeline (see ``gather_context``).
+    """
+    data = data or {}
     user_email = data.get('user_email')
     query = data.get('query')
     selected_model_name = data.get('model', 'GPT-OSS-120B')
     tool = data.get('tool', 'concept_explainer')  # You can pass tool from frontend
 
     if not user_email or not query:
-        return jsonify({'error': 'User email and query are required'}), 400
+        return None, (jsonify({'error': 'User email and query are required'}), 400)
+
+    try:
+        filters = DocumentFilter.from_request(data.get('filters'))
+    except ValueError as e:
+        return None, (jsonify({'error': f'Invalid filters: {e}'}), 400)
 
     # If LLM authentication is not OK, return a clear 401 so the frontend
     # can show a helpful message (instead of attempting to invoke the model).
-    if not LLM_AUTH_OK:
-        return jsonify({
+    gateway = get_llm_gateway()
+    if gateway is None:
+        return None, (jsonify({
             'error': 'LLM provider not authenticated (invalid or missing API key).',
             'auth_error': True,
             'hint': 'Set GROQ_API_KEY environment variable to a valid key or disable Groq usage.'
-        }), 401
+        }), 401)
+
+    if selected_model_name not in gateway.names:
+        return None, (jsonify({'error': 'Invalid model selected'}), 400)
+
+    # Every paper is its own model call, so the count is capped up front.
+    if tool == 'exam_paper_generator' and parse_exam_spec(query).paper_count > EXAM_MAX_PAPERS:
+        return None, (jsonify({'error': f'At most {EXAM_MAX_PAPERS} exam papers can be generated per request'}), 400)
+
+    return {
+        'user_email': user_email,
+        'query': query,
+        'tool': tool,
+        'filters': filters,
+        'model_name': selected_model_name,
+        'model': gateway.model(selected_model_name),
+        'deadline': chat_pipeline.request_deadline(data.get('timeout')),
+        'request_id': g.request_id,
+        'started': g.started,
+        'profile': profiling_requested(),
+        'timings': {},
+        'use_cache': not data.get('no_cache') and get_embedding_model() is not None
+                     and response_cache.enabled_for(tool),
+    }, None
+
+async def gather_context(state):
+    """Retrieve the chat's context and build its prompt, on the chat pipeline."""
+    query, tool, timings = state['query'], state['tool'], state['timings']
+
+    # Step 1: PDF retrieval, with web search in parallel for tools where the
+    # PDFs are optional (or after it when they returned nothing).
+    gathered = await context_orchestrator.gather(state['user_email'], query, tool, state['filters'])
+    branches = gathered['branches']
+    timings['retrieve'] = branches['pdf']['seconds']
+    if 'web' in branches:
+        timings['web_fetch'] = branches['web']['seconds']
+
+    # Step 2: Overlapping and near-duplicate chunks are merged/dropped and
+    # the rest packed into the tool's budget. Weak PDF results share the
+    # budget with the web context.
+    docs, web_context = gathered['docs'], gathered['web_context']
+    budget = budget_for(tool)
+    if docs and web_context:
+        context, context_stats = assemble_context(docs, tool, budget // 2)
+        web_part = truncate_to_tokens(web_context, budget - count_tokens(context))
+        context = f"{context}\n\nWeb results:\n{web_part}"
+        source = "pdf+web"
+    elif docs:
+        context, context_stats = assemble_context(docs, tool)
+        source = "pdf"
+    else:
+        context, context_stats = truncate_to_tokens(web_context, budget), None
+        source = "web"
 
-    if selected_model_name not in models:
-        return jsonify({'error': 'Invalid model selected'}), 400
+    # Identity of the context for the response cache: the retrieved chunks,
+    # or the web context itself when there were none.
+    chunk_ids = frozenset(chunk_id(d) for d in docs) if docs else frozenset([context_id(context)])
+    if docs and web_context:
+        chunk_ids = chunk_ids | {context_id(web_context)}
 
-    selected_model = models[selected_model_name]
-    user_retriever = retrievers.get(user_email)
+    # Step 3: Build prompt for the selected tool
+    t0 = time.perf_counter()
+    prompt = build_prompt(tool, query, context)
+    timings['prompt_build'] = round(time.perf_counter() - t0, 4)
+
+    state.update({
+        'context': context,
+        'source': source,
+        'chunk_ids': chunk_ids,
+        'context_stats': context_stats,
+        'docs': docs,
+        'retrieval': {'relevance': gathered['relevance'], 'branches': branches,
+                      'filters': state['filters'].as_dict() if state['filters'] else None},
+        'prompt': prompt,
+    })
+    return state
 
-    # Step 1: Try to get context from PDF
-    context = get_combined_context(query, user_retriever)
-    source = "pdf" if context else "web"
+def cached_response(state):
+    """Return a cached answer for this chat state, or None. Stores the query vector on ``state``."""
+    if not state['use_cache']:
+        return None
+    t0 = time.perf_counter()
+    state['query_vector'] = get_embedding_model().embed_query(state['query'])
+    hit = response_cache.lookup(state['tool'], state['model_name'], state['chunk_ids'], state['query_vector'])
+    state['timings']['cache_lookup'] = round(time.perf_counter() - t0, 4)
+    return hit
+
+def remember_response(state, answer, llm_seconds):
+    if state['use_cache'] and answer:
+        response_cache.store(
+            state['tool'], state['model_name'], state['chunk_ids'], state['query_vector'],
+            answer, llm_seconds, state['user_email']
+        )
 
-    # Step 2: Fallback to Google Search if no PDF context
-    if not context:
-        context = get_web_context(query)
+# Size of the context excerpt returned when the model call fails.
+FALLBACK_EXCERPT_TOKENS = 1000
 
-    # Step 3: Build prompt for the selected tool
-    prompt = build_prompt(tool, query, context)
+def overloaded_response(e: OverloadedError):
+    response = jsonify({'error': str(e), 'reason': e.reason, 'retry_after': e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+def deadline_response(state, e: DeadlineExceeded):
+    return jsonify({
+        'error': str(e),
+        'fallback_context': truncate_to_tokens(state.get('context') or "", FALLBACK_EXCERPT_TOKENS),
+        'source': 'deadline',
+        'tool': state['tool'],
+        'timings': state['timings']
+    }), 504
+
+def sse_event(event: str, payload: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+async def stream_chat(state):
+    """Chat pipeline coroutine behind /api/chat/stream; yields SSE events."""
+    await gather_context(state)
+    hit = await chat_pipeline.to_thread(cached_response, state)
+    if hit:
+        yield sse_event('token', {'token': hit['response']})
+        yield sse_event('done', stream_done(state, state['timings'], {'cached': True}))
+        return
+
+    started = time.perf_counter()
+    first_token = None
+    tokens = []
+    try:
+        exam_prompts = (await chat_pipeline.to_thread(exam_paper_prompts, state)
+                        if state['tool'] == 'exam_paper_generator' else None)
+        if exam_prompts:
+            # Papers are generated concurrently and sent whole, in order.
+            chunks = (text if index == 0 else f"\n\n{text}"
+                      async for index, text, _ in iter_papers(state['model'], exam_prompts))
+        else:
+            chunks = astream_model(state['model'], state['prompt'])
+        async for chunk in chunks:
+            token = getattr(chunk, "content", chunk)
+            if not token:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            tokens.append(token)
+            yield sse_event('token', {'token': token})
+    except Exception as e:
+        print(f"❌ [{state['request_id']}] Model streaming failed: {e}")
+        event = {
+            'error': str(e),
+            'fallback_context': truncate_to_tokens(state['context'], FALLBACK_EXCERPT_TOKENS),
+            'source': 'fallback',
+            'tool': state['tool']
+        }
+        if isinstance(e, ModelUnavailable):
+            event['retry_after'] = e.retry_after
+        yield sse_event('error', event)
+        return
+
+    timings = state['timings']
+    timings['llm_first_token'] = round(first_token, 4) if first_token is not None else None
+    timings['llm'] = round(time.perf_counter() - started, 4)
+    await chat_pipeline.to_thread(remember_response, state, "".join(tokens), timings['llm'])
+    yield sse_event('done', stream_done(state, timings))
+
+def stream_done(state, timings, extra=None) -> Dict:
+    done = {
+        'source': state['source'],
+        'tool': state['tool'],
+        **(extra or {}),
+        'timings': timings,
+        'context_stats': state['context_stats'],
+        'retrieval': state['retrieval'],
+        'llm': state['model'].report,
+        'request_id': state['request_id'],
+    }
+    if state['profile']:
+        done['profile'] = timing_profile(state['request_id'], state['started'], timings)
+    return done
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming variant of /api/chat using Server-Sent Events.
+
+    Emits ``token`` events (``{"token": "..."}``) as the model produces
+    them, then one ``done`` event carrying ``source``, ``tool`` and
+    ``timings``, or an ``error`` event if the model call fails mid-stream
+    or the chat runs past its deadline. A client that disconnects cancels
+    the chat.
+    """
+    state, error = prepare_chat(request.json)
+    if error:
+        return error
+
+    try:
+        events = chat_pipeline.stream(state['user_email'], lambda: stream_chat(state), state['deadline'],
+                                      state['timings'])
+    except OverloadedError as e:
+        return overloaded_response(e)
+
+    def generate():
+        try:
+            yield from events
+        except DeadlineExceeded as e:
+            yield sse_event('error', {'error': str(e), 'source': 'deadline', 'tool': state['tool'],
+                                      'timings': state['timings']})
+        except OverloadedError as e:
+            yield sse_event('error', {'error': str(e), 'retry_after': e.retry_after, 'tool': state['tool']})
+        except Exception as e:
+            print(f"❌ [{state['request_id']}] Chat stream failed: {e}")
+            yield sse_event('error', {'error': str(e), 'tool': state['tool']})
+        finally:
+            observe_stages('chat_stream', state['timings'])
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Runs on disconnect even if the body was never iterated, unlike generate()'s finally.
+    response.call_on_close(events.close)
+    return response
+
+async def answer_chat(state):
+    """Chat pipeline coroutine behind /api/chat; returns ``(payload, status)``."""
+    await gather_context(state)
+    query = state['query']
+    tool = state['tool']
+    selected_model = state['model']
+    context = state['context']
+    source = state['source']
+    prompt = state['prompt']
 
     # Invoke the selected model, but guard against runtime errors (e.g. auth
     # failures from the remote provider). If the model call fails, return a
     # helpful fallback response instead of crashing the server.
+    hit = await chat_pipeline.to_thread(cached_response, state)
+    if hit:
+        return {
+            'response': hit['response'],
+            'source': source,
+            'tool': tool,
+            'cached': True,
+            'context_stats': state['context_stats'],
+            'retrieval': state['retrieval'],
+            'request_id': state['request_id']
+        }, 200
+
     try:
-        response = selected_model.invoke(prompt)
-        answer = getattr(response, "content", str(response))
+        t0 = time.perf_counter()
+        exam_prompts = (await chat_pipeline.to_thread(exam_paper_prompts, state)
+                        if tool == 'exam_paper_generator' else None)
+        if exam_prompts:
+            answer, state['exam_generation'] = await generate_papers(selected_model, exam_prompts)
+        else:
+            response = await ainvoke_model(selected_model, prompt)
+            answer = getattr(response, "content", str(response))
+        state['timings']['llm'] = round(time.perf_counter() - t0, 4)
+        await chat_pipeline.to_thread(remember_response, state, answer, state['timings']['llm'])
 
-        return jsonify({
+        payload = {
             'response': answer,
             'source': source,
-            'tool': tool
-        })
+            'tool': tool,
+            'context_stats': state['context_stats'],
+            'retrieval': state['retrieval'],
+            'request_id': state['request_id']
+        }
+        if 'exam_generation' in state:
+            payload['exam_generation'] = state['exam_generation']
+        payload['llm'] = selected_model.report
+        return payload, 200
     except Exception as e:
         # Log the exception server-side for debugging
-        print(f"❌ Model invocation failed: {e}")
+        print(f"❌ [{state['request_id']}] Model invocation failed: {e}")
+        unavailable = isinstance(e, ModelUnavailable)
 
         # Distinguish authentication errors from other failures to provide
         # a clearer response the frontend can act on.
@@ -654,36 +759,134 @@ def chat():
         fallback_excerpt = ""
         try:
             if context:
-                fallback_excerpt = context[:4000]
+                fallback_excerpt = truncate_to_tokens(context, FALLBACK_EXCERPT_TOKENS)
             else:
-                # If no local context, try fetching web context (best-effort)
-                fallback_excerpt = get_web_context(query, num_results=3)[:4000]
+                # If no local context, try web context (best-effort). Search
+                # results and pages fetched while gathering context are cached,
+                # so this does not repeat the network round trips.
+                web_context = await chat_pipeline.to_thread(get_web_context, query)
+                fallback_excerpt = truncate_to_tokens(web_context, FALLBACK_EXCERPT_TOKENS)
         except Exception as ex:
             print(f"⚠️ Failed to generate fallback context: {ex}")
 
         if is_auth_error:
             # Return 401 so the client knows this is an authentication issue
-            return jsonify({
+            return {
                 'error': 'Authentication with the LLM provider failed (invalid or missing API key).',
                 'auth_error': True,
                 'hint': 'Set GROQ_API_KEY environment variable to a valid key or remove/disable Groq usage in configuration.',
                 'fallback_context': fallback_excerpt,
                 'source': 'auth_error',
                 'tool': tool
-            }), 401
+            }, 401
+
+        if unavailable:
+            # Every model's circuit is open: 503 so clients back off, still with context
+            return {
+                'error': err_text,
+                'retry_after': e.retry_after,
+                'fallback_context': fallback_excerpt,
+                'source': 'fallback',
+                'tool': tool
+            }, 503
 
         # Generic failure: return 502 (bad gateway) with fallback context
-        return jsonify({
+        return {
             'response': f"Model invocation failed: {err_text}. Returning fallback context excerpt.",
             'fallback_context': fallback_excerpt,
             'error': err_text,
             'source': 'fallback',
             'tool': tool
-        }), 502
+        }, 502
+
+@app.route('/api/chat', methods=['POST'])
+def chat():
+    state, error = prepare_chat(request.json)
+    if error:
+        return error
+
+    # The request thread only waits: the chat runs on the pipeline's event
+    # loop under the per-user/global limits, and is cancelled if the client
+    # disconnects or the deadline passes.
+    try:
+        payload, status = chat_pipeline.run(
+            state['user_email'], lambda: answer_chat(state), state['deadline'], state['timings'], request.environ
+        )
+    except OverloadedError as e:
+        return overloaded_response(e)
+    except DeadlineExceeded as e:
+        return deadline_response(state, e)
+    except ClientDisconnected:
+        return '', 499
+    finally:
+        observe_stages('chat', state['timings'])
+    if state['profile']:
+        payload['profile'] = timing_profile(state['request_id'], state['started'], state['timings'])
+    response = jsonify(payload)
+    if 'retry_after' in payload:
+        response.headers['Retry-After'] = str(payload['retry_after'])
+    return response, status
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'models_loaded': len(models)})
+    """Liveness: answers immediately and never waits for (or triggers) model loading."""
+    embedding_model = embedding_component.peek()
+    return jsonify({
+        'status': 'healthy',
+        'models_loaded': len(llm_component.peek().names) if llm_component.peek() else 0,
+        'startup': {'mode': STARTUP_MODE, 'components': {c.name: c.status() for c in COMPONENTS}},
+        'index_registry': index_registry.stats(),
+        'embedding': embedding_model.stats() if embedding_model else None,
+        'web_cache': web_fetcher.stats(),
+        'chat': chat_pipeline.stats(),
+        'llm': llm_stats(),
+        'context': context_orchestrator.stats(),
+        'response_cache': response_cache.stats()
+    })
+
+REGISTRY.collector('chat', chat_pipeline.stats)
+REGISTRY.collector('context', context_orchestrator.stats)
+REGISTRY.collector('index_registry', index_registry.stats)
+REGISTRY.collector('web_cache', web_fetcher.stats)
+REGISTRY.collector('response_cache', response_cache.stats)
+
+def llm_stats():
+    gateway = llm_component.peek()
+    return gateway.stats() if gateway else {}
+
+def embedding_stats():
+    # peek(): a scrape must not wait for (or trigger) model loading.
+    embedding_model = embedding_component.peek()
+    return embedding_model.stats() if embedding_model else {}
+
+REGISTRY.collector('embedding', embedding_stats)
+REGISTRY.collector('llm', llm_stats)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus text exposition: request counts and latency, per-stage
+    latency histograms for chats and uploads, and the numeric fields of the
+    /health stats as gauges. Values are per process.
+    """
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness: 200 once every component has finished initializing (a
+    component that is unavailable still counts, the app runs degraded),
+    503 while any is pending or loading. In lazy mode the first probe
+    starts warming them in the background.
+    """
+    for component in COMPONENTS:
+        if not component.done:
+            component.warm()
+    ready = all(c.done for c in COMPONENTS)
+    return jsonify({
+        'ready': ready,
+        'components': {c.name: c.status() for c in COMPONENTS}
+    }), 200 if ready else 503
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Context gathering latency: sequential PDF-then-web vs speculative parallel.
+
+Drives ContextOrchestrator with simulated branches: PDF retrieval takes
+``--pdf-ms`` and the web search ``--web-ms`` (search round trip) plus
+``--page-ms`` (page fetches, skipped once cancelled). Each scenario is run
+with the tool's web branch sequential (not in SPECULATIVE_WEB_TOOLS) and
+speculative, and reports mean context latency, how often the web branch
+was cancelled, and how many page fetches were saved.
+
+    cd backend
+    python benchmarks/bench_context_orchestration.py --pdf-ms 150 --web-ms 300 --page-ms 600
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_orchestrator import ContextOrchestrator
+
+# (name, docs returned by the PDF branch, relevance of the best chunk)
+SCENARIOS = [
+    ('no PDFs', 0, None),
+    ('weak PDF match', 5, 0.3),
+    ('strong PDF match', 5, 0.8),
+]
+
+
+def run_scenario(args, n_docs, relevance, speculative):
+    page_fetches = []
+
+    def retrieve(user_email, query, filters=None):
+        time.sleep(args.pdf_ms / 1000.0)
+        return [object()] * n_docs, relevance
+
+    def fetch_web(query, cancel):
+        time.sleep(args.web_ms / 1000.0)
+        if cancel.is_set():
+            return ""
+        page_fetches.append(1)
+        time.sleep(args.page_ms / 1000.0)
+        return "web context"
+
+    orchestrator = ContextOrchestrator(
+        retrieve, fetch_web, lambda: True, deadline=args.deadline, threshold=args.threshold,
+        speculative_tools={'ai_chat'} if speculative else set()
+    )
+
+    async def trial():
+        t0 = time.perf_counter()
+        result = await orchestrator.gather('bench@example.com', 'query', 'ai_chat')
+        return time.perf_counter() - t0, result['branches']
+
+    latencies, cancelled = [], 0
+    for _ in range(args.trials):
+        seconds, branches = asyncio.run(trial())
+        latencies.append(seconds)
+        cancelled += branches.get('web', {}).get('status') == 'cancelled'
+    # Let abandoned web branches finish so their page fetches are counted.
+    time.sleep((args.web_ms + args.page_ms) / 1000.0 + 0.05)
+    return sum(latencies) / len(latencies), cancelled, len(page_fetches)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pdf-ms', type=float, default=150)
+    parser.add_argument('--web-ms', type=float, default=300)
+    parser.add_argument('--page-ms', type=float, default=600)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--deadline', type=float, default=8)
+    parser.add_argument('--trials', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"pdf={args.pdf_ms:.0f}ms web search={args.web_ms:.0f}ms pages={args.page_ms:.0f}ms "
+          f"threshold={args.threshold}")
+    print(f"{'scenario':18s} {'mode':11s} {'mean_ms':>8s} {'web_cancelled':>13s} {'page_fetches':>12s}")
+    for name, n_docs, relevance in SCENARIOS:
+        for speculative in (False, True):
+            mean, cancelled, fetches = run_scenario(args, n_docs, relevance, speculative)
+            mode = 'speculative' if speculative else 'sequential'
+            print(f"{name:18s} {mode:11s} {1000 * mean:8.1f} {cancelled:13d} {fetches:12d}")
+
+
+if __name__ == '__main__':
+    main()
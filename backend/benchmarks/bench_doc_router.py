@@ -0,0 +1,141 @@
+"""
+Dense search latency over a multi-document library: flat vs routed, and
+filters applied inside the search vs after it.
+
+Builds ``--docs`` synthetic documents of ``--chunks`` chunks each, whose
+vectors cluster around a few topics per document (as chapters of a book
+would). Topics come from a pool shared by the whole library, so books
+overlap the way several textbooks on one subject do. Queries are
+perturbed chunk vectors. Reports p50/p95 latency of
+
+* flat: every shard searched (router disabled);
+* routed: DocumentRouter picks the ``--top-n`` documents by centroid,
+  with recall@k measured against the flat results;
+* a one-document filter and a page-range filter, applied inside the
+  search (UserIndex.search_scope) vs the flat search over-fetching
+  ``--overfetch`` x k and dropping hits afterwards, with the mean number
+  of hits each returns (post-filtering often comes back short).
+
+    cd backend
+    python benchmarks/bench_doc_router.py --docs 20,100 --chunks 1000 --top-n 4
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from doc_router import DocumentFilter, DocumentRouter
+from index_registry import UserIndex
+from native_store import chunk_row, write_store
+
+DIM = 384  # all-MiniLM-L6-v2
+TOPICS_PER_DOC = 6
+CHUNKS_PER_PAGE = 3
+
+
+def make_library(vector_dir, rng, docs, chunks):
+    user_index = UserIndex('bench@example.com', vector_dir)
+    pool = rng.standard_normal((max(2 * TOPICS_PER_DOC, docs), DIM)).astype('float32')
+    for d in range(docs):
+        picked = rng.choice(len(pool), TOPICS_PER_DOC, replace=False)
+        centers = pool[picked] + 0.5 * rng.standard_normal((TOPICS_PER_DOC, DIM)).astype('float32')
+        topic = np.repeat(np.arange(TOPICS_PER_DOC), -(-chunks // TOPICS_PER_DOC))[:chunks]
+        vectors = centers[topic] + 0.6 * rng.standard_normal((chunks, DIM)).astype('float32')
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        vector_path = os.path.join(vector_dir, f'h{d}')
+        write_store(
+            vector_path,
+            [f"doc {d} chunk {i}" for i in range(chunks)],
+            [{'source': f'doc{d}.pdf', 'page': i // CHUNKS_PER_PAGE, 'hash': f'h{d}'} for i in range(chunks)],
+            vectors
+        )
+        user_index.add_document(f'h{d}', f'doc{d}.pdf', vector_path, persist=False)
+    return user_index
+
+
+def make_queries(user_index, rng, n):
+    shards = list(user_index.shards.values())
+    queries = []
+    for _ in range(n):
+        shard = shards[rng.integers(len(shards))]
+        vector = np.asarray(shard.store.vectors[rng.integers(shard.ntotal)])
+        vector = vector + 0.3 * rng.standard_normal(DIM).astype('float32') / np.sqrt(DIM)
+        queries.append(vector.astype('float32'))
+    return queries
+
+
+def timed(fn, queries):
+    fn(queries[0])  # warm-up: centroids, page columns
+    latencies, results = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append(fn(q))
+        latencies.append(time.perf_counter() - t0)
+    latencies.sort()
+    return results, 1000 * latencies[len(latencies) // 2], 1000 * latencies[int(0.95 * (len(latencies) - 1))]
+
+
+def post_filtered(user_index, vector, k, overfetch, allow):
+    return [key for key in user_index.dense_search(vector, k * overfetch) if allow(key)][:k]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', default='20,100')
+    parser.add_argument('--chunks', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=30, help="HYBRID_FETCH_K")
+    parser.add_argument('--top-n', type=int, default=4)
+    parser.add_argument('--overfetch', type=int, default=4)
+    parser.add_argument('--pages', default='11-30', help="page range for the page filter")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    page_filter = DocumentFilter.from_request({'pages': args.pages})
+    first_page, last_page = page_filter.page_indexes()
+    print(f"{'docs':>5s} {'vectors':>8s} {'search':26s} {'p50_ms':>8s} {'p95_ms':>8s} {'recall':>7s} {'hits':>6s}")
+    for docs in (int(x) for x in args.docs.split(',')):
+        with tempfile.TemporaryDirectory() as vector_dir:
+            user_index = make_library(vector_dir, rng, docs, args.chunks)
+            queries = make_queries(user_index, rng, args.queries)
+            k = args.k
+
+            def row(name, results, p50, p95, recall=None):
+                hits = sum(len(r) for r in results) / len(results)
+                recall = f"{recall:7.3f}" if recall is not None else f"{'-':>7s}"
+                print(f"{docs:5d} {user_index.ntotal:8d} {name:26s} {p50:8.2f} {p95:8.2f} {recall} {hits:6.1f}")
+
+            user_index.router = DocumentRouter(top_n=0)
+            flat, p50, p95 = timed(lambda q: user_index.dense_search(q, k), queries)
+            row('flat', flat, p50, p95)
+
+            user_index.router = DocumentRouter(top_n=args.top_n, min_chunks=0)
+            routed, p50, p95 = timed(lambda q: user_index.dense_search(q, k), queries)
+            recall = np.mean([len(set(a) & set(b)) / max(1, len(a)) for a, b in zip(flat, routed)])
+            row(f'routed top {args.top_n}', routed, p50, p95, recall)
+
+            user_index.router = DocumentRouter(top_n=0)
+            one_doc = DocumentFilter.from_request({'documents': ['doc0.pdf']})
+            scope = user_index.search_scope(one_doc)
+            results, p50, p95 = timed(lambda q: user_index.dense_search(q, k, scope), queries)
+            row('doc filter, in search', results, p50, p95)
+            results, p50, p95 = timed(
+                lambda q: post_filtered(user_index, q, k, args.overfetch, lambda key: chunk_row(key)[0] == 'h0'),
+                queries)
+            row('doc filter, post-filter', results, p50, p95)
+
+            scope = user_index.search_scope(page_filter)
+            results, p50, p95 = timed(lambda q: user_index.dense_search(q, k, scope), queries)
+            row(f'pages {args.pages}, in search', results, p50, p95)
+            in_pages = lambda key: first_page <= chunk_row(key)[1] // CHUNKS_PER_PAGE <= last_page
+            results, p50, p95 = timed(lambda q: post_filtered(user_index, q, k, args.overfetch, in_pages), queries)
+            row(f'pages {args.pages}, post-filter', results, p50, p95)
+
+
+if __name__ == '__main__':
+    main()
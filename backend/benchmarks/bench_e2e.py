@@ -0,0 +1,400 @@
+"""
+End-to-end benchmark and load test of the backend, fully offline.
+
+Starts the app in a subprocess (threaded werkzeug server in a scratch
+working directory) with deterministic stand-ins:
+
+* FAKE_LLM=1: the fake chat model, paced by ``--llm-latency`` and
+  ``--llm-tokens-per-second``;
+* FAKE_EMBEDDINGS=1: hashing embeddings (``--embed-text-ms`` adds a
+  simulated per-text inference cost);
+* GOOGLE_SEARCH_URL pointing at a local search + result-page server
+  started here (``--search-ms``, ``--page-ms``).
+
+It then drives the HTTP API:
+
+* ingest: after a one-page warm-up upload (which starts the parse
+  pool), one user uploads ``--pdfs`` synthetic PDFs of ``--pages`` pages;
+  reports wall time, pages/s and chunks/s. The other ``--users`` upload
+  the same files (stores are shared, so that is cheap);
+* chat load: for each level in ``--concurrency``, ``--rounds`` rounds of
+  ``--requests`` chats with seeded queries and a mix of tools (cache
+  bypassed), spread over the users; reports the median over rounds of
+  throughput and p50/p95/p99 latency, 429s and the mean time per stage
+  (from ``?profile=1``);
+* streaming: time to the first token of /api/chat/stream, p50/p95;
+* memory: the server's peak RSS (VmHWM) after ingest and at the end.
+
+``--save-baseline`` stores the results; every run is compared with
+``--baseline`` (benchmarks/baselines/e2e.json by default) and a metric that
+is worse by more than ``--tolerance`` (plus a small absolute slack for
+millisecond timings) is reported as a regression, with exit status 1.
+Baselines are machine-specific: refresh the stored one when the hardware
+or the benchmark parameters change.
+
+    cd backend
+    python benchmarks/bench_e2e.py
+    python benchmarks/bench_e2e.py --concurrency 1,8,32 --requests 200 --save-baseline
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baselines', 'e2e.json')
+
+TOPICS = {
+    'entropy': "Entropy measures the number of microstates consistent with a macrostate.",
+    'photosynthesis': "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    'recursion': "Recursion solves a problem by reducing it to smaller instances of itself.",
+    'inflation': "Inflation is the general rise in prices that erodes purchasing power.",
+    'mitochondria': "Mitochondria produce most of the cell's supply of adenosine triphosphate.",
+    'gradient descent': "Gradient descent moves parameters against the gradient of the loss.",
+    'plate tectonics': "Plate tectonics describes the motion of the lithosphere's plates.",
+    'supply and demand': "Supply and demand set the market price where quantities balance.",
+}
+QUERIES = [
+    'explain {topic}', 'what is {topic}?', 'summarize {topic} for an exam', 'give an example of {topic}',
+    'how does {topic} relate to everyday life', 'key facts about {topic}',
+]
+# (tool, weight): ai_chat takes the speculative web path, the others PDF-first.
+TOOLS = [('ai_chat', 3), ('concept_explainer', 3), ('summarizer', 2), ('notes_maker', 1), ('mcq_generator', 1)]
+
+# metric -> True when higher is better
+HIGHER_IS_BETTER = re.compile(r'(_per_s|_rps)$')
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100.0 * len(ordered) + 0.5)) - 1))]
+
+
+def make_pdf(path, pages, seed):
+    import fitz
+    rng = random.Random(seed)
+    doc = fitz.open()
+    topics = list(TOPICS)
+    for n in range(pages):
+        focus = rng.sample(topics, 2)
+        lines = [f"Chapter {n}: {focus[0]} and {focus[1]}."]
+        for _ in range(24):
+            topic = rng.choice(focus + topics[:1])
+            lines.append(f"{TOPICS[topic]} Notes on {topic}, item {rng.randint(1, 999)}.")
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), "\n".join(lines), fontsize=7)
+    doc.save(path)
+    doc.close()
+
+
+class SearchStandIn:
+    """Local stand-in for the Custom Search API and the result pages it links to."""
+
+    def __init__(self, search_ms: float, page_ms: float):
+        search_delay, page_delay = search_ms / 1000.0, page_ms / 1000.0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/customsearch/v1':
+                    time.sleep(search_delay)
+                    params = parse_qs(url.query)
+                    query, num = params.get('q', [''])[0], int(params.get('num', ['5'])[0])
+                    base = f"http://127.0.0.1:{self.server.server_port}"
+                    body = json.dumps({'items': [
+                        {'title': f"{query} ({i})", 'link': f"{base}/page/{i}?q={query}", 'snippet': f"About {query}."}
+                        for i in range(num)
+                    ]}).encode()
+                    content_type = 'application/json'
+                else:
+                    time.sleep(page_delay)
+                    query = parse_qs(url.query).get('q', [''])[0]
+                    paragraphs = "".join(f"<p>{query}: {text}</p>" for text in TOPICS.values())
+                    body = f"<html><head><title>{query}</title></head><body>{paragraphs}</body></html>".encode()
+                    content_type = 'text/html'
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/customsearch/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+class AppServer:
+    """The backend in its own process, so its memory is measured on its own."""
+
+    def __init__(self, workdir: str, env: dict, timeout: float = 120):
+        self.port = free_port()
+        self.base = f"http://127.0.0.1:{self.port}"
+        code = (f"import sys; sys.path.insert(0, {BACKEND_DIR!r}); import app; "
+                f"from werkzeug.serving import make_server; "
+                f"make_server('127.0.0.1', {self.port}, app.app, threaded=True).serve_forever()")
+        self.log = open(os.path.join(workdir, 'server.log'), 'w')
+        self.process = subprocess.Popen([sys.executable, '-c', code], cwd=workdir, env=env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"app exited with {self.process.returncode}, see {self.log.name}")
+            try:
+                if requests.get(f"{self.base}/ready", timeout=2).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("app did not become ready")
+
+    def memory_mb(self, field: str = 'VmHWM') -> float:
+        with open(f"/proc/{self.process.pid}/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024.0
+        return 0.0
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+def upload(base, user, paths, timeout=600):
+    files = [('files', (os.path.basename(p), open(p, 'rb'), 'application/pdf')) for p in paths]
+    try:
+        response = requests.post(f"{base}/api/upload", data={'user_email': user}, files=files, timeout=60)
+    finally:
+        for _, (_, handle, _) in files:
+            handle.close()
+    response.raise_for_status()
+    job_id = response.json()['job_id']
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = requests.get(f"{base}/api/upload/jobs/{job_id}", timeout=10).json()
+        if job['status'] in ('done', 'partial', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise RuntimeError(f"upload job {job_id} did not finish")
+
+
+def chat_requests(n, users, seed):
+    rng = random.Random(seed)
+    tools, weights = zip(*TOOLS)
+    return [{
+        'user_email': users[i % len(users)],
+        'query': rng.choice(QUERIES).format(topic=rng.choice(list(TOPICS))),
+        'tool': rng.choices(tools, weights)[0],
+        'model': 'Fake-LLM',
+        'no_cache': True,
+    } for i in range(n)]
+
+
+def run_chat_load(base, bodies, concurrency):
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def one(body):
+        t0 = time.perf_counter()
+        response = session.post(f"{base}/api/chat?profile=1", json=body, timeout=300)
+        seconds = time.perf_counter() - t0
+        payload = response.json() if response.headers.get('Content-Type', '').startswith('application/json') else {}
+        return response.status_code, seconds, (payload.get('profile') or {}).get('stages', {})
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, bodies))
+    wall = time.perf_counter() - t0
+    ok = [seconds for status, seconds, _ in results if status == 200]
+    stages = {}
+    for status, _, breakdown in results:
+        if status == 200:
+            for stage, seconds in breakdown.items():
+                stages.setdefault(stage, []).append(seconds)
+    return {
+        'rps': len(ok) / wall if wall else 0.0,
+        'p50_ms': 1000 * percentile(ok, 50) if ok else None,
+        'p95_ms': 1000 * percentile(ok, 95) if ok else None,
+        'p99_ms': 1000 * percentile(ok, 99) if ok else None,
+        'rejected': sum(status == 429 for status, _, _ in results),
+        'errors': sum(status not in (200, 429) for status, _, _ in results),
+        'stages_ms': {stage: round(1000 * sum(v) / len(v), 2) for stage, v in sorted(stages.items())},
+    }
+
+
+def first_token_ms(base, body):
+    t0 = time.perf_counter()
+    with requests.post(f"{base}/api/chat/stream", json=body, stream=True, timeout=300) as response:
+        for line in response.iter_lines():
+            if line.startswith(b'event: token'):
+                return 1000 * (time.perf_counter() - t0)
+    return None
+
+
+def compare(results, baseline, tolerance, slack_ms):
+    regressions = []
+    for name, value in sorted(results.items()):
+        old = baseline.get(name)
+        if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+            continue
+        if HIGHER_IS_BETTER.search(name):
+            worse = value < old * (1 - tolerance)
+        else:
+            slack = slack_ms if name.endswith('_ms') else 0.0
+            worse = value > old * (1 + tolerance) + slack
+        change = (value - old) / old
+        print(f"  {name:34s} {old:10.2f} -> {value:10.2f} ({change:+7.1%}){'  REGRESSION' if worse else ''}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pdfs', type=int, default=4)
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--users', type=int, default=16)
+    parser.add_argument('--concurrency', default='1,4,16')
+    parser.add_argument('--requests', type=int, default=64, help="chats per round")
+    parser.add_argument('--rounds', type=int, default=3, help="rounds per concurrency level (median reported)")
+    parser.add_argument('--stream-requests', type=int, default=10)
+    parser.add_argument('--llm-latency', type=float, default=0.05)
+    parser.add_argument('--llm-tokens-per-second', type=float, default=400)
+    parser.add_argument('--embed-text-ms', type=float, default=0.0)
+    parser.add_argument('--search-ms', type=float, default=40)
+    parser.add_argument('--page-ms', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=11)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help="relative slack before a regression")
+    parser.add_argument('--slack-ms', type=float, default=5.0, help="absolute slack for millisecond metrics")
+    args = parser.parse_args()
+
+    config = {k: v for k, v in vars(args).items() if k not in ('baseline', 'save_baseline', 'tolerance', 'slack_ms')}
+    search = SearchStandIn(args.search_ms, args.page_ms)
+    workdir = tempfile.mkdtemp(prefix='bench-e2e-')
+    env = dict(
+        os.environ,
+        FAKE_LLM='1', FAKE_LLM_LATENCY=str(args.llm_latency),
+        FAKE_LLM_TOKENS_PER_SECOND=str(args.llm_tokens_per_second),
+        FAKE_EMBEDDINGS='1', FAKE_EMBED_TEXT_MS=str(args.embed_text_ms),
+        GOOGLE_SEARCH_URL=search.url, GOOGLE_API_KEY='bench', GOOGLE_CSE_ID='bench',
+        STARTUP_MODE='eager', EMBEDDING_SERVER_SOCKET=os.path.join(workdir, 'no-embedding-server.sock'),
+    )
+    env.pop('GROQ_API_KEY', None)
+
+    pdfs = []
+    for i in range(args.pdfs):
+        path = os.path.join(workdir, f"bench-{i}.pdf")
+        make_pdf(path, args.pages, args.seed + i)
+        pdfs.append(path)
+    users = [f"bench{i}@example.com" for i in range(args.users)]
+
+    warmup = os.path.join(workdir, 'warmup.pdf')
+    make_pdf(warmup, 1, args.seed - 1)
+
+    results = {}
+    server = AppServer(workdir, env)
+    try:
+        upload(server.base, 'warmup@example.com', [warmup])
+        run_chat_load(server.base, chat_requests(4, ['warmup@example.com'], args.seed), 1)
+        t0 = time.perf_counter()
+        job = upload(server.base, users[0], pdfs)
+        ingest_wall = time.perf_counter() - t0
+        if job['status'] != 'done':
+            raise RuntimeError(f"ingest failed: {job}")
+        stats = job['stats']
+        results['ingest_wall_s'] = ingest_wall
+        results['ingest_pages_per_s'] = stats['parse']['pages'] / ingest_wall
+        results['ingest_chunks_per_s'] = stats['split']['chunks'] / ingest_wall
+        for user in users[1:]:
+            upload(server.base, user, pdfs)
+        results['peak_rss_after_ingest_mb'] = server.memory_mb()
+        print(f"ingest: {args.pdfs} PDFs x {args.pages} pages in {ingest_wall:.2f}s "
+              f"({results['ingest_pages_per_s']:.1f} pages/s, {results['ingest_chunks_per_s']:.1f} chunks/s), "
+              f"peak RSS {results['peak_rss_after_ingest_mb']:.1f} MB")
+
+        print(f"{'conc':>5s} {'rps':>7s} {'p50_ms':>8s} {'p95_ms':>8s} {'p99_ms':>8s} {'429':>5s} {'err':>4s}  "
+              f"mean stage ms")
+        for level in (int(c) for c in args.concurrency.split(',')):
+            rounds = [run_chat_load(server.base, chat_requests(args.requests, users, args.seed + 100 * level + r), level)
+                      for r in range(args.rounds)]
+            load = rounds[0]
+            for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+                load[key] = percentile([r[key] for r in rounds if r[key] is not None], 50)
+            load['rejected'] = sum(r['rejected'] for r in rounds)
+            load['errors'] = sum(r['errors'] for r in rounds)
+            for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms', 'rejected'):
+                results[f"chat_c{level}_{key}"] = load[key]
+            stages = " ".join(f"{k}={v}" for k, v in load['stages_ms'].items())
+            print(f"{level:5d} {load['rps']:7.1f} {load['p50_ms'] or 0:8.1f} {load['p95_ms'] or 0:8.1f} "
+                  f"{load['p99_ms'] or 0:8.1f} {load['rejected']:5d} {load['errors']:4d}  {stages}")
+            if load['errors']:
+                print(f"  ⚠️ {load['errors']} chats failed; see {server.log.name}")
+
+        ttft = [first_token_ms(server.base, body)
+                for body in chat_requests(args.stream_requests, users, args.seed - 1)]
+        ttft = [t for t in ttft if t is not None]
+        results['stream_first_token_p50_ms'] = percentile(ttft, 50)
+        results['stream_first_token_p95_ms'] = percentile(ttft, 95)
+        results['peak_rss_mb'] = server.memory_mb()
+        print(f"stream first token: p50 {results['stream_first_token_p50_ms']:.1f} ms, "
+              f"p95 {results['stream_first_token_p95_ms']:.1f} ms")
+        print(f"server peak RSS {results['peak_rss_mb']:.1f} MB")
+    finally:
+        server.close()
+        search.close()
+
+    results = {k: round(v, 3) if isinstance(v, float) else v for k, v in results.items()}
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        if stored.get('config') != config:
+            print(f"⚠️ baseline was recorded with different parameters: {stored.get('config')}")
+        print(f"vs baseline {args.baseline}:")
+        regressions = compare(results, stored['results'], args.tolerance, args.slack_ms)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"baseline saved to {args.baseline}")
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
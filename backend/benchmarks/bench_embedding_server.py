@@ -0,0 +1,131 @@
+"""
+Embedding throughput with N worker processes: one model per worker vs one
+shared embedding server.
+
+Each worker process embeds ``--texts`` chunks in requests of ``--batch``
+texts, the way an upload job does. In ``inprocess`` mode every worker owns
+a model (wrapped in its own EmbeddingService, as app.py does without a
+server); in ``server`` mode the workers send requests to one
+``embedding_server.py`` subprocess. Reports aggregate throughput and
+per-request latency percentiles for each worker count.
+
+The default model is CostModelEmbeddings (``FAKE_EMBEDDINGS=1`` with a
+simulated per-call and per-text cost, one forward pass at a time per
+machine); pass ``--model hf`` to use the real sentence-transformers model.
+
+    cd backend
+    python benchmarks/bench_embedding_server.py --workers 1,4,8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+HF_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100.0 * len(values)))] if values else 0.0
+
+
+def model_env(args):
+    if args.model == 'hf':
+        return {'FAKE_EMBEDDINGS': '0'}
+    return {'FAKE_EMBEDDINGS': '1', 'FAKE_EMBED_CALL_MS': str(args.call_ms), 'FAKE_EMBED_TEXT_MS': str(args.text_ms)}
+
+
+def worker(mode, socket_path, worker_id, texts, batch):
+    """Runs in a subprocess: embed this worker's texts, print per-request latencies."""
+    from embeddings import EmbeddingService
+    if mode == 'server':
+        from embedding_server import RemoteEmbeddings
+        model = RemoteEmbeddings(socket_path)
+    else:
+        from embedding_server import build_server_model
+        model = build_server_model(HF_MODEL)
+    service = EmbeddingService(model, HF_MODEL)
+    chunks = [f"worker {worker_id} chunk {i}: " + "lorem ipsum dolor sit amet " * 20 for i in range(texts)]
+    latencies = []
+    for start in range(0, len(chunks), batch):
+        t0 = time.perf_counter()
+        service.embed_documents(chunks[start:start + batch])
+        latencies.append(time.perf_counter() - t0)
+    print(json.dumps({'latencies': latencies}))
+
+
+def start_server(socket_path, env):
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, 'embedding_server.py'), '--socket', socket_path, '--model', HF_MODEL],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL
+    )
+    from embedding_server import server_available
+    deadline = time.time() + 120
+    while not server_available(socket_path):
+        if proc.poll() is not None or time.time() > deadline:
+            proc.kill()
+            raise RuntimeError("embedding server did not start")
+        time.sleep(0.05)
+    return proc
+
+
+def run(mode, workers, args, env, socket_path):
+    t0 = time.perf_counter()
+    procs = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--worker', mode, socket_path, str(i),
+             '--texts', str(args.texts), '--batch', str(args.batch)],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.PIPE, text=True
+        )
+        for i in range(workers)
+    ]
+    latencies = []
+    for proc in procs:
+        out, _ = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(f"{mode} worker failed")
+        latencies.extend(json.loads(out.strip().splitlines()[-1])['latencies'])
+    elapsed = time.perf_counter() - t0
+    return workers * args.texts / elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', default='1,4')
+    parser.add_argument('--texts', type=int, default=200, help="texts embedded by each worker")
+    parser.add_argument('--batch', type=int, default=8, help="texts per request")
+    parser.add_argument('--model', choices=['fake', 'hf'], default='fake')
+    parser.add_argument('--call-ms', type=float, default=20.0)
+    parser.add_argument('--text-ms', type=float, default=1.0)
+    parser.add_argument('--worker', nargs=3, metavar=('MODE', 'SOCKET', 'ID'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker[0], args.worker[1], int(args.worker[2]), args.texts, args.batch)
+        return
+
+    env = dict(os.environ, **model_env(args))
+    print(f"model={args.model} texts/worker={args.texts} batch={args.batch}")
+    print(f"{'workers':>7s} {'mode':9s} {'texts/s':>9s} {'p50_ms':>8s} {'p95_ms':>8s}")
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, 'embed.sock')
+        server = start_server(socket_path, env)
+        try:
+            for workers in (int(x) for x in args.workers.split(',')):
+                for mode in ('inprocess', 'server'):
+                    throughput, latencies = run(mode, workers, args, env, socket_path)
+                    print(f"{workers:7d} {mode:9s} {throughput:9.1f} {1000 * percentile(latencies, 50):8.1f} "
+                          f"{1000 * percentile(latencies, 95):8.1f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
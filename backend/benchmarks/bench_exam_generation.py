@@ -0,0 +1,113 @@
+"""
+Exam-paper generation: one model call for all papers vs one call per paper.
+
+The single-call baseline sends the original prompt asking for every paper
+at once; the parallel mode sends one prompt per paper (each over its own
+slice of the context) with at most ``--fan-out`` calls in flight, and
+reassembles the papers in order. Reports wall-clock time and how many
+papers came back complete.
+
+By default the model is a stand-in that answers at ``--tokens-per-second``
+after ``--latency`` and, like the real ChatGroq setup, stops at
+``--max-tokens`` output tokens, so long single-call answers are truncated.
+``--groq`` uses the real model (needs GROQ_API_KEY).
+
+    cd backend
+    python benchmarks/bench_exam_generation.py --papers 5 --paper-tokens 700
+"""
+import os
+import re
+import sys
+import time
+import asyncio
+import argparse
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from fakes import FakeMessage
+from exam_papers import generate_papers, slice_text
+from exam_spec import generate_exam_paper_prompt, parse_exam_paper_params
+
+_PAPERS_RE = re.compile(r'Generate exactly (\d+) examination papers')
+
+
+class PaperModel:
+    """Writes the requested number of papers, paced per token and cut off at ``max_tokens``."""
+
+    def __init__(self, paper_tokens, tokens_per_second, latency, max_tokens):
+        self.paper_tokens = paper_tokens
+        self.tokens_per_second = tokens_per_second
+        self.latency = latency
+        self.max_tokens = max_tokens
+
+    def _answer(self, prompt):
+        count = int(_PAPERS_RE.search(prompt).group(1))
+        words = []
+        for n in range(1, count + 1):
+            words += ["---", "**EXAMINATION", "PAPER", f"{n}**"] + ["word"] * (self.paper_tokens - 5) + ["END"]
+        words = words[:self.max_tokens]
+        return " ".join(words), self.latency + len(words) / self.tokens_per_second
+
+    def invoke(self, prompt):
+        text, seconds = self._answer(prompt)
+        time.sleep(seconds)
+        return FakeMessage(text)
+
+    async def ainvoke(self, prompt):
+        text, seconds = self._answer(prompt)
+        await asyncio.sleep(seconds)
+        return FakeMessage(text)
+
+
+def complete_papers(text):
+    return text.count(" END")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--papers', type=int, default=5)
+    parser.add_argument('--fan-out', type=int, default=4)
+    parser.add_argument('--paper-tokens', type=int, default=700, help="output tokens one paper takes")
+    parser.add_argument('--tokens-per-second', type=float, default=250)
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--max-tokens', type=int, default=2048)
+    parser.add_argument('--groq', action='store_true')
+    args = parser.parse_args()
+
+    if args.groq:
+        from langchain_groq import ChatGroq
+        model = ChatGroq(model_name="openai/gpt-oss-120b", temperature=0.3, max_tokens=args.max_tokens)
+    else:
+        model = PaperModel(args.paper_tokens, args.tokens_per_second, args.latency, args.max_tokens)
+
+    query = f"Generate {args.papers} papers with 5 questions of 10 marks each"
+    context = "\n\n".join(f"Section {i}: material about topic {i}. " * 5 for i in range(40))
+    params = parse_exam_paper_params(query)
+
+    t0 = time.perf_counter()
+    single = asyncio.run(model.ainvoke(generate_exam_paper_prompt(query, context, params)))
+    single_seconds = time.perf_counter() - t0
+    single_text = getattr(single, 'content', str(single))
+
+    prompts = [
+        generate_exam_paper_prompt(query, ctx, dict(params, paper_count=1), paper_number=i + 1)
+        for i, ctx in enumerate(slice_text(context, params['paper_count']))
+    ]
+    t0 = time.perf_counter()
+    parallel_text, info = asyncio.run(generate_papers(model, prompts, args.fan_out))
+    parallel_seconds = time.perf_counter() - t0
+
+    print(f"papers={args.papers} paper_tokens={args.paper_tokens} max_tokens={args.max_tokens} "
+          f"fan_out={args.fan_out}")
+    print(f"{'mode':9s} {'wall_s':>7s} {'complete':>9s}")
+    if args.groq:
+        print(f"{'single':9s} {single_seconds:7.2f} {'-':>9s}")
+        print(f"{'parallel':9s} {parallel_seconds:7.2f} {'-':>9s}   per paper {info['paper_seconds']}")
+        return
+    print(f"{'single':9s} {single_seconds:7.2f} {complete_papers(single_text):5d}/{args.papers}")
+    print(f"{'parallel':9s} {parallel_seconds:7.2f} {complete_papers(parallel_text):5d}/{args.papers}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Exam spec parser speed: the previous ``re.search`` parser, the single-pass
+parser uncached and cached, and prompt building (direct render vs memoized
+template). Equivalence with the previous parser is checked by
+tests/test_exam_spec.py, which also holds the reference parser timed here.
+
+    cd backend
+    python benchmarks/bench_exam_spec.py
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exam_spec import _render_exam_prompt, generate_exam_paper_prompt, parse_exam_spec
+from tests.test_exam_spec import EXAMPLES, reference_parse
+
+
+def per_call_us(fn, queries, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            fn(query)
+    return 1e6 * (time.perf_counter() - t0) / (repeat * len(queries))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    queries = EXAMPLES
+    context = "material " * 3000
+    uncached = parse_exam_spec.__wrapped__
+    parse_exam_spec.cache_clear()
+    print(f"{'step':34s} {'us/call':>9s}")
+    rows = [
+        ('parse: reference (re.search x ~10)', lambda q: reference_parse(q)),
+        ('parse: single pass, uncached', lambda q: uncached(q)),
+        ('parse: cached spec', lambda q: parse_exam_spec(q)),
+        ('prompt: parse + direct render', lambda q: _render_exam_prompt(q, context, reference_parse(q))),
+        ('prompt: cached spec + template', lambda q: generate_exam_paper_prompt(q, context, parse_exam_spec(q))),
+    ]
+    for name, fn in rows:
+        print(f"{name:34s} {per_call_us(fn, queries, args.repeat):9.1f}")
+
+
+if __name__ == '__main__':
+    main()
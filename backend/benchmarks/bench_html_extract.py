@@ -0,0 +1,79 @@
+"""
+Compare HTML-to-text extractors on a corpus of saved pages.
+
+    cd backend
+    python benchmarks/bench_html_extract.py --corpus path/to/saved_pages
+    python benchmarks/bench_html_extract.py            # synthetic pages
+
+Every ``*.html``/``*.htm`` file in the corpus is run through each available
+extractor (``bs4`` is the original path) with the same 3000-char budget
+used for web context. Reports total time, per-page mean and speedup over bs4.
+"""
+import os
+import sys
+import glob
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_extract import EXTRACTORS
+from web_context import PAGE_CHAR_LIMIT
+
+
+def synthetic_pages(count=50, paragraphs=400, seed=7):
+    rng = random.Random(seed)
+    words = "matrix vector theorem proof lemma integral series limit graph tree node edge".split()
+    pages = []
+    for _ in range(count):
+        body = "".join(
+            f"<p>{' '.join(rng.choice(words) for _ in range(40))}</p>" for _ in range(paragraphs)
+        )
+        nav = "".join(f"<li><a href='/{i}'>Link {i}</a></li>" for i in range(200))
+        pages.append(
+            f"<html><head><script>{'var x=1;' * 2000}</script><style>{'p{}' * 2000}</style></head>"
+            f"<body><nav><ul>{nav}</ul></nav><article>{body}</article><footer>footer</footer></body></html>"
+        )
+    return pages
+
+
+def load_corpus(path):
+    pages = []
+    for pattern in ('*.html', '*.htm'):
+        for filename in glob.glob(os.path.join(path, '**', pattern), recursive=True):
+            with open(filename, 'r', encoding='utf-8', errors='replace') as f:
+                pages.append(f.read())
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', help='directory of saved HTML pages')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus) if args.corpus else synthetic_pages()
+    if not pages:
+        sys.exit("No pages found")
+    print(f"{len(pages)} pages, {sum(len(p) for p in pages) / 1e6:.1f} MB total, budget {PAGE_CHAR_LIMIT} chars")
+
+    results = {}
+    for name, extract in EXTRACTORS.items():
+        best = None
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            for html in pages:
+                extract(html, PAGE_CHAR_LIMIT)
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = best
+
+    baseline = results.get('bs4')
+    for name, elapsed in sorted(results.items(), key=lambda kv: kv[1]):
+        speedup = f"{baseline / elapsed:6.1f}x" if baseline else "   n/a"
+        print(f"{name:12s} total={elapsed:8.3f}s  per_page={1000 * elapsed / len(pages):8.2f}ms  vs bs4={speedup}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Append cost of the per-user index as a library grows.
+
+Appends DOCS synthetic documents of CHUNKS chunks each to one UserIndex and
+prints the time of every append. With per-document shards the per-append
+time should stay roughly flat instead of growing with the library size.
+
+    cd backend
+    python benchmarks/bench_index_append.py --docs 200 --chunks 300
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from index_registry import UserIndex
+from native_store import write_store
+
+DIM = 384  # all-MiniLM-L6-v2
+
+
+class RandomEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return np.random.rand(len(texts), DIM).astype('float32').tolist()
+
+    def embed_query(self, text):
+        return np.random.rand(DIM).astype('float32').tolist()
+
+
+def make_doc_store(embeddings, vector_path, doc_no, chunks):
+    texts = [f"doc {doc_no} chunk {i} " + "lorem ipsum " * 80 for i in range(chunks)]
+    write_store(
+        vector_path,
+        texts,
+        [{'source': f'doc{doc_no}.pdf', 'page': i // 4, 'hash': f'h{doc_no}'} for i in range(chunks)],
+        embeddings.embed_documents(texts)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=100)
+    parser.add_argument('--chunks', type=int, default=300)
+    parser.add_argument('--every', type=int, default=10, help='print every Nth append')
+    args = parser.parse_args()
+
+    embeddings = RandomEmbeddings()
+    with tempfile.TemporaryDirectory() as vector_dir:
+        user_index = UserIndex('bench@example.com', vector_dir, embedding=embeddings)
+        timings = []
+        for n in range(args.docs):
+            vector_path = os.path.join(vector_dir, f'h{n}')
+            make_doc_store(embeddings, vector_path, n, args.chunks)
+            t0 = time.perf_counter()
+            user_index.add_document(f'h{n}', f'doc{n}.pdf', vector_path)
+            timings.append(time.perf_counter() - t0)
+            if (n + 1) % args.every == 0:
+                window = timings[-args.every:]
+                print(f"docs={n + 1:5d} vectors={user_index.ntotal:8d} "
+                      f"append_ms(mean of last {args.every})={1000 * sum(window) / len(window):8.2f}")
+
+        t0 = time.perf_counter()
+        user_index.remove_document(f'h{args.docs // 2}')
+        print(f"remove one document: {1000 * (time.perf_counter() - t0):.2f} ms")
+
+        first, last = timings[:args.every], timings[-args.every:]
+        print(f"first {args.every} appends: {1000 * sum(first) / len(first):.2f} ms avg, "
+              f"last {args.every}: {1000 * sum(last) / len(last):.2f} ms avg")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Recall, latency, file size and RSS of each vector index format vs flat.
+
+Builds every format in VECTOR_INDEX_FORMAT's list over the same synthetic
+clustered vectors, measures recall@k against exact flat search and
+per-query latency, then loads each index file in a fresh subprocess (with
+and without memory-mapping) and reports the private (anonymous) RSS growth
+from loading and searching it. Mapped pages are file-backed and shared
+between workers, so they do not show up there.
+
+    cd backend
+    python benchmarks/bench_index_formats.py --vectors 100000 --queries 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import faiss
+
+from vector_index import INDEX_FORMATS, build_faiss_index, read_faiss_index, tune_for_search
+
+DIM = 384  # all-MiniLM-L6-v2
+
+
+def private_rss_bytes() -> int:
+    """Anonymous resident memory; mapped file pages (shared between workers) are excluded."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def make_vectors(rng, n, basis, centers):
+    # Sentence embeddings sit near a low-dimensional manifold: topic centre
+    # plus variation along a few latent directions, then normalized.
+    labels = rng.integers(0, len(centers), n)
+    latent = rng.standard_normal((n, basis.shape[0])).astype('float32')
+    vectors = centers[labels] + 0.5 * latent @ basis + 0.05 * rng.standard_normal((n, DIM)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def measure_rss(path, mmap, queries_path):
+    """Runs in a subprocess: private RSS growth from loading and searching one index file."""
+    queries = np.load(queries_path)
+    before = private_rss_bytes()
+    index = tune_for_search(read_faiss_index(path, mmap=mmap))
+    index.search(queries, 10)
+    print(json.dumps({'private_rss': private_rss_bytes() - before}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vectors', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--formats', default=','.join(INDEX_FORMATS))
+    parser.add_argument('--rss', nargs=3, metavar=('PATH', 'MMAP', 'QUERIES'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.rss:
+        measure_rss(args.rss[0], args.rss[1] == '1', args.rss[2])
+        return
+
+    rng = np.random.default_rng(7)
+    basis = rng.standard_normal((32, DIM)).astype('float32') / np.sqrt(32)
+    centers = rng.standard_normal((200, DIM)).astype('float32') / np.sqrt(DIM)
+    vectors = make_vectors(rng, args.vectors, basis, centers)
+    queries = make_vectors(rng, args.queries, basis, centers)
+    exact = faiss.IndexFlatL2(DIM)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"{args.vectors} vectors x {DIM} dims, {args.queries} queries, recall@{args.k} vs exact flat")
+    print(f"{'format':8s} {'build_s':>8s} {'file_MB':>8s} {'recall':>7s} {'p50_ms':>7s} {'p95_ms':>7s} "
+          f"{'priv_MB':>7s} {'priv_mmap_MB':>12s}")
+    with tempfile.TemporaryDirectory() as tmp:
+        queries_path = os.path.join(tmp, 'queries.npy')
+        np.save(queries_path, queries)
+        for fmt in args.formats.split(','):
+            t0 = time.perf_counter()
+            index = build_faiss_index(vectors, fmt)
+            build_seconds = time.perf_counter() - t0
+            path = os.path.join(tmp, f'{fmt}.faiss')
+            faiss.write_index(index, path)
+            index = tune_for_search(index)
+
+            latencies, hits = [], 0
+            for q in range(args.queries):
+                t0 = time.perf_counter()
+                _, found = index.search(queries[q:q + 1], args.k)
+                latencies.append(time.perf_counter() - t0)
+                hits += len(set(found[0]) & set(truth[q]))
+            latencies.sort()
+
+            rss = {}
+            for mmap in ('0', '1'):
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--rss', path, mmap, queries_path],
+                    capture_output=True, text=True, check=True
+                )
+                rss[mmap] = json.loads(out.stdout.strip().splitlines()[-1])['private_rss']
+
+            print(f"{fmt:8s} {build_seconds:8.2f} {os.path.getsize(path) / 2**20:8.1f} "
+                  f"{hits / (args.queries * args.k):7.3f} "
+                  f"{1000 * latencies[len(latencies) // 2]:7.2f} {1000 * latencies[int(len(latencies) * 0.95)]:7.2f} "
+                  f"{rss['0'] / 2**20:7.1f} {rss['1'] / 2**20:12.1f}")
+
+
+if __name__ == '__main__':
+    main()
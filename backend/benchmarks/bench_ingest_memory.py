@@ -0,0 +1,125 @@
+"""
+Ingestion peak memory: whole-document load vs page-by-page streaming.
+
+Writes a synthetic PDF of each size in ``--pages``, then ingests it in a
+fresh subprocess per mode and reports wall time and peak RSS growth
+(VmHWM). ``load`` is the previous path: ``PyMuPDFLoader.load()``, one
+``split_documents`` over every page, all vectors collected, one
+``write_store``. ``stream`` is ingest.parse_pdf + embed_in_batches.
+Embeddings are HashingEmbeddings, so no model is downloaded. The two
+stores are compared and must hold the same chunks, metadata and vectors.
+The page and byte guards are disabled for the run.
+
+    cd backend
+    python benchmarks/bench_ingest_memory.py --pages 100,1000,2000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import filecmp
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PARAGRAPH = ("Streaming ingestion keeps one page in memory at a time while chunks flow into batched "
+             "embedding and the store is written incrementally on disk. ")
+
+
+def peak_rss_bytes() -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def make_pdf(path, pages, chars):
+    import fitz
+    doc = fitz.open()
+    text = (PARAGRAPH * (chars // len(PARAGRAPH) + 1))[:chars]
+    for n in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), f"Page {n}. {text}", fontsize=7)
+    doc.save(path)
+    doc.close()
+
+
+def ingest(mode, pdf_path, vector_path, batch_size):
+    """Runs in a subprocess: ingest one PDF and report wall time and peak RSS growth."""
+    from fakes import HashingEmbeddings
+    from ingest import CHUNK_OVERLAP, CHUNK_SIZE, StageStats, embed_in_batches, parse_pdf
+    from native_store import write_manifest, write_store
+    from langchain_community.document_loaders import PyMuPDFLoader
+    from langchain_text_splitters import CharacterTextSplitter
+
+    import fitz  # noqa: F401  (imported up front so neither mode is charged for it)
+
+    embeddings = HashingEmbeddings()
+    before = peak_rss_bytes()
+    t0 = time.perf_counter()
+    if mode == 'load':
+        documents = PyMuPDFLoader(pdf_path).load()
+        for doc in documents:
+            doc.metadata.update({"source": "bench.pdf", "hash": "bench", "uploaded_at": "-"})
+        docs = CharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP).split_documents(documents)
+        texts = [d.page_content for d in docs]
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            vectors.extend(embeddings.embed_documents(texts[start:start + batch_size]))
+        write_store(vector_path, texts, [d.metadata for d in docs], vectors)
+    else:
+        parsed = parse_pdf(pdf_path, "bench.pdf", "bench", vector_path)
+        dim = embed_in_batches(vector_path, embeddings, StageStats(), batch_size)
+        side = parsed['store']
+        write_manifest(vector_path, side['count'], dim, dict(side['shared'], uploaded_at="-"), side['columns'])
+    print(json.dumps({'seconds': time.perf_counter() - t0, 'peak_rss': peak_rss_bytes() - before}))
+
+
+def same_store(a, b):
+    for name in sorted(os.listdir(a)):
+        if name == 'store.json':
+            with open(os.path.join(a, name)) as fa, open(os.path.join(b, name)) as fb:
+                if json.load(fa) != json.load(fb):
+                    return False
+        elif not filecmp.cmp(os.path.join(a, name), os.path.join(b, name), shallow=False):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', default='100,1000')
+    parser.add_argument('--chars', type=int, default=3000, help="text per page")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--ingest', nargs=3, metavar=('MODE', 'PDF', 'STORE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.ingest:
+        ingest(*args.ingest, args.batch_size)
+        return
+
+    print(f"{'pages':>6s} {'mode':6s} {'wall_s':>7s} {'peak_MB':>8s}")
+    for pages in (int(x) for x in args.pages.split(',')):
+        with tempfile.TemporaryDirectory() as tmp:
+            pdf_path = os.path.join(tmp, 'bench.pdf')
+            make_pdf(pdf_path, pages, args.chars)
+            stores = {}
+            for mode in ('load', 'stream'):
+                stores[mode] = os.path.join(tmp, mode)
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--batch-size', str(args.batch_size),
+                     '--ingest', mode, pdf_path, stores[mode]],
+                    capture_output=True, text=True, check=True,
+                    env=dict(os.environ, INGEST_MAX_PAGES='0', INGEST_MAX_BYTES='0')
+                )
+                result = json.loads(out.stdout.strip().splitlines()[-1])
+                print(f"{pages:6d} {mode:6s} {result['seconds']:7.2f} {result['peak_rss'] / 2**20:8.1f}")
+            if not same_store(stores['load'], stores['stream']):
+                raise AssertionError(f"stores differ for {pages} pages")
+
+
+if __name__ == '__main__':
+    main()
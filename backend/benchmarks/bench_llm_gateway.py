@@ -0,0 +1,126 @@
+"""
+LLM gateway behaviour against flaky fake providers (no network, no key).
+
+Runs ``--calls`` chat calls, ``--concurrency`` at a time, through
+LLMGateway over FakeChatModel clients in each scenario and reports
+success rate, p50/p95/p99 latency and provider calls per chat:
+
+* slow tail: ``--slow-rate`` of calls take ``--slow-ms``; direct calls vs
+  hedging at ``--hedge-percentile`` (also for streams, on the first token);
+* flaky: ``--fail-rate`` of calls fail with a 503; no retries vs retries;
+* outage: the selected model always fails; no failover vs failover to a
+  healthy model, and how many calls still reached the broken one once its
+  circuit opened.
+
+    cd backend
+    python benchmarks/bench_llm_gateway.py --calls 400 --concurrency 16
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import FakeChatModel
+from llm_gateway import CircuitBreaker, LLMGateway, ModelEndpoint
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))] if ordered else float('nan')
+
+
+def endpoint(name, pool, seed, **fake):
+    return ModelEndpoint(name, [FakeChatModel(reply="ok", tokens_per_second=0, seed=seed + i, **fake)
+                                for i in range(pool)], CircuitBreaker(failures=5, cooldown=30))
+
+
+async def drive(gateway, name, calls, concurrency, stream=False):
+    slots = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one():
+        nonlocal failures
+        async with slots:
+            model = gateway.model(name)
+            t0 = time.perf_counter()
+            try:
+                if stream:
+                    async for _ in model.astream("prompt"):
+                        break
+                else:
+                    await model.ainvoke("prompt")
+                latencies.append(time.perf_counter() - t0)
+            except Exception:
+                failures += 1
+
+    await asyncio.gather(*(one() for _ in range(calls)))
+    return latencies, failures
+
+
+def report(label, gateway, latencies, failures, calls):
+    provider_calls = sum(e.stats()['calls'] for e in gateway.endpoints.values())
+    ms = [1000 * x for x in latencies]
+    print(f"{label:34s} {100.0 * (calls - failures) / calls:7.1f}% {percentile(ms, 50):8.1f} "
+          f"{percentile(ms, 95):8.1f} {percentile(ms, 99):8.1f} {provider_calls / calls:10.2f}")
+
+
+def run(label, gateway, name, args, stream=False):
+    # Warm-up fills the latency window hedging needs; it is not measured.
+    asyncio.run(drive(gateway, name, 50, args.concurrency, stream))
+    for e in gateway.endpoints.values():
+        e._counters['calls'] = 0
+    latencies, failures = asyncio.run(drive(gateway, name, args.calls, args.concurrency, stream))
+    report(label, gateway, latencies, failures, args.calls)
+    return gateway
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--pool', type=int, default=2)
+    parser.add_argument('--latency-ms', type=float, default=40)
+    parser.add_argument('--slow-rate', type=float, default=0.05)
+    parser.add_argument('--slow-ms', type=float, default=800)
+    parser.add_argument('--hedge-percentile', type=float, default=90)
+    parser.add_argument('--fail-rate', type=float, default=0.2)
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000.0
+    slow = dict(latency=latency, slow_rate=args.slow_rate, slow_latency=args.slow_ms / 1000.0)
+    quick = dict(retries=2, backoff_base=0.02, backoff_max=0.2)
+    print(f"{'scenario':34s} {'success':>8s} {'p50_ms':>8s} {'p95_ms':>8s} {'p99_ms':>8s} {'calls/chat':>10s}")
+
+    run('slow tail, direct', LLMGateway({'m': endpoint('m', args.pool, 1, **slow)}, **quick), 'm', args)
+    run(f'slow tail, hedged at p{args.hedge_percentile:g}',
+        LLMGateway({'m': endpoint('m', args.pool, 1, **slow)}, hedge_percentile=args.hedge_percentile, **quick),
+        'm', args)
+    run('slow tail, stream direct', LLMGateway({'m': endpoint('m', args.pool, 1, **slow)}, **quick), 'm', args,
+        stream=True)
+    run(f'slow tail, stream hedged at p{args.hedge_percentile:g}',
+        LLMGateway({'m': endpoint('m', args.pool, 1, **slow)}, hedge_percentile=args.hedge_percentile, **quick),
+        'm', args, stream=True)
+
+    flaky = dict(latency=latency, fail_rate=args.fail_rate)
+    run(f'{args.fail_rate:.0%} failures, no retries',
+        LLMGateway({'m': endpoint('m', args.pool, 2, **flaky)}, retries=0), 'm', args)
+    run(f'{args.fail_rate:.0%} failures, 2 retries', LLMGateway({'m': endpoint('m', args.pool, 2, **flaky)}, **quick),
+        'm', args)
+
+    down = dict(latency=latency, fail_rate=1.0)
+    run('outage, no failover', LLMGateway({'m': endpoint('m', args.pool, 3, **down)}, failover=['m'], **quick),
+        'm', args)
+    gateway = run('outage, failover to backup', LLMGateway(
+        {'m': endpoint('m', args.pool, 3, **down), 'backup': endpoint('backup', args.pool, 4, latency=latency)},
+        **quick
+    ), 'm', args)
+    broken = gateway.endpoints['m'].stats()
+    print(f"  broken model: circuit {broken['state']}, {broken['calls']} calls reached it in the measured run; "
+          f"available models: {gateway.available()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Recall@k and latency of dense-only vs hybrid (dense + BM25, RRF) retrieval.
+
+Builds a fixture corpus of DOCS synthetic "textbooks" whose chunks carry
+section numbers and named formulas, then asks exact-term queries
+("section 7.3.2", "the Kowalski-Ng identity") whose answer is a single
+known chunk. Uses the offline hashing embedder, so no model download.
+
+    cd backend
+    python benchmarks/bench_retrieval.py --docs 20 --chunks 200 --k 10
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import HashingEmbeddings
+from index_registry import UserIndex
+from native_store import write_store
+from retrieval import dense_search_ids
+
+TOPIC_WORDS = ("matrix vector eigenvalue integral derivative limit series theorem proof "
+               "graph probability variance entropy gradient tensor field").split()
+NAMES = "Kowalski Ng Abara Lindqvist Moreau Okafor Petrov Tanaka Varga Zhou".split()
+
+
+def make_corpus(rng, docs, chunks):
+    corpus = []
+    for d in range(docs):
+        texts, metas = [], []
+        for c in range(chunks):
+            section = f"{d + 1}.{c // 20 + 1}.{c % 20 + 1}"
+            formula = f"{rng.choice(NAMES)}-{rng.choice(NAMES)} identity {d}{c}"
+            body = " ".join(rng.choice(TOPIC_WORDS) for _ in range(120))
+            texts.append(f"Section {section}. {body} The {formula} states {body[:80]}")
+            metas.append({'source': f'book{d}.pdf', 'page': c // 3, 'hash': f'h{d}',
+                          'section': section, 'formula': formula})
+        corpus.append((texts, metas))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=10)
+    parser.add_argument('--chunks', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    embeddings = HashingEmbeddings()
+    corpus = make_corpus(rng, args.docs, args.chunks)
+
+    with tempfile.TemporaryDirectory() as vector_dir:
+        user_index = UserIndex('bench@example.com', vector_dir, embedding=embeddings)
+        for d, (texts, metas) in enumerate(corpus):
+            path = os.path.join(vector_dir, f'h{d}')
+            write_store(path, texts, metas, embeddings.embed_documents(texts))
+            user_index.add_document(f'h{d}', f'book{d}.pdf', path)
+        user_index.retriever.k = args.k
+
+        queries = []
+        for _ in range(args.queries):
+            d, c = rng.randrange(args.docs), rng.randrange(args.chunks)
+            meta = corpus[d][1][c]
+            query = f"section {meta['section']}" if rng.random() < 0.5 else f"what is the {meta['formula']}"
+            queries.append((query, meta))
+
+        for name, search in (
+            ('dense', lambda q: [user_index.get_document(i) for i in dense_search_ids(user_index, q, args.k)]),
+            ('hybrid', user_index.retriever.invoke),
+        ):
+            hits, latencies = 0, []
+            for query, meta in queries:
+                t0 = time.perf_counter()
+                docs = search(query)
+                latencies.append(time.perf_counter() - t0)
+                hits += any(doc.metadata.get('section') == meta['section'] and doc.metadata.get('hash') == meta['hash']
+                            for doc in docs)
+            latencies.sort()
+            print(f"{name:7s} recall@{args.k}={hits / len(queries):.3f}  "
+                  f"p50={1000 * latencies[len(latencies) // 2]:.2f}ms  "
+                  f"p95={1000 * latencies[int(len(latencies) * 0.95)]:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Cold-start cost of the backend, broken down by component.
+
+Every measurement runs in a fresh interpreter so module caches do not hide
+import cost:
+
+* import time of each heavy dependency on its own,
+* construction time of each model (embedding model incl. its probe query,
+  ChatGroq with a placeholder key; no request is sent),
+* for each STARTUP_MODE, the time until ``app`` is importable and
+  ``/health`` answers (what a worker spawn or deploy waits for) and until
+  ``/ready`` returns 200.
+
+    cd backend
+    python benchmarks/bench_startup.py
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORTS = [
+    ('flask', 'import flask'),
+    ('faiss', 'import faiss'),
+    ('langchain_core', 'import langchain_core.documents'),
+    ('pdf loaders', 'import langchain_community.document_loaders, langchain_text_splitters'),
+    ('langchain_groq', 'import langchain_groq'),
+    ('langchain_huggingface', 'import langchain_huggingface'),
+    ('sentence_transformers', 'import sentence_transformers'),
+]
+
+INITS = [
+    ('embedding model', 'from langchain_huggingface import HuggingFaceEmbeddings',
+     'HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2").embed_query("connectivity probe")'),
+    ('ChatGroq', 'from langchain_groq import ChatGroq',
+     'ChatGroq(model_name="openai/gpt-oss-120b", api_key="placeholder", temperature=0.3, max_tokens=2048)'),
+]
+
+APP_PROBE = """
+import time, json
+t0 = time.perf_counter()
+import app
+client = app.app.test_client()
+assert client.get('/health').status_code == 200
+health = time.perf_counter() - t0
+while client.get('/ready').status_code != 200:
+    time.sleep(0.01)
+ready = time.perf_counter() - t0
+print(json.dumps({'health_s': health, 'ready_s': ready,
+                  'components': {c.name: c.status() for c in app.COMPONENTS}}))
+"""
+
+
+def run(code, env=None):
+    out = subprocess.run(
+        [sys.executable, '-c', code], cwd=BACKEND_DIR, capture_output=True, text=True,
+        env=dict(os.environ, **(env or {}))
+    )
+    if out.returncode != 0:
+        return None, (out.stderr.strip().splitlines() or ['failed'])[-1]
+    return json.loads(out.stdout.strip().splitlines()[-1]), None
+
+
+def timed(setup, statement):
+    return (f"import time, json\n{setup}\nt0 = time.perf_counter()\n{statement}\n"
+            f"print(json.dumps({{'seconds': time.perf_counter() - t0}}))")
+
+
+def describe(result, error):
+    return f"{1000 * result['seconds']:9.1f} ms" if result else f"unavailable: {error[:60]}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', default='eager,background,lazy')
+    args = parser.parse_args()
+
+    print("Import time (fresh interpreter each)")
+    for name, statement in IMPORTS:
+        result, error = run(timed('', statement))
+        print(f"  {name:24s} {describe(result, error)}")
+
+    print("Model construction (after imports)")
+    for name, setup, statement in INITS:
+        result, error = run(timed(setup, statement))
+        print(f"  {name:24s} {describe(result, error)}")
+
+    print("App start by STARTUP_MODE (import + /health, then /ready)")
+    for mode in args.modes.split(','):
+        result, error = run(APP_PROBE, env={'STARTUP_MODE': mode})
+        if result is None:
+            print(f"  {mode:10s} failed: {error}")
+            continue
+        components = ', '.join(f"{n}={c['state']} {1000 * (c['seconds'] or 0):.0f}ms"
+                               for n, c in result['components'].items())
+        print(f"  {mode:10s} health {1000 * result['health_s']:8.1f} ms   ready {1000 * result['ready_s']:8.1f} ms"
+              f"   ({components})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Load time and memory of the native store layout vs LangChain's pickle store.
+
+For each size, writes the same synthetic chunks both as a LangChain
+``FAISS.save_local`` store (index.faiss + pickled docstore) and in the
+native layout, then opens each one in a fresh subprocess and reports the
+time to open it, the time for a first query (top-k search plus fetching
+those k chunks), and the private RSS growth.
+
+    cd backend
+    python benchmarks/bench_store_load.py --sizes 1000,100000,1000000
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import faiss
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from fakes import HashingEmbeddings
+from native_store import write_store
+from vector_index import VectorShard
+
+
+def private_rss_bytes() -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def make_chunks(rng, n, dim, text_chars):
+    vectors = rng.standard_normal((n, dim)).astype('float32')
+    texts = [f"chunk {i} " + "x" * text_chars for i in range(n)]
+    metadatas = [{'source': 'bench.pdf', 'hash': 'bench', 'page': i // 4} for i in range(n)]
+    return texts, metadatas, vectors
+
+
+def write_langchain_store(path, texts, metadatas, vectors):
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    ids = [str(i) for i in range(len(texts))]
+    docstore = InMemoryDocstore({i: Document(page_content=t, metadata=m) for i, t, m in zip(ids, texts, metadatas)})
+    FAISS(HashingEmbeddings(vectors.shape[1]), index, docstore, dict(enumerate(ids))).save_local(path)
+
+
+def measure(layout, path, k):
+    """Runs in a subprocess: open one store, run one query, report timings and private RSS."""
+    query = np.random.default_rng(1).standard_normal((1, int(os.environ['BENCH_DIM']))).astype('float32')
+    before = private_rss_bytes()
+    t0 = time.perf_counter()
+    if layout == 'pickle':
+        # What FAISS.load_local does, minus its version-dependent keyword checks.
+        index = faiss.read_index(os.path.join(path, 'index.faiss'))
+        with open(os.path.join(path, 'index.pkl'), 'rb') as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+    else:
+        shard = VectorShard.load('bench', path, fmt='flat')
+    opened = time.perf_counter()
+    if layout == 'pickle':
+        _, indices = index.search(query, k)
+        docs = [docstore.search(index_to_docstore_id[i]) for i in indices[0]]
+    else:
+        docs = [shard.get(key) for _, key in shard.search(query, k)]
+    queried = time.perf_counter()
+    assert len(docs) == k
+    print(json.dumps({
+        'open_s': opened - t0,
+        'first_query_s': queried - opened,
+        'private_rss': private_rss_bytes() - before,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1000,100000')
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--text-chars', type=int, default=600)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--measure', nargs=2, metavar=('LAYOUT', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure[0], args.measure[1], args.k)
+        return
+
+    rng = np.random.default_rng(3)
+    env = dict(os.environ, BENCH_DIM=str(args.dim))
+    print(f"{'chunks':>8s} {'layout':7s} {'open_ms':>9s} {'query_ms':>9s} {'priv_MB':>8s}")
+    for n in (int(x) for x in args.sizes.split(',')):
+        texts, metadatas, vectors = make_chunks(rng, n, args.dim, args.text_chars)
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = {'pickle': os.path.join(tmp, 'pickle'), 'native': os.path.join(tmp, 'native')}
+            write_langchain_store(paths['pickle'], texts, metadatas, vectors)
+            write_store(paths['native'], texts, metadatas, vectors)
+            for layout, path in paths.items():
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--k', str(args.k), '--measure', layout, path],
+                    capture_output=True, text=True, check=True, env=env
+                )
+                result = json.loads(out.stdout.strip().splitlines()[-1])
+                print(f"{n:8d} {layout:7s} {1000 * result['open_s']:9.1f} {1000 * result['first_query_s']:9.1f} "
+                      f"{result['private_rss'] / 2**20:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+import os
+import math
+import time
+import queue
+import select
+import socket
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError, TimeoutError as FutureTimeout
+from typing import AsyncIterator, Callable, Dict, Iterator
+
+# Chats running on the event loop at once, across all users.
+CHAT_MAX_CONCURRENT = int(os.environ.get("CHAT_MAX_CONCURRENT", 16))
+# Chats one user may have running or queued at once.
+CHAT_MAX_PER_USER = int(os.environ.get("CHAT_MAX_PER_USER", 2))
+# Admitted chats waiting for a slot; beyond this new chats get 429.
+CHAT_QUEUE_SIZE = int(os.environ.get("CHAT_QUEUE_SIZE", 32))
+# Longest a queued chat waits for a slot before it is shed with 429.
+CHAT_QUEUE_TIMEOUT = float(os.environ.get("CHAT_QUEUE_TIMEOUT", 10))
+# Upper bound on a whole chat (queueing, retrieval and LLM); clients may ask for less.
+CHAT_DEADLINE = float(os.environ.get("CHAT_DEADLINE", 120))
+# Threads for blocking steps (retrieval, web fetch, models without async support).
+CHAT_BLOCKING_THREADS = int(os.environ.get("CHAT_BLOCKING_THREADS", 32))
+# How often a waiting request thread checks whether its client went away.
+DISCONNECT_POLL_SECONDS = 0.25
+# Items a stream may run ahead of its client before the chat is paused.
+CHAT_STREAM_BUFFER = int(os.environ.get("CHAT_STREAM_BUFFER", 64))
+
+_DONE = object()
+
+
+class OverloadedError(Exception):
+    """Raised instead of queueing a chat when the limits are reached."""
+
+    def __init__(self, message: str, retry_after: int, reason: str):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+def client_disconnected(environ: Dict) -> bool:
+    """
+    True when the client behind this WSGI request has closed its connection.
+
+    Uses the raw socket exposed by the server (werkzeug and gunicorn both
+    do): a closed peer makes the socket readable with nothing to read. A
+    pipelined next request is readable too, but with data, so it is not
+    mistaken for a disconnect.
+    """
+    sock = environ.get('werkzeug.socket') or environ.get('gunicorn.socket')
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+    except (OSError, ValueError):
+        return True
+
+
+class ChatPipeline:
+    """
+    Runs chat requests as coroutines on one event loop with admission control.
+
+    A request thread hands its coroutine to ``run`` (or an async generator
+    to ``stream``) and only waits for the result. Retrieval and other
+    blocking steps go to a bounded thread pool through ``to_thread``, and
+    model calls use the provider's async API when it has one, so a slow
+    completion occupies neither a pool thread nor the loop.
+
+    Admission is decided before any work starts: a user with
+    ``max_per_user`` chats in flight, or a full queue, gets an
+    ``OverloadedError`` carrying a Retry-After estimate. Admitted chats wait
+    at most ``queue_timeout`` for one of ``max_concurrent`` slots, and the
+    whole chat is bounded by its deadline. If the caller stops waiting
+    (client disconnect, deadline) the coroutine is cancelled.
+    """
+
+    def __init__(self, max_concurrent: int = CHAT_MAX_CONCURRENT, max_per_user: int = CHAT_MAX_PER_USER,
+                 queue_size: int = CHAT_QUEUE_SIZE, queue_timeout: float = CHAT_QUEUE_TIMEOUT,
+                 deadline: float = CHAT_DEADLINE, blocking_threads: int = CHAT_BLOCKING_THREADS):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._per_user: Dict[str, int] = {}
+        self._running = 0
+        # Smoothed chat duration, used to estimate Retry-After.
+        self._avg_seconds = 2.0
+        self._counters = {'admitted': 0, 'completed': 0, 'rejected_user': 0, 'rejected_queue': 0,
+                          'queue_timeouts': 0, 'deadline_exceeded': 0, 'cancelled': 0, 'failed': 0}
+
+        self._executor = ThreadPoolExecutor(max_workers=blocking_threads, thread_name_prefix='chat-blocking')
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self._executor)
+        self._thread = threading.Thread(target=self.loop.run_forever, name='chat-loop', daemon=True)
+        self._thread.start()
+        self._slots = asyncio.run_coroutine_threadsafe(self._make_slots(), self.loop).result()
+
+    async def _make_slots(self):
+        return asyncio.Semaphore(self.max_concurrent)
+
+    def request_deadline(self, requested=None) -> float:
+        """Seconds allowed for one chat: the client's ``timeout`` if given, capped by the server's."""
+        try:
+            requested = float(requested)
+        except (TypeError, ValueError):
+            return self.deadline
+        return min(requested, self.deadline) if requested > 0 else self.deadline
+
+    async def to_thread(self, fn: Callable, *args):
+        return await self.loop.run_in_executor(None, fn, *args)
+
+    def _retry_after(self, queued: int) -> int:
+        waves = queued / float(self.max_concurrent) + 1
+        return max(1, int(math.ceil(self._avg_seconds * waves)))
+
+    def _admit(self, user: str):
+        with self._lock:
+            if self._per_user.get(user, 0) >= self.max_per_user:
+                self._counters['rejected_user'] += 1
+                raise OverloadedError(
+                    f"Too many chats in progress for this user (limit {self.max_per_user})",
+                    self._retry_after(0), 'user_limit'
+                )
+            if self._inflight >= self.max_concurrent + self.queue_size:
+                self._counters['rejected_queue'] += 1
+                raise OverloadedError(
+                    "Chat service is at capacity, try again shortly",
+                    self._retry_after(self._inflight - self.max_concurrent), 'queue_full'
+                )
+            self._inflight += 1
+            self._per_user[user] = self._per_user.get(user, 0) + 1
+            self._counters['admitted'] += 1
+
+    def _release(self, user: str, future):
+        with self._lock:
+            self._inflight -= 1
+            self._per_user[user] -= 1
+            if not self._per_user[user]:
+                del self._per_user[user]
+            if future.cancelled():
+                self._counters['cancelled'] += 1
+            elif isinstance(future.exception(), DeadlineExceeded):
+                self._counters['deadline_exceeded'] += 1
+            elif isinstance(future.exception(), OverloadedError):
+                self._counters['queue_timeouts'] += 1
+            elif future.exception() is not None:
+                self._counters['failed'] += 1
+            else:
+                self._counters['completed'] += 1
+
+    async def _guarded(self, make_coro: Callable, deadline: float, timings: Dict):
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), min(self.queue_timeout, deadline))
+        except asyncio.TimeoutError:
+            raise OverloadedError("Timed out waiting for a chat slot", self._retry_after(self.queue_size), 'queue_timeout')
+        queued = time.monotonic() - started
+        if timings is not None:
+            timings['queue'] = round(queued, 4)
+        with self._lock:
+            self._running += 1
+        try:
+            return await asyncio.wait_for(make_coro(), deadline - queued)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"Chat exceeded its {deadline:.0f}s deadline")
+        finally:
+            elapsed = time.monotonic() - started - queued
+            with self._lock:
+                self._running -= 1
+                self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+            self._slots.release()
+
+    def submit(self, user: str, make_coro: Callable, deadline: float = None, timings: Dict = None):
+        """Admit a chat and start it on the loop; returns a concurrent Future. Raises OverloadedError."""
+        self._admit(user)
+        deadline = deadline or self.deadline
+        future = asyncio.run_coroutine_threadsafe(self._guarded(make_coro, deadline, timings), self.loop)
+        future.add_done_callback(lambda f: self._release(user, f))
+        return future
+
+    def run(self, user: str, make_coro: Callable, deadline: float = None, timings: Dict = None,
+            environ: Dict = None):
+        """
+        Run ``make_coro()`` under the limits and wait for its result.
+
+        With ``environ`` the wait also watches the client connection and
+        cancels the chat (raising ``ClientDisconnected``) if it closes.
+        """
+        deadline = deadline or self.deadline
+        future = self.submit(user, make_coro, deadline, timings)
+        # Safety net on top of the in-loop deadline, for a blocked loop.
+        give_up = time.monotonic() + deadline + self.queue_timeout + 1
+        try:
+            while True:
+                try:
+                    return future.result(timeout=DISCONNECT_POLL_SECONDS)
+                except FutureTimeout:
+                    pass
+                if environ is not None and client_disconnected(environ):
+                    raise ClientDisconnected("Client disconnected")
+                if time.monotonic() > give_up:
+                    raise DeadlineExceeded(f"Chat exceeded its {deadline:.0f}s deadline")
+        finally:
+            future.cancel()
+
+    def stream(self, user: str, make_agen: Callable[[], AsyncIterator], deadline: float = None,
+               timings: Dict = None, buffer: int = CHAT_STREAM_BUFFER) -> 'ChatStream':
+        """
+        Admit a chat now and return a ``ChatStream`` over the items of
+        ``make_agen()``. At most ``buffer`` items wait for the reader; past
+        that the chat is paused until the reader catches up.
+        """
+        items = queue.Queue()
+        credits = asyncio.run_coroutine_threadsafe(_make_credits(buffer), self.loop).result()
+
+        async def pump():
+            async for item in make_agen():
+                await credits.acquire()
+                items.put(item)
+
+        future = self.submit(user, pump, deadline, timings)
+        # Also fires when the chat never started (shed while queued).
+        future.add_done_callback(lambda f: items.put(_DONE))
+        return ChatStream(future, items, lambda: self.loop.call_soon_threadsafe(credits.release))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(
+                self._counters,
+                running=self._running,
+                queued=self._inflight - self._running,
+                users=len(self._per_user),
+                avg_seconds=round(self._avg_seconds, 3),
+                limits={'max_concurrent': self.max_concurrent, 'max_per_user': self.max_per_user,
+                        'queue_size': self.queue_size, 'deadline': self.deadline},
+            )
+
+
+async def _make_credits(count: int):
+    return asyncio.Semaphore(max(1, count))
+
+
+class ChatStream:
+    """
+    Blocking iterator over a streamed chat, returned by ``ChatPipeline.stream``.
+
+    ``close`` cancels the chat. The WSGI server calls it when the client
+    goes away, through ``Response.call_on_close``; unlike a generator's
+    ``finally`` it also runs when the response was never iterated.
+    """
+
+    def __init__(self, future, items: queue.Queue, consumed: Callable):
+        self._future = future
+        self._items = items
+        self._consumed = consumed
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._finished:
+            raise StopIteration
+        item = self._items.get()
+        if item is not _DONE:
+            self._consumed()
+            return item
+        self._finished = True
+        try:
+            self._future.result()
+        except CancelledError:
+            pass
+        raise StopIteration
+
+    def close(self):
+        self._finished = True
+        self._future.cancel()
+
+
+async def ainvoke_model(model, prompt):
+    """Call a chat model without holding a thread when it supports async."""
+    if hasattr(model, 'ainvoke'):
+        return await model.ainvoke(prompt)
+    return await asyncio.get_running_loop().run_in_executor(None, model.invoke, prompt)
+
+
+async def astream_model(model, prompt) -> AsyncIterator:
+    if hasattr(model, 'astream'):
+        async for chunk in model.astream(prompt):
+            yield chunk
+        return
+    loop = asyncio.get_running_loop()
+    iterator = iter(model.stream(prompt))
+    while True:
+        chunk = await loop.run_in_executor(None, next, iterator, _DONE)
+        if chunk is _DONE:
+            return
+        yield chunk
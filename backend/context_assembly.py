@@ -0,0 +1,172 @@
+import os
+import re
+from typing import Dict, List, Tuple
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+# Context token budget per tool. Generators that need broad coverage get more room.
+TOOL_CONTEXT_BUDGETS = {
+    'exam_paper_generator': 6000,
+    'exam_prep_agent': 5000,
+    'notes_maker': 4500,
+    'summarizer': 4000,
+    'mcq_generator': 4000,
+    'concept_explainer': 3000,
+    'ai_chat': 2500,
+}
+DEFAULT_CONTEXT_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 3000))
+# MMR trade-off: 1.0 is pure relevance, 0.0 pure diversity.
+MMR_LAMBDA = float(os.environ.get("CONTEXT_MMR_LAMBDA", 0.7))
+NEAR_DUPLICATE_THRESHOLD = 0.8
+MAX_OVERLAP_CHARS = 400
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Tokens as the LLM sees them when tiktoken is installed, else a word-piece estimate."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    # Sub-word tokenizers split long words; ~4 chars per token is the usual rule of thumb.
+    return sum(max(1, len(w) // 4) for w in _WORD_RE.findall(text))
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    if count_tokens(text) <= budget:
+        return text
+    if _ENCODING is not None:
+        return _ENCODING.decode(_ENCODING.encode(text, disallowed_special=())[:budget])
+    # Binary search the character cut for the heuristic counter.
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def budget_for(tool: str) -> int:
+    return TOOL_CONTEXT_BUDGETS.get(tool, DEFAULT_CONTEXT_BUDGET)
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of ``a`` that is a prefix of ``b`` (splitter overlap)."""
+    for n in range(min(len(a), len(b), MAX_OVERLAP_CHARS), 20, -1):
+        if a.endswith(b[:n]):
+            return n
+    return 0
+
+
+def _shingles(text: str, n: int = 3) -> frozenset:
+    words = text.lower().split()
+    if len(words) < n:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + n]) for i in range(len(words) - n + 1))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def merge_overlapping(docs) -> List[Dict]:
+    """
+    Merge chunks from the same source page whose text overlaps or contains
+    one another. Returns blocks ``{'source', 'page', 'text', 'rank'}`` where
+    ``rank`` is the best retrieval rank of any chunk merged into the block.
+    """
+    blocks: List[Dict] = []
+    by_page: Dict[Tuple, List[Dict]] = {}
+    for rank, doc in enumerate(docs):
+        meta = doc.metadata
+        key = (meta.get('hash') or meta.get('source'), meta.get('page'))
+        text = doc.page_content
+        merged = False
+        for block in by_page.get(key, []):
+            if text in block['text']:
+                merged = True
+            elif block['text'] in text:
+                block['text'] = text
+                merged = True
+            else:
+                n = _overlap(block['text'], text)
+                if n:
+                    block['text'] += text[n:]
+                    merged = True
+                else:
+                    n = _overlap(text, block['text'])
+                    if n:
+                        block['text'] = text + block['text'][n:]
+                        merged = True
+            if merged:
+                block['rank'] = min(block['rank'], rank)
+                break
+        if not merged:
+            block = {'source': meta.get('source', 'unknown'), 'page': meta.get('page', '?'), 'text': text, 'rank': rank}
+            blocks.append(block)
+            by_page.setdefault(key, []).append(block)
+    return blocks
+
+
+def assemble_context(docs, tool: str, budget: int = None) -> Tuple[str, Dict]:
+    """
+    Build the prompt context from ranked chunks within the tool's token budget.
+
+    Overlapping chunks from the same page are merged, near-duplicates are
+    dropped, and blocks are picked greedily by MMR (relevance from retrieval
+    rank, redundancy from word-shingle overlap) until the budget is full.
+    Returns the context and a stats dict comparing it with naive joining.
+    """
+    budget = budget or budget_for(tool)
+    naive = "\n\n".join(f"[{d.metadata.get('source', 'unknown')} p.{d.metadata.get('page', '?')}] {d.page_content}" for d in docs)
+    stats = {'chunks_in': len(docs), 'tokens_in': count_tokens(naive), 'budget': budget}
+
+    blocks = merge_overlapping(docs)
+    for block in blocks:
+        block['shingles'] = _shingles(block['text'])
+        block['relevance'] = 1.0 / (1 + block['rank'])
+
+    candidates = sorted(blocks, key=lambda b: b['rank'])
+    unique = []
+    for block in candidates:
+        if all(_jaccard(block['shingles'], kept['shingles']) < NEAR_DUPLICATE_THRESHOLD for kept in unique):
+            unique.append(block)
+
+    selected, rendered_blocks, used = [], [], 0
+    remaining = list(unique)
+    while remaining:
+        def mmr(block):
+            redundancy = max((_jaccard(block['shingles'], s['shingles']) for s in selected), default=0.0)
+            return MMR_LAMBDA * block['relevance'] - (1 - MMR_LAMBDA) * redundancy
+
+        best = max(remaining, key=mmr)
+        remaining.remove(best)
+        rendered = f"[{best['source']} p.{best['page']}] {best['text']}"
+        cost = count_tokens(rendered) + 2
+        if used + cost > budget:
+            if not selected:
+                # Always include something: trim the best block to fit.
+                selected.append(best)
+                rendered_blocks.append(truncate_to_tokens(rendered, budget))
+                used = budget
+            continue
+        selected.append(best)
+        rendered_blocks.append(rendered)
+        used += cost
+
+    context = "\n\n".join(rendered_blocks)
+    stats.update({
+        'blocks_merged': len(docs) - len(blocks),
+        'near_duplicates_dropped': len(blocks) - len(unique),
+        'chunks_out': len(selected),
+        'tokens_out': count_tokens(context),
+    })
+    stats['reduction'] = round(1 - stats['tokens_out'] / stats['tokens_in'], 4) if stats['tokens_in'] else 0.0
+    return context, stats
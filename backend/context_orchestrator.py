@@ -0,0 +1,122 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Whole budget for gathering a chat's context (PDF retrieval and web search).
+CONTEXT_DEADLINE = float(os.environ.get("CONTEXT_DEADLINE", 8))
+# Cosine similarity of the best PDF chunk above which the web branch is dropped.
+CONTEXT_RELEVANCE_THRESHOLD = float(os.environ.get("CONTEXT_RELEVANCE_THRESHOLD", 0.5))
+# Tools whose web search starts together with PDF retrieval instead of after it.
+SPECULATIVE_WEB_TOOLS = frozenset(
+    t.strip() for t in os.environ.get("SPECULATIVE_WEB_TOOLS", "ai_chat").split(',') if t.strip()
+)
+
+
+class ContextOrchestrator:
+    """
+    Gathers a chat's PDF and web context under one deadline.
+
+    PDF retrieval always runs. For tools in ``speculative_tools`` (where PDF
+    context is optional) the web search starts at the same time; it is
+    cancelled as soon as the PDF results clear ``threshold``, and otherwise
+    its result is used next to weak PDF results or instead of missing ones.
+    For other tools the web is only searched when retrieval found nothing,
+    as before. Blocking branches run on the loop's default executor; a
+    branch still running at the deadline is abandoned.
+
+    ``retrieve(user_email, query, filters)`` returns ``(docs, relevance)``
+    (``filters`` is the request's ``DocumentFilter`` or None);
+    ``fetch_web(query, cancel)`` returns text and should stop early once the
+    ``cancel`` event is set.
+    """
+
+    def __init__(self, retrieve: Callable, fetch_web: Callable, web_configured: Callable[[], bool],
+                 deadline: float = CONTEXT_DEADLINE, threshold: float = CONTEXT_RELEVANCE_THRESHOLD,
+                 speculative_tools=SPECULATIVE_WEB_TOOLS):
+        self.retrieve = retrieve
+        self.fetch_web = fetch_web
+        self.web_configured = web_configured
+        self.deadline = deadline
+        self.threshold = threshold
+        self.speculative_tools = frozenset(speculative_tools)
+        self._lock = threading.Lock()
+        self._counters = {'speculative': 0, 'web_cancelled': 0, 'web_used': 0, 'local_timeouts': 0,
+                          'web_timeouts': 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    async def gather(self, user_email: str, query: str, tool: str, filters=None) -> Dict:
+        """
+        Returns ``docs`` and ``relevance`` from the PDFs, ``web_context``
+        (empty when the web was not needed) and ``branches``, the per-branch
+        status and latency.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        deadline_at = started + self.deadline
+        branches: Dict[str, Dict] = {}
+        cancel = threading.Event()
+
+        web = None
+        if tool in self.speculative_tools and self.web_configured():
+            self._count('speculative')
+            web = loop.run_in_executor(None, self.fetch_web, query, cancel)
+
+        docs, relevance = await self._local(loop, user_email, query, filters, deadline_at, branches, started)
+        confident = bool(docs) and relevance is not None and relevance >= self.threshold
+
+        if web is not None and confident:
+            cancel.set()
+            web.cancel()
+            self._count('web_cancelled')
+            branches['web'] = {'status': 'cancelled', 'seconds': round(time.perf_counter() - started, 4)}
+            return {'docs': docs, 'relevance': relevance, 'web_context': "", 'branches': branches}
+
+        web_context = ""
+        if web is not None or not docs:
+            web_started = started if web is not None else time.perf_counter()
+            if web is None:
+                web = loop.run_in_executor(None, self.fetch_web, query, cancel)
+            try:
+                web_context = await asyncio.wait_for(web, max(0.0, deadline_at - time.perf_counter()))
+                status = 'done'
+                self._count('web_used')
+            except asyncio.TimeoutError:
+                cancel.set()
+                status = 'timeout'
+                self._count('web_timeouts')
+            except Exception as e:
+                print(f"⚠️ Web context failed: {e}")
+                status = 'failed'
+            branches['web'] = {'status': status, 'seconds': round(time.perf_counter() - web_started, 4),
+                               'speculative': web_started == started}
+        return {'docs': docs, 'relevance': relevance, 'web_context': web_context or "", 'branches': branches}
+
+    async def _local(self, loop, user_email: str, query: str, filters, deadline_at: float, branches: Dict,
+                     started: float) -> Tuple[List, Optional[float]]:
+        local = loop.run_in_executor(None, self.retrieve, user_email, query, filters)
+        try:
+            docs, relevance = await asyncio.wait_for(local, max(0.0, deadline_at - time.perf_counter()))
+            status = 'done'
+        except asyncio.TimeoutError:
+            docs, relevance, status = [], None, 'timeout'
+            self._count('local_timeouts')
+        except Exception as e:
+            print(f"⚠️ PDF retrieval failed: {e}")
+            docs, relevance, status = [], None, 'failed'
+        branches['pdf'] = {
+            'status': status,
+            'seconds': round(time.perf_counter() - started, 4),
+            'docs': len(docs),
+            'relevance': round(relevance, 4) if relevance is not None else None,
+        }
+        return docs, relevance
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._counters, deadline=self.deadline, threshold=self.threshold,
+                        speculative_tools=sorted(self.speculative_tools))
@@ -0,0 +1,170 @@
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+# Dense search only visits the DOC_ROUTER_TOP_N documents whose centroids are
+# nearest the query, once the documents in scope hold at least
+# DOC_ROUTER_MIN_CHUNKS chunks between them (0 disables routing).
+DOC_ROUTER_TOP_N = int(os.environ.get("DOC_ROUTER_TOP_N", 4))
+DOC_ROUTER_MIN_CHUNKS = int(os.environ.get("DOC_ROUTER_MIN_CHUNKS", 20000))
+
+
+@dataclass(frozen=True)
+class DocumentFilter:
+    """
+    Which part of a user's library a chat may retrieve from.
+
+    ``documents`` are PDF hashes or filenames (None means all of them);
+    ``pages`` is an inclusive range numbered as a PDF viewer shows it,
+    1 being the first page (None means every page).
+    """
+    documents: Optional[Tuple[str, ...]] = None
+    pages: Optional[Tuple[int, int]] = None
+
+    @classmethod
+    def from_request(cls, raw) -> Optional['DocumentFilter']:
+        """
+        Parse the ``filters`` field of a chat request, e.g.
+        ``{"documents": ["notes.pdf"], "pages": [10, 20]}`` (``pages`` may
+        also be ``"10-20"`` or a single page). Raises ValueError when it is
+        malformed; returns None when it filters nothing.
+        """
+        if raw is None:
+            return None
+        if not isinstance(raw, dict):
+            raise ValueError("filters must be an object")
+        unknown = set(raw) - {'documents', 'pages'}
+        if unknown:
+            raise ValueError(f"unknown filter: {', '.join(sorted(unknown))}")
+
+        documents = raw.get('documents')
+        if documents is not None:
+            if isinstance(documents, str):
+                documents = [documents]
+            if not isinstance(documents, list) or not all(isinstance(d, str) and d for d in documents):
+                raise ValueError("filters.documents must be a list of document hashes or filenames")
+            documents = tuple(dict.fromkeys(documents))
+
+        pages = raw.get('pages')
+        if pages is not None:
+            pages = _page_range(pages)
+
+        if documents is None and pages is None:
+            return None
+        return cls(documents, pages)
+
+    def page_indexes(self) -> Optional[Tuple[int, int]]:
+        """The page range as the 0-based ``page`` values stored with each chunk."""
+        return (self.pages[0] - 1, self.pages[1] - 1) if self.pages else None
+
+    def as_dict(self) -> Dict:
+        out = {}
+        if self.documents is not None:
+            out['documents'] = list(self.documents)
+        if self.pages is not None:
+            out['pages'] = list(self.pages)
+        return out
+
+
+def _page_range(value) -> Tuple[int, int]:
+    if isinstance(value, bool):
+        raise ValueError("filters.pages must be a page, [first, last] or \"first-last\"")
+    if isinstance(value, int):
+        bounds = [value, value]
+    elif isinstance(value, str):
+        first, sep, last = value.partition('-')
+        bounds = [first, last if sep else first]
+    elif isinstance(value, list) and len(value) == 2:
+        bounds = value
+    else:
+        raise ValueError("filters.pages must be a page, [first, last] or \"first-last\"")
+    try:
+        first, last = (int(b.strip()) if isinstance(b, str) else int(b) for b in bounds)
+    except (TypeError, ValueError):
+        raise ValueError("filters.pages must hold whole page numbers")
+    if first < 1 or last < first:
+        raise ValueError("filters.pages must satisfy 1 <= first <= last")
+    return first, last
+
+
+class DocumentRouter:
+    """
+    Picks the documents worth a fine-grained dense search.
+
+    Every shard contributes a few centroids of its vectors (see
+    ``VectorShard.centroids``); they are stacked into one small matrix the
+    first time the router runs after the library changes. A query scores
+    each document by its nearest centroid (cosine) and only the ``top_n``
+    best documents are searched. Libraries smaller than ``min_chunks``
+    are searched flat, where routing would save little and could only
+    cost recall.
+    """
+
+    def __init__(self, top_n: int = DOC_ROUTER_TOP_N, min_chunks: int = DOC_ROUTER_MIN_CHUNKS):
+        self.top_n = top_n
+        self.min_chunks = min_chunks
+        self._lock = threading.Lock()
+        # (library key, document hashes, stacked centroids, first centroid row of each document)
+        self._table = None
+        self._counters = {'routed': 0, 'flat': 0, 'documents_skipped': 0}
+
+    def reset(self):
+        """Forget the stacked centroids; called whenever a shard is added or removed."""
+        with self._lock:
+            self._table = None
+
+    def enabled_for(self, documents: int, chunks: int) -> bool:
+        return self.top_n > 0 and documents > self.top_n and chunks >= self.min_chunks
+
+    def select(self, shards: Dict, vector, all_shards: Dict, chunks: int) -> List[str]:
+        """
+        Hashes of the documents among ``shards`` (holding ``chunks``
+        searchable chunks) to search for ``vector``. ``all_shards`` is the
+        user's whole library, whose centroids are stacked once and reused
+        whatever the request's scope.
+        """
+        if not self.enabled_for(len(shards), chunks):
+            self._count('flat')
+            return list(shards)
+        hashes, centroids, starts = self._stacked(all_shards)
+        query = np.asarray(vector, dtype='float32').reshape(-1)
+        norm = float(np.linalg.norm(query))
+        scores = np.maximum.reduceat(centroids @ (query / norm if norm else query), starts)
+        ranked = [hashes[i] for i in np.argsort(-scores, kind='stable')]
+        selected = [h for h in ranked if h in shards][:self.top_n]
+        self._count('routed')
+        self._count('documents_skipped', len(shards) - len(selected))
+        return selected
+
+    def _stacked(self, all_shards: Dict):
+        key = tuple(all_shards)
+        with self._lock:
+            table = self._table
+        if table is not None and table[0] == key:
+            return table[1:]
+        hashes, blocks, starts, row = [], [], [], 0
+        for pdf_hash, shard in all_shards.items():
+            block = shard.centroids()
+            if len(block):
+                hashes.append(pdf_hash)
+                blocks.append(block)
+                starts.append(row)
+                row += len(block)
+        table = (key, hashes, np.concatenate(blocks), np.asarray(starts, dtype='int64'))
+        with self._lock:
+            self._table = table
+        return table[1:]
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._counters[key] += amount
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._counters, top_n=self.top_n, min_chunks=self.min_chunks)
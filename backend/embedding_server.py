@@ -0,0 +1,246 @@
+"""
+Shared embedding model server for multi-worker deployments.
+
+One process owns the embedding model and listens on a Unix socket; every
+app worker sends it texts instead of loading its own copy. Requests from
+all workers go through one EmbeddingService batcher, so concurrent
+uploads and queries are embedded in shared batches, and the model uses
+every core (``EMBED_SERVER_THREADS``).
+
+    cd backend
+    python embedding_server.py --socket /tmp/rag-embedding.sock
+
+Workers find the server through ``EMBEDDING_SERVER_SOCKET`` and fall back
+to an in-process model whenever it is absent or stops answering.
+"""
+import os
+import sys
+import json
+import signal
+import socket
+import struct
+import argparse
+import threading
+import socketserver
+from array import array
+from typing import Dict, List, Optional
+
+try:
+    from langchain_core.embeddings import Embeddings
+except Exception:
+    Embeddings = object
+
+from embeddings import EmbeddingService, served_model_name
+from fakes import fake_embeddings_from_env
+
+EMBEDDING_SERVER_SOCKET = os.environ.get("EMBEDDING_SERVER_SOCKET", "/tmp/rag-embedding.sock")
+EMBEDDING_SERVER_TIMEOUT = float(os.environ.get("EMBEDDING_SERVER_TIMEOUT", 30))
+EMBED_SERVER_THREADS = int(os.environ.get("EMBED_SERVER_THREADS", os.cpu_count() or 1))
+
+# Frame: 8-byte header (JSON length, payload length), JSON, then raw float32 payload.
+_FRAME = struct.Struct('!II')
+
+
+def _recv_exact(sock, n: int) -> bytes:
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("embedding server connection closed")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def send_frame(sock, header: Dict, payload: bytes = b''):
+    body = json.dumps(header).encode('utf-8')
+    sock.sendall(_FRAME.pack(len(body), len(payload)) + body + payload)
+
+
+def recv_frame(sock):
+    body_len, payload_len = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+    header = json.loads(_recv_exact(sock, body_len).decode('utf-8'))
+    payload = _recv_exact(sock, payload_len) if payload_len else b''
+    return header, payload
+
+
+def _pack_vectors(vectors: List[List[float]]):
+    flat = array('f')
+    for vector in vectors:
+        flat.extend(vector)
+    return {'n': len(vectors), 'dim': len(vectors[0]) if vectors else 0}, flat.tobytes()
+
+
+def _unpack_vectors(header: Dict, payload: bytes) -> List[List[float]]:
+    flat = array('f', payload).tolist()
+    dim = header['dim']
+    return [flat[i * dim:(i + 1) * dim] for i in range(header['n'])]
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        service = self.server.service
+        while True:
+            try:
+                header, _ = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                op = header.get('op')
+                if op == 'ping':
+                    send_frame(self.request, {'ok': True, 'model': service.model_name})
+                    continue
+                if op == 'embed_documents':
+                    vectors = service.embed_documents(header['texts'])
+                elif op == 'embed_query':
+                    vectors = [service.embed_query(header['text'])]
+                else:
+                    raise ValueError(f"unknown op {op!r}")
+                meta, payload = _pack_vectors(vectors)
+                send_frame(self.request, meta, payload)
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                send_frame(self.request, {'error': str(e)})
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """One thread per worker connection, all feeding the same batching service."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, service: EmbeddingService):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        self.service = service
+        super().__init__(socket_path, _Handler)
+
+
+def server_model(socket_path: str = EMBEDDING_SERVER_SOCKET, timeout: float = 1.0) -> Optional[str]:
+    """Name of the model the server at ``socket_path`` embeds with, or None if it does not answer."""
+    if not socket_path or not os.path.exists(socket_path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            send_frame(sock, {'op': 'ping'})
+            header, _ = recv_frame(sock)
+            return header.get('model') if header.get('ok') else None
+    except OSError:
+        return None
+
+
+def server_available(socket_path: str = EMBEDDING_SERVER_SOCKET, timeout: float = 1.0) -> bool:
+    return server_model(socket_path, timeout) is not None
+
+
+class RemoteEmbeddings(Embeddings):
+    """
+    Embeddings computed by the shared server, one socket per calling thread.
+
+    When the server cannot be reached the call is answered by ``fallback``
+    (a ``LazyComponent`` building an in-process model on first need) and the
+    server is tried again on the next call. ``model_name`` is the model the
+    server reported; a fallback model with a different name is refused, as
+    its vectors would not be comparable with the server's.
+    """
+
+    def __init__(self, socket_path: str = EMBEDDING_SERVER_SOCKET, timeout: float = EMBEDDING_SERVER_TIMEOUT,
+                 fallback=None, model_name: str = None):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.fallback = fallback
+        self.model_name = model_name
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {'remote_calls': 0, 'fallback_calls': 0}
+
+    def _request(self, header: Dict):
+        sock = getattr(self._local, 'sock', None)
+        try:
+            if sock is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+                self._local.sock = sock
+            send_frame(sock, header)
+            response, payload = recv_frame(sock)
+        except OSError as e:
+            if sock is not None:
+                sock.close()
+            self._local.sock = None
+            if self.fallback is None:
+                raise
+            print(f"⚠️ Embedding server unavailable ({e}); embedding in-process")
+            return None
+        if 'error' in response:
+            raise RuntimeError(f"Embedding server error: {response['error']}")
+        with self._lock:
+            self._counters['remote_calls'] += 1
+        return _unpack_vectors(response, payload)
+
+    def _fallback_model(self):
+        with self._lock:
+            self._counters['fallback_calls'] += 1
+        model = self.fallback.get()
+        if model is None:
+            raise RuntimeError("Embedding server unavailable and no in-process model could be loaded")
+        fallback_name = served_model_name(model, None)
+        if self.model_name and fallback_name and fallback_name != self.model_name:
+            raise RuntimeError(f"Embedding server ({self.model_name}) unavailable and the in-process model "
+                               f"({fallback_name}) embeds differently")
+        return model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self._request({'op': 'embed_documents', 'texts': texts})
+        return vectors if vectors is not None else self._fallback_model().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        vectors = self._request({'op': 'embed_query', 'text': text})
+        return vectors[0] if vectors is not None else self._fallback_model().embed_query(text)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._counters, socket=self.socket_path)
+
+
+def build_server_model(model_name: str):
+    fake = fake_embeddings_from_env()
+    if fake is not None:
+        return fake
+    try:
+        import torch
+        torch.set_num_threads(EMBED_SERVER_THREADS)
+    except Exception:
+        pass
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--socket', default=EMBEDDING_SERVER_SOCKET)
+    parser.add_argument('--model', default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument('--asymmetric', action='store_true',
+                        help="model embeds queries differently; do not batch them with documents")
+    args = parser.parse_args()
+
+    model = build_server_model(args.model)
+    # Workers keep their own chunk cache, so the server only batches.
+    service = EmbeddingService(model, served_model_name(model, args.model), batch_queries=not args.asymmetric)
+    server = EmbeddingServer(args.socket, service)
+    # Exit through the finally below so a stopped server removes its socket.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"Embedding server for {service.model_name} listening on {args.socket}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
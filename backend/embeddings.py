@@ -0,0 +1,201 @@
+import os
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List
+
+try:
+    from langchain_core.embeddings import Embeddings
+except Exception:
+    Embeddings = object
+
+EMBED_MAX_BATCH = int(os.environ.get("EMBED_MAX_BATCH", 64))
+# How long the batcher waits for more texts before sending a partial batch.
+EMBED_MAX_WAIT_MS = float(os.environ.get("EMBED_MAX_WAIT_MS", 5))
+EMBED_QUERY_CACHE_SIZE = int(os.environ.get("EMBED_QUERY_CACHE_SIZE", 2048))
+
+
+def text_key(model_name: str, text: str) -> str:
+    return hashlib.sha1(f"{model_name}\x00{text}".encode('utf-8', 'ignore')).hexdigest()
+
+
+class EmbeddingDiskCache:
+    """Chunk embeddings keyed by (model, text hash) in a local SQLite file."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            # SQLite limits bound parameters per statement; 500 stays well under it.
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array('f', blob).tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array('f', vector).tobytes()) for key, vector in items.items()]
+            )
+            self._conn.commit()
+
+
+def served_model_name(model, default: str) -> str:
+    """The name ``model``'s vectors are cached under: the name it reports, else ``default``."""
+    return getattr(model, 'model_name', None) or default
+
+
+class EmbeddingService(Embeddings):
+    """
+    Batching, caching front for an embedding model.
+
+    ``embed_documents`` looks every chunk up in the on-disk cache first and
+    only sends misses to the model. Misses from concurrent callers are
+    gathered by a single batcher thread into batches of up to
+    ``EMBED_MAX_BATCH`` texts, waiting at most ``EMBED_MAX_WAIT_MS`` for a
+    batch to fill. ``embed_query`` adds an in-memory LRU on top, and with
+    ``batch_queries`` query misses join the batches too (only valid for
+    models that embed queries and documents the same way). Drop-in
+    replacement for the wrapped model wherever LangChain expects embeddings.
+    """
+
+    def __init__(self, model, model_name: str, cache_path: str = None,
+                 max_batch: int = EMBED_MAX_BATCH, max_wait_ms: float = EMBED_MAX_WAIT_MS,
+                 query_cache_size: int = EMBED_QUERY_CACHE_SIZE, batch_queries: bool = False):
+        self.model = model
+        self.model_name = model_name
+        self.batch_queries = batch_queries
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.disk_cache = EmbeddingDiskCache(cache_path) if cache_path else None
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_cache_size = query_cache_size
+        self._pending: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._counters = {
+            'batches': 0,
+            'batched_texts': 0,
+            'max_batch_size': 0,
+            'embed_seconds': 0.0,
+            'chunk_cache_hits': 0,
+            'chunk_cache_misses': 0,
+            'query_cache_hits': 0,
+            'query_cache_misses': 0,
+        }
+        self._batcher = threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True)
+        self._batcher.start()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_key(self.model_name, t) for t in texts]
+        cached = self.disk_cache.get_many(list(set(keys))) if self.disk_cache else {}
+
+        futures = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in futures:
+                futures[key] = self._submit(text)
+        with self._lock:
+            self._counters['chunk_cache_hits'] += len(texts) - len(futures)
+            self._counters['chunk_cache_misses'] += len(futures)
+
+        fresh = {key: future.result() for key, future in futures.items()}
+        if self.disk_cache:
+            self.disk_cache.put_many(fresh)
+        cached.update(fresh)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = text_key(self.model_name, text)
+        with self._lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+                self._counters['query_cache_hits'] += 1
+                return vector
+            self._counters['query_cache_misses'] += 1
+
+        if self.batch_queries:
+            vector = self._submit(text).result()
+        else:
+            # Queries go through the model's own embed_query: some models
+            # (e.g. instruction-tuned ones) embed queries differently from documents.
+            t0 = time.perf_counter()
+            vector = self.model.embed_query(text)
+            with self._lock:
+                self._counters['embed_seconds'] += time.perf_counter() - t0
+        with self._lock:
+            self._query_cache[key] = vector
+            while len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def stats(self) -> Dict:
+        with self._lock:
+            c = dict(self._counters)
+        chunk_total = c['chunk_cache_hits'] + c['chunk_cache_misses']
+        query_total = c['query_cache_hits'] + c['query_cache_misses']
+        out = {
+            'model': self.model_name,
+            'batches': c['batches'],
+            'avg_batch_size': round(c['batched_texts'] / c['batches'], 2) if c['batches'] else None,
+            'max_batch_size': c['max_batch_size'],
+            'embed_seconds': round(c['embed_seconds'], 4),
+            'avg_batch_latency_ms': round(1000 * c['embed_seconds'] / c['batches'], 2) if c['batches'] else None,
+            'chunk_cache_hit_rate': round(c['chunk_cache_hits'] / chunk_total, 4) if chunk_total else None,
+            'query_cache_hit_rate': round(c['query_cache_hits'] / query_total, 4) if query_total else None,
+            'chunk_cache_hits': c['chunk_cache_hits'],
+            'query_cache_hits': c['query_cache_hits'],
+        }
+        if hasattr(self.model, 'stats'):
+            out['backend'] = self.model.stats()
+        return out
+
+    def _submit(self, text: str) -> Future:
+        future = Future()
+        self._pending.put((text, future))
+        return future
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._pending.get(timeout=max(remaining, 0)) if remaining > 0 else self._pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            t0 = time.perf_counter()
+            try:
+                vectors = self.model.embed_documents([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - t0
+
+            with self._lock:
+                self._counters['batches'] += 1
+                self._counters['batched_texts'] += len(batch)
+                self._counters['max_batch_size'] = max(self._counters['max_batch_size'], len(batch))
+                self._counters['embed_seconds'] += elapsed
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
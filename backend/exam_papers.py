@@ -0,0 +1,78 @@
+import os
+import re
+import time
+import asyncio
+from typing import AsyncIterator, Dict, List, Tuple
+
+from chat_pipeline import ainvoke_model
+
+# parallel: one model call per paper, run concurrently and reassembled in
+# order; single: all papers from one call (the original behaviour).
+EXAM_GENERATION_MODE = os.environ.get("EXAM_GENERATION_MODE", "parallel")
+# Model calls one exam request may have in flight at once.
+EXAM_PARALLEL_PAPERS = int(os.environ.get("EXAM_PARALLEL_PAPERS", 4))
+# Most papers one exam request may ask for; larger requests are rejected.
+EXAM_MAX_PAPERS = int(os.environ.get("EXAM_MAX_PAPERS", 10))
+
+_HEADER_RE = re.compile(r'EXAMINATION PAPER\s*(?:\[NUMBER\]|\d+)', re.IGNORECASE)
+
+
+def slice_docs(docs: List, count: int) -> List[List]:
+    """
+    Deal ranked chunks round-robin into ``count`` slices so each paper
+    draws on different material and every slice keeps some top-ranked
+    chunks. With fewer chunks than papers every paper gets all of them.
+    """
+    if len(docs) < count:
+        return [list(docs) for _ in range(count)]
+    return [docs[i::count] for i in range(count)]
+
+
+def slice_text(context: str, count: int) -> List[str]:
+    """Same as ``slice_docs`` for plain-text (web) context, dealing paragraphs."""
+    blocks = [b for b in context.split("\n\n") if b.strip()]
+    if len(blocks) < count:
+        return [context] * count
+    return ["\n\n".join(blocks[i::count]) for i in range(count)]
+
+
+def number_paper(text: str, number: int) -> str:
+    """Force the paper's ``EXAMINATION PAPER`` header(s) to ``number``, adding one if missing."""
+    text = text.strip()
+    if _HEADER_RE.search(text):
+        return _HEADER_RE.sub(f"EXAMINATION PAPER {number}", text)
+    return f"---\n**EXAMINATION PAPER {number}**\n{text}"
+
+
+async def iter_papers(model, prompts: List[str], fan_out: int = EXAM_PARALLEL_PAPERS
+                      ) -> AsyncIterator[Tuple[int, str, float]]:
+    """
+    Run one model call per prompt, at most ``fan_out`` at a time, and yield
+    ``(index, text, seconds)`` in prompt order as soon as each paper (and
+    every paper before it) is done. Closing the iterator cancels the rest.
+    """
+    slots = asyncio.Semaphore(max(1, fan_out))
+
+    async def generate(prompt):
+        async with slots:
+            t0 = time.perf_counter()
+            response = await ainvoke_model(model, prompt)
+            return getattr(response, "content", str(response)), time.perf_counter() - t0
+
+    tasks = [asyncio.ensure_future(generate(p)) for p in prompts]
+    try:
+        for index, task in enumerate(tasks):
+            text, seconds = await task
+            yield index, number_paper(text, index + 1), seconds
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def generate_papers(model, prompts: List[str], fan_out: int = EXAM_PARALLEL_PAPERS) -> Tuple[str, Dict]:
+    """All papers joined in order, plus per-paper model seconds."""
+    papers, seconds = [], []
+    async for _, text, elapsed in iter_papers(model, prompts, fan_out):
+        papers.append(text)
+        seconds.append(round(elapsed, 4))
+    return "\n\n".join(papers), {'papers': len(papers), 'fan_out': fan_out, 'paper_seconds': seconds}
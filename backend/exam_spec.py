@@ -0,0 +1,427 @@
+"""
+Exam spec language: parsing exam-paper requests and rendering their prompts.
+
+Requests such as "3 papers, two 2 marks questions, all hard, duration 30
+minutes" are parsed in one pass into an immutable ``ExamSpec``. Parsed
+specs are cached by query, and the static parts of the prompt are cached
+by spec, so a repeated request only pays for splicing in its context.
+"""
+import os
+import re
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+EXAM_SPEC_CACHE_SIZE = int(os.environ.get("EXAM_SPEC_CACHE_SIZE", 1024))
+
+NUMBER_WORDS = {
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10
+}
+_WORD_ALT = '|'.join(NUMBER_WORDS)
+
+DEFAULT_DIFFICULTY = (('easy', 2), ('medium', 2), ('hard', 1))
+
+
+# Grammar of the spec language: each rule is matched where it first occurs
+# in the query (``sections`` at every occurrence, left to right, without
+# overlap). Matching is case-insensitive.
+GRAMMAR = {
+    'paper': r'(\d+)\s*(?:question\s+paper|papers?|sets?|exams?)',
+    'questions': r'(\d+)\s*(?:questions?|qs?|problems?)(?:\s+(?:each|per\s+paper))?',
+    'sections': rf'(?:({_WORD_ALT}|\d+)\s+)((?:{_WORD_ALT}|\d+))\s*mark[s]?\s*(?:questions?)?',
+    'medium_hard_each_section': r'one\s+medium\s+and\s+one\s+hard\s+in\s+each\s+section',
+    'all_level': r'all\s+(easy|medium|hard)',
+    'time': r'(?:time|duration)\s*(?:is\s*)?(\d+)\s*minutes?',
+    'marks': r'(\d+)\s*marks?(?:\s+each)?',
+    'all_count_level': r'all\s+(?:(\d+)\s+)?(easy|medium|hard)',
+    'count_level': r'(\d+)\s+(easy|medium|hard)',
+    'level_mix_strict': r'(\d+)\s+easy.*?(\d+)\s+medium.*?(\d+)\s+hard',
+    'level_mix': r'(\d+)\s*easy.*?(\d+)\s*medium.*?(\d+)\s*hard',
+}
+
+# Every rule starts with a number, a number word, "all" or "time"/"duration",
+# so the tokenizer only visits those positions (overlapping ones included).
+# A rule that fails at the first digit of a number also fails inside it, so
+# inner digits are skipped.
+_TOKENS = rf'(?=(?P<digit>(?<!\d)\d)|(?P<word>{_WORD_ALT})|(?P<all>all)|(?P<time>time|duration))'
+_TOKEN_RULES = {
+    'digit': ('paper', 'questions', 'sections', 'marks', 'count_level', 'level_mix_strict', 'level_mix'),
+    'word': ('sections', 'medium_hard_each_section'),
+    'all': ('all_level', 'all_count_level'),
+    'time': ('time',),
+}
+
+
+def _compile(flags: int):
+    rules = {name: re.compile(pattern, flags) for name, pattern in GRAMMAR.items()}
+    by_token = {
+        kind: tuple((name, rules[name].match) for name in names) for kind, names in _TOKEN_RULES.items()
+    }
+    return re.compile(_TOKENS, flags), by_token
+
+
+# IGNORECASE defeats the regex engine's literal-prefix scanning, so ASCII
+# queries are lowercased (same length, same positions) and matched
+# case-sensitively. Other queries keep IGNORECASE, whose Unicode folding
+# ('ſ' matches 's') lowercasing would not reproduce.
+_ASCII_SCANNER = _compile(0)
+_UNICODE_SCANNER = _compile(re.IGNORECASE)
+
+
+def _to_int(token: str) -> int:
+    token = token.lower()
+    return int(token) if token.isdigit() else NUMBER_WORDS.get(token, 0)
+
+
+@dataclass(frozen=True)
+class ExamSection:
+    count: int
+    marks: int
+    difficulties: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class ExamSpec:
+    """
+    What an exam request asks for. ``difficulty`` holds per-level question
+    counts (uniform papers); ``sections`` replaces it for papers with
+    variable marks.
+    """
+    paper_count: int = 5
+    questions_per_paper: int = 5
+    marks_per_question: int = 10
+    difficulty: Tuple[Tuple[str, int], ...] = DEFAULT_DIFFICULTY
+    time_minutes: Optional[int] = None
+    sections: Optional[Tuple[ExamSection, ...]] = None
+
+    def replace(self, **changes) -> 'ExamSpec':
+        return replace(self, **changes)
+
+    def as_params(self) -> Dict:
+        """The dict shape ``parse_exam_paper_params`` has always returned (a fresh copy)."""
+        params = {
+            'paper_count': self.paper_count,
+            'questions_per_paper': self.questions_per_paper,
+            'marks_per_question': self.marks_per_question,
+            'difficulty': dict(self.difficulty),
+        }
+        if self.time_minutes is not None:
+            params['time_minutes'] = self.time_minutes
+        if self.sections is not None:
+            params['sections'] = [
+                {'count': s.count, 'marks': s.marks, 'difficulties': list(s.difficulties)} for s in self.sections
+            ]
+        return params
+
+    @classmethod
+    def from_params(cls, params: Dict) -> 'ExamSpec':
+        sections = params.get('sections')
+        return cls(
+            paper_count=params['paper_count'],
+            questions_per_paper=params['questions_per_paper'],
+            marks_per_question=params['marks_per_question'],
+            difficulty=tuple(params['difficulty'].items()),
+            time_minutes=params.get('time_minutes'),
+            sections=tuple(
+                ExamSection(s['count'], s['marks'], tuple(s['difficulties'])) for s in sections
+            ) if sections is not None else None,
+        )
+
+
+def _scan(query: str) -> Tuple[Dict, list]:
+    """One pass over the query: the first match of each rule, and all section matches."""
+    if query.isascii():
+        query = query.lower()
+        tokens, rules_by_token = _ASCII_SCANNER
+    else:
+        tokens, rules_by_token = _UNICODE_SCANNER
+    first = {}
+    sections = []
+    section_end = 0
+    for token in tokens.finditer(query):
+        pos = token.start()
+        for name, match in rules_by_token[token.lastgroup]:
+            if name == 'sections':
+                if pos >= section_end:
+                    m = match(query, pos)
+                    if m:
+                        sections.append(m)
+                        section_end = m.end()
+            elif name not in first:
+                m = match(query, pos)
+                if m:
+                    first[name] = m
+    return first, sections
+
+
+def _plan_difficulties(count: int, marks: int, all_level: Optional[str], medium_hard_each: bool) -> Tuple[str, ...]:
+    plan = []
+    # PRIORITY 1: Global difficulty override (e.g., "all hard questions")
+    if all_level:
+        plan = [all_level] * count
+    # PRIORITY 2: Per-section medium/hard rule
+    elif medium_hard_each:
+        # Ensure at least one medium and one hard per section when possible
+        if count >= 2:
+            plan.extend(['medium', 'hard'])
+        # Fill remaining with easy, then alternate medium/hard
+        while len(plan) < count:
+            if 'easy' not in plan:
+                plan.append('easy')
+            else:
+                plan.append('medium' if (len(plan) % 2 == 0) else 'hard')
+    # PRIORITY 3: Default distribution based on marks; higher marks lean medium/hard
+    else:
+        if marks >= 10:
+            base = ['easy', 'medium', 'hard']
+        elif marks >= 4:
+            base = ['medium', 'hard', 'easy']
+        else:
+            base = ['medium', 'easy', 'hard']
+        i = 0
+        while len(plan) < count:
+            plan.append(base[i % len(base)])
+            i += 1
+    return tuple(plan[:count])
+
+
+@lru_cache(maxsize=EXAM_SPEC_CACHE_SIZE)
+def parse_exam_spec(query: str) -> ExamSpec:
+    """
+    Parse an exam request. Explicit specifications win; anything missing
+    falls back to the defaults (5 papers, 5 questions, 10 marks, 2-2-1
+    difficulty).
+    """
+    first, section_matches = _scan(query)
+    spec = {}
+
+    # Paper count (supports '1 paper', '1 exam', '1 question paper')
+    if 'paper' in first:
+        spec['paper_count'] = int(first['paper'].group(1))
+    # Questions per paper (uniform)
+    if 'questions' in first:
+        spec['questions_per_paper'] = int(first['questions'].group(1))
+    # Time override like 'duration is 30 minutes' or 'time 30 minutes'
+    if 'time' in first:
+        spec['time_minutes'] = int(first['time'].group(1))
+
+    # SECTION-BASED: "two 2 marks questions, two 4 marks questions, ..."
+    # (entries without a count before the marks are ignored)
+    sections = [(_to_int(m.group(1)), _to_int(m.group(2))) for m in section_matches]
+    sections = [(count, marks) for count, marks in sections if count > 0]
+    if sections:
+        all_level = first['all_level'].group(1).lower() if 'all_level' in first else None
+        medium_hard_each = 'medium_hard_each_section' in first
+        spec['sections'] = tuple(
+            ExamSection(count, marks, _plan_difficulties(count, marks, all_level, medium_hard_each))
+            for count, marks in sections
+        )
+        spec['questions_per_paper'] = sum(count for count, _ in sections)
+        # marks_per_question is irrelevant with sections but keeps the last marks for compatibility
+        spec['marks_per_question'] = sections[-1][1]
+        return ExamSpec(**spec)
+
+    # Uniform papers
+    if 'marks' in first:
+        spec['marks_per_question'] = int(first['marks'].group(1))
+
+    # Flexible difficulty overrides: "all hard", "all 5 hard", "3 easy", "2 easy 2 medium 1 hard"
+    level_count = None
+    if 'all_count_level' in first:
+        m = first['all_count_level']
+        count = int(m.group(1)) if m.group(1) else spec.get('questions_per_paper', ExamSpec.questions_per_paper)
+        level_count = (m.group(2).lower(), count)
+    elif 'count_level' in first and 'level_mix_strict' not in first:
+        m = first['count_level']
+        level_count = (m.group(2).lower(), int(m.group(1)))
+    if level_count:
+        level, count = level_count
+        difficulty = {'easy': 0, 'medium': 0, 'hard': 0}
+        difficulty[level] = count
+        spec['difficulty'] = tuple(difficulty.items())
+        spec['questions_per_paper'] = count
+        return ExamSpec(**spec)
+
+    if 'level_mix' in first:
+        easy, medium, hard = (int(g) for g in first['level_mix'].groups())
+        spec['difficulty'] = (('easy', easy), ('medium', medium), ('hard', hard))
+        spec['questions_per_paper'] = easy + medium + hard
+    return ExamSpec(**spec)
+
+
+def parse_exam_paper_params(query: str) -> Dict[str, any]:
+    """
+    Parse user query for exam paper generation parameters.
+    Returns dict with:
+      - paper_count
+      - questions_per_paper (if uniform) OR computed from sections
+      - marks_per_question (uniform) OR handled via 'sections'
+      - difficulty (fallback uniform distribution)
+      - sections: optional list like [{count:2, marks:2, difficulties:["medium","hard"]}, ...]
+
+    A mutable view of ``parse_exam_spec(query)``.
+    """
+    return parse_exam_spec(query).as_params()
+
+
+# Placeholders the cached templates are rendered with; the real context
+# and query are spliced in per request.
+_CONTEXT_SLOT = '\x00context\x00'
+_QUERY_SLOT = '\x00query\x00'
+
+
+@lru_cache(maxsize=EXAM_SPEC_CACHE_SIZE)
+def _prompt_template(spec: ExamSpec, paper_number: Optional[int]) -> Tuple[str, str, str]:
+    rendered = _render_exam_prompt(_QUERY_SLOT, _CONTEXT_SLOT, spec.as_params(), paper_number)
+    head, rest = rendered.split(_CONTEXT_SLOT)
+    middle, tail = rest.split(_QUERY_SLOT)
+    return head, middle, tail
+
+
+def generate_exam_paper_prompt(query: str, context: str, params, paper_number: int = None) -> str:
+    """
+    Generate a comprehensive prompt for exam paper generation from an
+    ``ExamSpec`` (or the params dict). Supports either uniform
+    marks/difficulty or section-based variable marks. With
+    ``paper_number`` the prompt asks for that one paper of a batch
+    generated in parallel (see exam_papers.py).
+    """
+    spec = params if isinstance(params, ExamSpec) else ExamSpec.from_params(params)
+    head, middle, tail = _prompt_template(spec, paper_number)
+    return f"{head}{context}{middle}{query}{tail}"
+
+
+def _render_exam_prompt(query: str, context: str, params: Dict[str, any], paper_number: int = None) -> str:
+    paper_count = params['paper_count']
+    # One paper of a parallel batch is told its number; a whole batch keeps
+    # each template's original wording.
+    numbering = f"Replace [NUMBER] with {paper_number}." if paper_number else None
+    questions_per_paper = params['questions_per_paper']
+    sections = params.get('sections')
+
+    if sections:
+        # Compute total marks from sections using difficulties length as question count
+        total_marks = sum(s['marks'] * len(s['difficulties']) for s in sections)
+        section_desc = ", ".join([f"{len(s['difficulties'])}×{s['marks']} marks" for s in sections])
+        time_override = params.get('time_minutes', 90)
+        prompt = f"""You are an expert exam paper creator. Generate {paper_count} complete examination papers based STRICTLY on the provided study material context below.
+
+**REQUIREMENTS:**
+- Generate exactly {paper_count} examination papers
+- Each paper must contain exactly {questions_per_paper} questions
+- Marks per paper: {total_marks} (sections: {section_desc})
+- Follow the specified difficulty per question as indicated in the template below
+- Questions MUST be based on the provided context only
+- Questions should be clear, unambiguous, and academically rigorous
+
+**DIFFICULTY LEVELS:**
+- Easy: Direct recall, definitions, basic concepts
+- Medium: Application, analysis, comparisons
+- Hard: Synthesis, critical evaluation, complex problem-solving
+
+**FORMATTING:**
+Use EXACTLY this format for each paper and for every question:
+"""
+
+        qn = 1
+        for s in sections:
+            for diff in s['difficulties']:
+                prompt += f"\n**Question {qn} ({diff.capitalize()} - {s['marks']} marks)**\n[Question text here]\n"
+                qn += 1
+
+        prompt += f"""
+
+At the very beginning of each paper include these lines:
+---
+**EXAMINATION PAPER [NUMBER]**
+**Total Marks: {total_marks}**
+**Time: {time_override} minutes**
+---
+
+{numbering or "Replace [NUMBER] with 1, 2, 3, ... for each paper."}
+
+**STUDY MATERIAL CONTEXT:**
+{context}
+
+**USER REQUEST:**
+{query}
+
+⚠️ CRITICAL INSTRUCTION: You MUST generate questions with EXACTLY the difficulty levels shown in the template above. 
+- If a question shows "(Hard - 2 marks)", it MUST be a Hard question.
+- If a question shows "(Easy - 2 marks)", it MUST be an Easy question.
+- DO NOT change the difficulty levels under any circumstances.
+- DO NOT mix difficulties - follow the template exactly.
+
+Generate all {paper_count} exam papers now, following the format and difficulty requirements EXACTLY."""
+
+        return prompt
+
+    # Uniform case (backward compatible)
+    marks_per_question = params['marks_per_question']
+    difficulty = params['difficulty']
+    total_marks = questions_per_paper * marks_per_question
+    time_override = params.get('time_minutes', int(total_marks * 1.2))
+
+    # Build difficulty distribution string
+    difficulty_parts = []
+    if difficulty['easy'] > 0:
+        difficulty_parts.append(f"{difficulty['easy']} Easy")
+    if difficulty['medium'] > 0:
+        difficulty_parts.append(f"{difficulty['medium']} Medium")
+    if difficulty['hard'] > 0:
+        difficulty_parts.append(f"{difficulty['hard']} Hard")
+    difficulty_str = ", ".join(difficulty_parts) if difficulty_parts else "As specified"
+
+    prompt = f"""You are an expert exam paper creator. Generate {paper_count} complete examination papers based STRICTLY on the provided study material context below.
+
+**REQUIREMENTS:**
+- Generate exactly {paper_count} examination papers
+- Each paper must have exactly {questions_per_paper} questions
+- Each question carries {marks_per_question} marks (Total: {total_marks} marks per paper)
+- Difficulty distribution PER PAPER: {difficulty_str} questions
+- Questions MUST be based on the provided context - do not create questions on topics not covered in the context
+- Questions should be clear, unambiguous, and academically rigorous
+- Include a mix of question types: theoretical, analytical, application-based, and problem-solving
+
+**DIFFICULTY LEVELS:**
+- Easy: Direct recall, definitions, basic concepts
+- Medium: Application of concepts, analysis, comparison, moderate problem-solving
+- Hard: Synthesis, critical evaluation, complex problem-solving, advanced applications
+
+**FORMATTING:**
+For each paper, use this EXACT format:
+
+---
+**EXAMINATION PAPER [NUMBER]**
+**Total Marks: {total_marks}**
+**Time: {time_override} minutes**
+"""
+
+    # Generate question template dynamically based on difficulty distribution
+    question_num = 1
+    for _ in range(difficulty['easy']):
+        prompt += f"\n**Question {question_num} (Easy - {marks_per_question} marks)**\n[Question text here]\n"
+        question_num += 1
+    for _ in range(difficulty['medium']):
+        prompt += f"\n**Question {question_num} (Medium - {marks_per_question} marks)**\n[Question text here]\n"
+        question_num += 1
+    for _ in range(difficulty['hard']):
+        prompt += f"\n**Question {question_num} (Hard - {marks_per_question} marks)**\n[Question text here]\n"
+        question_num += 1
+
+    prompt += f"""---
+
+{numbering or "Replace [NUMBER] with 1, 2, 3, etc. for each paper."}
+
+**STUDY MATERIAL CONTEXT:**
+{context}
+
+**USER REQUEST:**
+{query}
+
+Generate all {paper_count} exam papers now, following the format exactly. Ensure questions are diverse, cover different aspects of the material, and maintain academic quality. 
+
+IMPORTANT: You MUST follow the user's difficulty requirements exactly. If they request "all 5 hard questions", generate ALL questions as Hard difficulty. Do NOT refuse or suggest alternatives - generate exactly what is requested."""
+
+    return prompt
@@ -0,0 +1,217 @@
+import os
+import re
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import AsyncIterator, Callable, Dict, Iterator, List
+
+try:
+    from langchain_core.embeddings import Embeddings
+except Exception:
+    Embeddings = object
+
+
+class FakeProviderError(Exception):
+    """A provider-side failure (``status_code`` like an HTTP API error), raised by FakeChatModel."""
+
+    def __init__(self, message: str, status_code: int = 503):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class FakeMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeChatModel:
+    """
+    Offline stand-in for ``ChatGroq`` with the same ``invoke``/``stream``
+    (and async ``ainvoke``/``astream``) shape.
+
+    Replies are built from ``reply`` (or an echo of the prompt's last line)
+    split into whitespace tokens. ``latency`` is the time before the first
+    token and ``tokens_per_second`` paces the rest, so streaming, timeouts
+    and load behaviour can be exercised without network access or an API key.
+
+    Flaky providers are simulated per call: with probability ``slow_rate``
+    the first token takes ``slow_latency`` instead, and with probability
+    ``fail_rate`` the call raises a ``FakeProviderError`` (503) after its
+    latency; ``fail`` makes every call raise.
+    """
+
+    def __init__(self, reply: str = None, latency: float = 0.05, tokens_per_second: float = 200.0, fail: Exception = None,
+                 fail_rate: float = 0.0, slow_rate: float = 0.0, slow_latency: float = 2.0, seed: int = None):
+        self.reply = reply
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.fail = fail
+        self.fail_rate = fail_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    def _draw(self):
+        """This call's latency before the first token, and the error it ends with (if any)."""
+        self.calls += 1
+        latency = self.slow_latency if self.slow_rate and self._rng.random() < self.slow_rate else self.latency
+        if self.fail is not None:
+            return latency, self.fail
+        if self.fail_rate and self._rng.random() < self.fail_rate:
+            return latency, FakeProviderError("Fake provider error: service unavailable")
+        return latency, None
+
+    def _tokens(self, prompt) -> List[str]:
+        text = self.reply
+        if text is None:
+            last_line = str(prompt).strip().splitlines()[-1] if str(prompt).strip() else ""
+            text = f"Fake answer for: {last_line[:200]}"
+        words = text.split(' ')
+        return [w if i == 0 else f" {w}" for i, w in enumerate(words)]
+
+    def stream(self, prompt) -> Iterator[FakeMessage]:
+        latency, error = self._draw()
+        time.sleep(latency)
+        if error is not None:
+            raise error
+        delay = 1.0 / self.tokens_per_second if self.tokens_per_second else 0
+        for token in self._tokens(prompt):
+            if delay:
+                time.sleep(delay)
+            yield FakeMessage(token)
+
+    def invoke(self, prompt) -> FakeMessage:
+        return FakeMessage("".join(chunk.content for chunk in self.stream(prompt)))
+
+    async def astream(self, prompt) -> AsyncIterator[FakeMessage]:
+        latency, error = self._draw()
+        await asyncio.sleep(latency)
+        if error is not None:
+            raise error
+        delay = 1.0 / self.tokens_per_second if self.tokens_per_second else 0
+        for token in self._tokens(prompt):
+            if delay:
+                await asyncio.sleep(delay)
+            yield FakeMessage(token)
+
+    async def ainvoke(self, prompt) -> FakeMessage:
+        return FakeMessage("".join([chunk.content async for chunk in self.astream(prompt)]))
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic bag-of-words embeddings from hashed tokens.
+
+    Each token adds a +/-1 at a hashed coordinate, and the vector is then
+    L2-normalized. Texts that share words end up close together, which is
+    enough for offline benchmarks and tests without downloading a model.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        # Cache key for these vectors, so they never pass for a real model's.
+        self.model_name = f"fake/hashing-{dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(token.encode('utf-8')).digest()
+            index = int.from_bytes(digest[:4], 'little') % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class CostModelEmbeddings(HashingEmbeddings):
+    """
+    HashingEmbeddings that also charge a simulated inference cost.
+
+    Every ``embed_documents`` call costs ``call_ms`` plus ``text_ms`` per
+    text, during which it holds an exclusive lock on ``lock_path``. The lock
+    is shared by every process on the machine, modelling one transformer
+    forward pass that keeps all cores busy: concurrent calls from separate
+    processes time-share instead of running in parallel, and batching pays
+    the per-call overhead once. That is the trade-off the shared embedding
+    server exists for. Without ``fcntl`` (Windows) the lock only spans this
+    process.
+    """
+
+    def __init__(self, dim: int = 384, call_ms: float = 20.0, text_ms: float = 1.0,
+                 lock_path: str = '/tmp/rag-fake-embeddings.lock'):
+        super().__init__(dim)
+        self.call_ms = call_ms
+        self.text_ms = text_ms
+        self.lock_path = lock_path
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        self._fcntl = fcntl
+        self._local_lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        cost = (self.call_ms + self.text_ms * len(texts)) / 1000.0
+        if self._fcntl is None:
+            with self._local_lock:
+                time.sleep(cost)
+            return super().embed_documents(texts)
+        with open(self.lock_path, 'a') as lock:
+            self._fcntl.flock(lock, self._fcntl.LOCK_EX)
+            try:
+                time.sleep(cost)
+            finally:
+                self._fcntl.flock(lock, self._fcntl.LOCK_UN)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def fake_embeddings_from_env():
+    """
+    Build offline embeddings when ``FAKE_EMBEDDINGS=1`` is set, else return
+    None. ``FAKE_EMBED_CALL_MS``/``FAKE_EMBED_TEXT_MS`` add a simulated
+    inference cost (see CostModelEmbeddings).
+    """
+    if os.environ.get("FAKE_EMBEDDINGS") != "1":
+        return None
+    call_ms = float(os.environ.get("FAKE_EMBED_CALL_MS", 0))
+    text_ms = float(os.environ.get("FAKE_EMBED_TEXT_MS", 0))
+    if call_ms or text_ms:
+        return CostModelEmbeddings(call_ms=call_ms, text_ms=text_ms)
+    return HashingEmbeddings()
+
+
+def fake_llm_from_env():
+    """Build a FakeChatModel when ``FAKE_LLM=1`` is set, else return None."""
+    if os.environ.get("FAKE_LLM") != "1":
+        return None
+    return FakeChatModel(
+        latency=float(os.environ.get("FAKE_LLM_LATENCY", 0.05)),
+        tokens_per_second=float(os.environ.get("FAKE_LLM_TOKENS_PER_SECOND", 200)),
+        fail_rate=float(os.environ.get("FAKE_LLM_FAIL_RATE", 0)),
+        slow_rate=float(os.environ.get("FAKE_LLM_SLOW_RATE", 0)),
+        slow_latency=float(os.environ.get("FAKE_LLM_SLOW_LATENCY", 2.0))
+    )
+
+
+def fake_llm_factories_from_env() -> Dict[str, Callable]:
+    """
+    Client factories for the fake models named in ``FAKE_LLM_MODELS``
+    (default ``Fake-LLM``) when ``FAKE_LLM=1`` is set, so the LLM gateway's
+    pooling and failover can be exercised offline. Empty otherwise.
+    """
+    if os.environ.get("FAKE_LLM") != "1":
+        return {}
+    names = [n.strip() for n in os.environ.get("FAKE_LLM_MODELS", "Fake-LLM").split(',') if n.strip()]
+    return {name: fake_llm_from_env for name in names}
@@ -0,0 +1,138 @@
+import os
+import codecs
+from html.parser import HTMLParser
+from typing import Callable, Dict, Iterable
+
+try:
+    from bs4 import BeautifulSoup
+except Exception:
+    BeautifulSoup = None
+
+try:
+    from selectolax.parser import HTMLParser as LexborParser
+except Exception:
+    LexborParser = None
+
+# Which engine extracts page text: "streaming" (stdlib, stops at the budget),
+# "selectolax" (fast C parser, if installed) or "bs4" (the original path).
+HTML_EXTRACTOR = os.environ.get("HTML_EXTRACTOR", "streaming")
+WEB_MAX_PAGE_BYTES = int(os.environ.get("WEB_MAX_PAGE_BYTES", 2 * 1024 * 1024))
+READ_CHUNK_BYTES = 16 * 1024
+
+# Elements whose text is never useful as study context.
+BOILERPLATE_TAGS = {
+    'script', 'style', 'noscript', 'template', 'svg', 'canvas', 'iframe',
+    'nav', 'header', 'footer', 'aside', 'form', 'button', 'select',
+}
+
+
+class _BudgetReached(Exception):
+    pass
+
+
+class _TextCollector(HTMLParser):
+    """Collects visible text lines, skipping boilerplate, until ``limit`` chars."""
+
+    def __init__(self, limit: int):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.lines = []
+        self.length = 0
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in BOILERPLATE_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in BOILERPLATE_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        text = data.strip()
+        if not text:
+            return
+        self.lines.append(text)
+        # +1 for the newline that joins lines
+        self.length += len(text) + 1
+        if self.length >= self.limit:
+            raise _BudgetReached()
+
+    def text(self) -> str:
+        return "\n".join(self.lines)[:self.limit]
+
+
+def extract_streaming(chunks: Iterable[str], limit: int) -> str:
+    """Parse HTML text chunks incrementally and stop as soon as ``limit`` chars are collected."""
+    collector = _TextCollector(limit)
+    try:
+        for chunk in chunks:
+            collector.feed(chunk)
+        collector.close()
+    except _BudgetReached:
+        pass
+    return collector.text()
+
+
+def extract_bs4(html: str, limit: int) -> str:
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup.get_text(separator='\n', strip=True)[:limit]
+
+
+def extract_selectolax(html: str, limit: int) -> str:
+    tree = LexborParser(html)
+    tree.strip_tags(list(BOILERPLATE_TAGS))
+    root = tree.body or tree.root
+    if root is None:
+        return ""
+    return root.text(separator='\n', strip=True)[:limit]
+
+
+EXTRACTORS: Dict[str, Callable[[str, int], str]] = {
+    'streaming': lambda html, limit: extract_streaming([html], limit),
+    'bs4': extract_bs4,
+}
+if LexborParser is not None:
+    EXTRACTORS['selectolax'] = extract_selectolax
+
+
+def get_extractor(name: str = None) -> Callable[[str, int], str]:
+    name = name or HTML_EXTRACTOR
+    if name not in EXTRACTORS:
+        print(f"⚠️ HTML extractor '{name}' unavailable, using 'streaming'")
+        name = 'streaming'
+    return EXTRACTORS[name]
+
+
+def _decoded_chunks(response, max_bytes: int):
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+    received = 0
+    for raw in response.iter_content(chunk_size=READ_CHUNK_BYTES):
+        received += len(raw)
+        if received > max_bytes:
+            raw = raw[:len(raw) - (received - max_bytes)]
+        yield decoder.decode(raw)
+        if received >= max_bytes:
+            return
+    yield decoder.decode(b'', final=True)
+
+
+def fetch_text(session, url: str, limit: int, timeout: float,
+               extractor: str = None, max_bytes: int = WEB_MAX_PAGE_BYTES) -> str:
+    """
+    Download ``url`` and return at most ``limit`` chars of visible text.
+
+    The body is streamed and never more than ``max_bytes`` is read. With
+    the streaming extractor the download also stops as soon as enough text
+    has been collected; other extractors parse the capped body in one go.
+    """
+    name = extractor or HTML_EXTRACTOR
+    with session.get(url, timeout=timeout, stream=True) as response:
+        # An error page is not content; the caller falls back to the snippet.
+        response.raise_for_status()
+        chunks = _decoded_chunks(response, max_bytes)
+        if name == 'streaming' or name not in EXTRACTORS:
+            return extract_streaming(chunks, limit)
+        return get_extractor(name)("".join(chunks), limit)
@@ -0,0 +1,482 @@
+import os
+import json
+import time
+import shutil
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from doc_router import DOC_ROUTER_MIN_CHUNKS, DOC_ROUTER_TOP_N, DocumentRouter
+from retrieval import BM25Index, HybridRetriever, SharedPostings
+from native_store import chunk_row
+from vector_index import INDEX_FORMAT, VectorShard, faiss, search_shards
+
+INDEX_MEMORY_BUDGET_MB = int(os.environ.get("INDEX_MEMORY_BUDGET_MB", 512))
+MANIFEST_DIRNAME = '_manifests'
+# Content-addressed per-PDF stores shared by every user who uploads the same bytes.
+SHARED_DIRNAME = '_docs'
+
+
+def user_vector_paths(vector_dir: str, user_email: str) -> List[str]:
+    """All on-disk stores named ``{user_email}_{pdf_hash}``, oldest first."""
+    if not os.path.isdir(vector_dir):
+        return []
+    paths = []
+    for name in os.listdir(vector_dir):
+        owner, sep, _ = name.rpartition('_')
+        if sep and owner == user_email:
+            paths.append(os.path.join(vector_dir, name))
+    return sorted(paths, key=os.path.getmtime)
+
+
+def shared_vector_path(vector_dir: str, pdf_hash: str) -> str:
+    return os.path.join(vector_dir, SHARED_DIRNAME, pdf_hash)
+
+
+def hash_referenced_elsewhere(vector_dir: str, pdf_hash: str, user_email: str) -> bool:
+    """True if any other user's manifest still includes ``pdf_hash``."""
+    manifest_dir = os.path.join(vector_dir, MANIFEST_DIRNAME)
+    if not os.path.isdir(manifest_dir):
+        return False
+    for name in os.listdir(manifest_dir):
+        if not name.endswith('.json') or name == f"{user_email}.json":
+            continue
+        try:
+            with open(os.path.join(manifest_dir, name), 'r', encoding='utf-8') as f:
+                if pdf_hash in json.load(f).get('documents', {}):
+                    return True
+        except (OSError, ValueError):
+            # Unreadable manifest: assume it may reference the store.
+            return True
+    return False
+
+
+class StorePins:
+    """
+    Shared stores that uploads are building, reusing or still registering.
+
+    A store only shows up in a manifest once its upload has finished, so
+    ``hash_referenced_elsewhere`` alone could let a delete remove a store
+    another user's upload is in the middle of. Uploads pin their vector
+    paths for the whole job; ``delete_if_unreferenced`` checks pins and
+    manifests and deletes under the same lock, so an upload arriving
+    during the delete waits for it and then builds the store afresh.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()
+
+    @contextmanager
+    def pinned(self, vector_paths: List[str]):
+        with self._lock:
+            self._counts.update(vector_paths)
+        try:
+            yield
+        finally:
+            with self._lock:
+                for path in vector_paths:
+                    self._counts[path] -= 1
+                    if not self._counts[path]:
+                        del self._counts[path]
+
+    def delete_if_unreferenced(self, vector_dir: str, vector_path: str, pdf_hash: str, user_email: str) -> bool:
+        with self._lock:
+            if (self._counts[vector_path] or not os.path.isdir(vector_path)
+                    or hash_referenced_elsewhere(vector_dir, pdf_hash, user_email)):
+                return False
+            shutil.rmtree(vector_path, ignore_errors=True)
+            return True
+
+
+def manifest_path(vector_dir: str, user_email: str) -> str:
+    return os.path.join(vector_dir, MANIFEST_DIRNAME, f"{user_email}.json")
+
+
+def load_manifest(vector_dir: str, user_email: str) -> Optional[Dict]:
+    path = manifest_path(vector_dir, user_email)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(vector_dir: str, user_email: str, manifest: Dict):
+    path = manifest_path(vector_dir, user_email)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class UserIndex:
+    """
+    One user's searchable library: a vector shard per PDF plus the manifest.
+
+    Each PDF's shard searches the shared, content-addressed store on disk
+    (memory-mapped by default), so appending or removing a document only
+    touches that document and nothing is ever rebuilt. Dense search runs
+    over every shard in scope (or the ones the router picks for large
+    libraries) and merges by distance. The manifest maps each PDF
+    hash to its store and is what rehydration reads; the store itself is
+    only deleted once no manifest or in-flight upload references it.
+    BM25 postings come from ``postings``, shared with every other user
+    index holding the same store; ``close`` gives them back.
+    """
+
+    def __init__(self, user_email: str, vector_dir: str, manifest: Optional[Dict] = None, embedding=None,
+                 pins: Optional[StorePins] = None, postings: Optional[SharedPostings] = None):
+        self.user_email = user_email
+        self.vector_dir = vector_dir
+        self.pins = pins or StorePins()
+        self.postings = postings or SharedPostings()
+        # Store whose shared postings each document holds, released on removal or close.
+        self._postings_paths: Dict[str, str] = {}
+        self.manifest = manifest or {'user_email': user_email, 'documents': {}}
+        self.embedding = embedding
+        self.shards: Dict[str, VectorShard] = {}
+        self.retriever = HybridRetriever(self)
+        self.bm25 = BM25Index()
+        self.router = DocumentRouter()
+        self.lock = threading.RLock()
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard.ntotal for shard in self.shards.values())
+
+    def has_document(self, pdf_hash: str) -> bool:
+        return pdf_hash in self.shards
+
+    def documents(self) -> List[Dict]:
+        with self.lock:
+            return [dict(meta, hash=h) for h, meta in self.manifest['documents'].items()]
+
+    def add_document(self, pdf_hash: str, filename: str, vector_path: str, persist=True) -> bool:
+        """Append one per-document store from disk. Returns False if it was already present."""
+        with self.lock:
+            if pdf_hash in self.shards:
+                return False
+            shard = VectorShard.load(pdf_hash, vector_path)
+            self.bm25.add(pdf_hash, self.postings.acquire(vector_path, shard))
+            self._postings_paths[pdf_hash] = vector_path
+            self.shards[pdf_hash] = shard
+            self.router.reset()
+            self.manifest['documents'].setdefault(pdf_hash, {
+                'filename': filename or shard.first_source(),
+                'vector_path': vector_path,
+                'chunks': shard.ntotal,
+                'added_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            })
+            if persist:
+                save_manifest(self.vector_dir, self.user_email, self.manifest)
+            return True
+
+    def remove_document(self, pdf_hash: str) -> bool:
+        with self.lock:
+            meta = self.manifest['documents'].pop(pdf_hash, None)
+            shard = self.shards.pop(pdf_hash, None)
+            if meta is None and shard is None:
+                return False
+            self.bm25.remove(pdf_hash)
+            if pdf_hash in self._postings_paths:
+                self.postings.release(self._postings_paths.pop(pdf_hash))
+            self.router.reset()
+            save_manifest(self.vector_dir, self.user_email, self.manifest)
+            if meta:
+                self.pins.delete_if_unreferenced(self.vector_dir, meta['vector_path'], pdf_hash, self.user_email)
+            return True
+
+    def search_scope(self, filters) -> Optional[Dict]:
+        """
+        What a ``DocumentFilter`` leaves searchable: the matching documents'
+        hashes, each mapped to the sorted rows inside the page range (None
+        for every row). Documents match by hash or filename; ones with no
+        chunk in range are left out. None when there is no filter.
+        """
+        if filters is None:
+            return None
+        with self.lock:
+            shards = dict(self.shards)
+            filenames = {h: meta.get('filename') for h, meta in self.manifest['documents'].items()}
+        if filters.documents is None:
+            hashes = list(shards)
+        else:
+            wanted = set(filters.documents)
+            hashes = [h for h in shards if h in wanted or filenames.get(h) in wanted]
+        pages = filters.page_indexes()
+        scope = {}
+        for pdf_hash in hashes:
+            rows = shards[pdf_hash].page_rows(*pages) if pages else None
+            if rows is None or len(rows):
+                scope[pdf_hash] = rows
+        return scope
+
+    def dense_search(self, vector, k: int, scope: Optional[Dict] = None) -> List[str]:
+        """
+        Chunk keys of the ``k`` nearest chunks across this user's documents,
+        or only the rows ``scope`` allows (see ``search_scope``).
+        """
+        with self.lock:
+            shards = dict(self.shards)
+        candidates = shards if scope is None else {h: shards[h] for h in scope if h in shards}
+        if not candidates:
+            return []
+        chunks = sum(shard.ntotal if scope is None or scope[h] is None else len(scope[h])
+                     for h, shard in candidates.items())
+        selected = self.router.select(candidates, vector, shards, chunks)
+        return search_shards([candidates[h] for h in selected], vector, k, scope)
+
+    def get_document(self, doc_id: str):
+        shard = self.shards.get(chunk_row(doc_id)[0])
+        return shard.get(doc_id) if shard else None
+
+    def chunk_vector(self, doc_id: str):
+        pdf_hash, row = chunk_row(doc_id)
+        shard = self.shards.get(pdf_hash)
+        return shard.store.vectors[row] if shard else None
+
+    def close(self):
+        """
+        Give back this index's shared postings (it was evicted or invalidated).
+        Searches already running keep working on the postings they hold.
+        """
+        with self.lock:
+            for vector_path in self._postings_paths.values():
+                self.postings.release(vector_path)
+            self._postings_paths.clear()
+
+    def size_bytes(self) -> int:
+        """Private memory estimate: shard metadata plus this user's share of each document's postings."""
+        with self.lock:
+            postings = self.bm25.documents()
+            paths = dict(self._postings_paths)
+        shared = sum(
+            doc.size_bytes() / max(1, self.postings.references(paths.get(h, ''))) for h, doc in postings.items()
+        )
+        return sum(shard.resident_bytes() for shard in self.shards.values()) + int(shared)
+
+    def mapped_bytes(self) -> int:
+        return sum(shard.mapped_bytes() for shard in self.shards.values())
+
+
+class IndexRegistry:
+    """
+    LRU of per-user indexes with a memory budget.
+
+    A user's index is rebuilt from their manifest on first use after a
+    restart, so chat works without re-uploading. When the estimated private
+    size of all cached indexes exceeds the budget, least recently used users
+    are evicted (they will be reloaded from disk on their next request).
+    Memory-mapped vectors live in the shared page cache and are reported
+    separately as ``mapped_bytes`` rather than counted against the budget.
+    """
+
+    def __init__(self, vector_dir: str, get_embedding_model, budget_bytes: int = INDEX_MEMORY_BUDGET_MB * 1024 * 1024,
+                 on_change=None):
+        self.vector_dir = vector_dir
+        self._get_embedding_model = get_embedding_model
+        self.budget_bytes = budget_bytes
+        # Shared with the upload jobs, which pin the stores they are working on.
+        self.pins = StorePins()
+        # BM25 postings, loaded once per store for all users holding it.
+        self.postings = SharedPostings()
+        # Called with the user's email whenever documents are added or removed.
+        self._on_change = on_change
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'loads': 0,
+            'load_seconds': 0.0,
+            'evictions': 0,
+        }
+
+    def get_user_index(self, user_email: str, create=False) -> Optional[UserIndex]:
+        entry = self._get_entry(user_email)
+        if entry is None and create:
+            with self._lock:
+                entry = self._entries.get(user_email) or self._store(
+                    user_email, UserIndex(user_email, self.vector_dir, embedding=self._get_embedding_model(),
+                                          pins=self.pins, postings=self.postings)
+                )
+        return entry['index'] if entry else None
+
+    def get_retriever(self, user_email: str):
+        user_index = self.get_user_index(user_email)
+        return user_index.retriever if user_index else None
+
+    def add_documents(self, user_email: str, documents: List[Dict]) -> List[str]:
+        """
+        Append ``documents`` (dicts with ``pdf_hash``, ``filename`` and
+        ``vector_path``) to the user's index. Hashes already in the manifest
+        are skipped. Returns the hashes appended.
+        """
+        user_index = self.get_user_index(user_email, create=True)
+        added = []
+        with user_index.lock:
+            for doc in documents:
+                if user_index.add_document(doc['pdf_hash'], doc['filename'], doc['vector_path']):
+                    added.append(doc['pdf_hash'])
+        self._resize(user_email)
+        if added and self._on_change:
+            self._on_change(user_email)
+        return added
+
+    def remove_document(self, user_email: str, pdf_hash: str) -> bool:
+        user_index = self.get_user_index(user_email)
+        if user_index is None:
+            return False
+        removed = user_index.remove_document(pdf_hash)
+        self._resize(user_email)
+        if removed and self._on_change:
+            self._on_change(user_email)
+        return removed
+
+    def list_documents(self, user_email: str) -> List[Dict]:
+        user_index = self.get_user_index(user_email)
+        return user_index.documents() if user_index else []
+
+    def invalidate(self, user_email: str):
+        with self._lock:
+            entry = self._entries.pop(user_email, None)
+            if entry is not None:
+                entry['index'].close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._counters)
+            out['load_seconds'] = round(out['load_seconds'], 4)
+            out['resident_bytes'] = sum(e['bytes'] for e in self._entries.values())
+            out['mapped_bytes'] = sum(e['index'].mapped_bytes() for e in self._entries.values())
+            out['index_format'] = INDEX_FORMAT
+            out['budget_bytes'] = self.budget_bytes
+            out['users'] = len(self._entries)
+            routers = [e['index'].router.stats() for e in self._entries.values()]
+        out['bm25_postings'] = self.postings.stats()
+        out['router'] = {key: sum(r[key] for r in routers) for key in ('routed', 'flat', 'documents_skipped')}
+        out['router'].update(top_n=DOC_ROUTER_TOP_N, min_chunks=DOC_ROUTER_MIN_CHUNKS)
+        return out
+
+    def _get_entry(self, user_email: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(user_email)
+            if entry is not None:
+                self._entries.move_to_end(user_email)
+                self._counters['hits'] += 1
+                return entry
+            self._counters['misses'] += 1
+            load_lock = self._load_locks.setdefault(user_email, threading.Lock())
+
+        # Load outside the registry lock so other users are not blocked;
+        # the per-user lock stops two requests loading the same user twice.
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(user_email)
+            if entry is None:
+                user_index = self._load_from_disk(user_email)
+                with self._lock:
+                    self._load_locks.pop(user_email, None)
+                    entry = self._entries.get(user_email)
+                    # Users with nothing on disk are not cached, so they
+                    # cannot crowd real indexes out of the LRU.
+                    if entry is None and user_index is not None:
+                        entry = self._store(user_email, user_index)
+        return entry
+
+    def _legacy_manifest(self, user_email: str) -> Dict:
+        """
+        Build a manifest from ``{email}_{hash}`` directories written before
+        manifests existed, moving each store to its shared location (or
+        dropping it when another user already migrated the same hash).
+        """
+        documents = {}
+        for path in user_vector_paths(self.vector_dir, user_email):
+            pdf_hash = os.path.basename(path).rpartition('_')[2]
+            added_at = datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S")
+            shared_path = shared_vector_path(self.vector_dir, pdf_hash)
+            try:
+                if os.path.exists(shared_path):
+                    shutil.rmtree(path)
+                else:
+                    os.makedirs(os.path.dirname(shared_path), exist_ok=True)
+                    os.replace(path, shared_path)
+            except OSError as e:
+                print(f"⚠️ Could not migrate {path} to shared storage: {e}")
+                shared_path = path
+            documents[pdf_hash] = {
+                'filename': None,
+                'vector_path': shared_path,
+                'chunks': None,
+                'added_at': added_at
+            }
+        return {'user_email': user_email, 'documents': documents}
+
+    def _load_from_disk(self, user_email: str) -> Optional[UserIndex]:
+        embedding_model = self._get_embedding_model()
+        if faiss is None or embedding_model is None:
+            return None
+        manifest = load_manifest(self.vector_dir, user_email)
+        migrated = manifest is None
+        if migrated:
+            manifest = self._legacy_manifest(user_email)
+        if not manifest['documents']:
+            return None
+
+        t0 = time.perf_counter()
+        user_index = UserIndex(user_email, self.vector_dir, embedding=embedding_model, pins=self.pins,
+                               postings=self.postings)
+        for pdf_hash, meta in manifest['documents'].items():
+            user_index.manifest['documents'][pdf_hash] = meta
+            try:
+                user_index.add_document(pdf_hash, meta.get('filename'), meta['vector_path'], persist=False)
+            except Exception as e:
+                print(f"⚠️ Failed to load vector store {meta['vector_path']}: {e}")
+                user_index.manifest['documents'].pop(pdf_hash, None)
+                continue
+            shard = user_index.shards[pdf_hash]
+            meta['filename'] = meta.get('filename') or shard.first_source()
+            meta['chunks'] = shard.ntotal
+        if migrated:
+            save_manifest(self.vector_dir, user_email, user_index.manifest)
+        elapsed = time.perf_counter() - t0
+
+        with self._lock:
+            self._counters['loads'] += 1
+            self._counters['load_seconds'] += elapsed
+        print(f"Rehydrated {len(user_index.manifest['documents'])} vector stores for {user_email} in {elapsed:.2f}s")
+        return user_index if user_index.shards else None
+
+    def _store(self, user_email: str, user_index: UserIndex) -> Dict:
+        # Caller holds self._lock.
+        entry = {'index': user_index, 'bytes': user_index.size_bytes()}
+        self._entries[user_email] = entry
+        self._entries.move_to_end(user_email)
+        self._evict(keep=user_email)
+        return entry
+
+    def _resize(self, user_email: str):
+        with self._lock:
+            entry = self._entries.get(user_email)
+            if entry is not None:
+                entry['bytes'] = entry['index'].size_bytes()
+                self._evict(keep=user_email)
+
+    def _evict(self, keep: str):
+        # Shares of shared postings move as users come and go, so every size is refreshed.
+        for entry in self._entries.values():
+            entry['bytes'] = entry['index'].size_bytes()
+        resident = sum(e['bytes'] for e in self._entries.values())
+        for user_email in list(self._entries.keys()):
+            if resident <= self.budget_bytes:
+                break
+            if user_email == keep:
+                continue
+            entry = self._entries.pop(user_email)
+            entry['index'].close()
+            resident -= entry['bytes']
+            self._counters['evictions'] += 1
@@ -0,0 +1,269 @@
+import os
+import time
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Dict, List
+
+from native_store import (
+    ChunkWriter, NativeStore, chunk_key, iter_text_batches, store_exists, write_manifest, write_vectors
+)
+from metrics import STAGE_ITEMS, STAGE_SECONDS
+from pdf_stream import iter_chunks, iter_pages, summarize_pages
+from retrieval import build_bm25_data, save_bm25
+from vector_index import ensure_index_format, load_or_build_centroids
+
+# Parsing is CPU bound (PyMuPDF + splitting) so it fans out to processes;
+# embedding stays in-process because the model lives in this process.
+# Neither side holds a whole document: pages stream from the parser into
+# the store's text files, and chunks stream back out of them in batches.
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", os.cpu_count() or 1))
+INDEX_WORKERS = int(os.environ.get("INDEX_WORKERS", 2))
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 64))
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+_parse_pool = None
+_index_pool = None
+_pool_lock = threading.Lock()
+
+
+class StageStats:
+    """
+    Thread-safe busy-time and item counters for each ingestion stage. Every
+    record is also observed in the process-wide stage histograms
+    (``/metrics``) under ``route``.
+    """
+
+    UNITS = {
+        'hash': 'files',
+        'parse': 'pages',
+        'split': 'chunks',
+        'embed': 'vectors',
+        'index': 'vectors',
+        'load': 'files',
+    }
+
+    def __init__(self, route: str = 'upload'):
+        self.route = route
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._started = time.perf_counter()
+
+    def record(self, stage: str, items: int, seconds: float):
+        STAGE_SECONDS.observe(seconds, route=self.route, stage=stage)
+        STAGE_ITEMS.inc(items, route=self.route, stage=stage)
+        with self._lock:
+            entry = self._stages.setdefault(stage, {'items': 0, 'seconds': 0.0})
+            entry['items'] += items
+            entry['seconds'] += seconds
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            out = {}
+            for stage, entry in self._stages.items():
+                unit = self.UNITS.get(stage, 'items')
+                seconds = entry['seconds']
+                out[stage] = {
+                    unit: entry['items'],
+                    'seconds': round(seconds, 4),
+                    f'{unit}_per_s': round(entry['items'] / seconds, 2) if seconds > 0 else None,
+                }
+            out['wall_seconds'] = round(time.perf_counter() - self._started, 4)
+            return out
+
+
+def _get_pools():
+    global _parse_pool, _index_pool
+    with _pool_lock:
+        if _parse_pool is None:
+            try:
+                _parse_pool = ProcessPoolExecutor(max_workers=INGEST_WORKERS)
+            except Exception as e:
+                # Some sandboxes forbid fork/semaphores; parse on threads instead.
+                print(f"⚠️ Process pool unavailable, parsing on threads: {e}")
+                _parse_pool = ThreadPoolExecutor(max_workers=INGEST_WORKERS)
+        if _index_pool is None:
+            _index_pool = ThreadPoolExecutor(max_workers=INDEX_WORKERS)
+        return _parse_pool, _index_pool
+
+
+def start_pools():
+    """
+    Create the pools and start the parse workers now. The app calls this
+    at import, before it starts any thread: the workers are forked, and a
+    fork taken while other threads hold locks (the embedding batcher, job
+    workers, logging) can leave a child deadlocked on one of them.
+    """
+    parse_pool, _ = _get_pools()
+    if isinstance(parse_pool, ProcessPoolExecutor):
+        # Workers are started as tasks arrive; keep them all busy at once so every one is forked here.
+        for future in [parse_pool.submit(os.getpid) for _ in range(INGEST_WORKERS)]:
+            future.result()
+
+
+def parse_pdf(filepath: str, filename: str, pdf_hash: str, vector_path: str):
+    """
+    Parse and chunk a single PDF page by page into the text side of its
+    store. Runs inside a worker process.
+
+    Stores are shared by every user who uploads the same bytes, so chunk
+    metadata carries no per-user fields. The text splitter is imported
+    here rather than at module level: it is slow to import and only the
+    parse workers need it, so the web process starts faster.
+    """
+    from langchain_text_splitters import CharacterTextSplitter
+
+    splitter = CharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    page_seconds = []
+    split_seconds = 0.0
+    writer = ChunkWriter(vector_path)
+
+    def pages():
+        for page, seconds in iter_pages(filepath, filename, pdf_hash):
+            page_seconds.append(seconds)
+            yield page
+
+    try:
+        for chunks, seconds in iter_chunks(pages(), splitter):
+            split_seconds += seconds
+            writer.append([c.page_content for c in chunks], [c.metadata for c in chunks])
+    except BaseException:
+        writer.abort()
+        raise
+    return {
+        'store': writer.close(),
+        'pages': len(page_seconds),
+        'page_seconds': page_seconds,
+        'parse_seconds': sum(page_seconds),
+        'split_seconds': split_seconds,
+    }
+
+
+def embed_in_batches(vector_path: str, embedding_model, stats: StageStats, batch_size: int = EMBED_BATCH_SIZE) -> int:
+    """Embed a parsed store's chunks ``batch_size`` at a time, appending vectors as they come back."""
+    def batches():
+        for texts in iter_text_batches(vector_path, batch_size):
+            t0 = time.perf_counter()
+            vectors = embedding_model.embed_documents(texts)
+            stats.record('embed', len(texts), time.perf_counter() - t0)
+            yield vectors
+
+    return write_vectors(vector_path, batches())
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    value = fn(*args)
+    return value, time.perf_counter() - t0
+
+
+def build_index(vector_path: str, pdf_hash: str, stats: StageStats):
+    t0 = time.perf_counter()
+    store = NativeStore(vector_path)
+    # Sparse postings live beside the vectors so hybrid search never rebuilds them.
+    save_bm25(vector_path, build_bm25_data((chunk_key(pdf_hash, row), text) for row, text in store.iter_texts()))
+    # Quantized/graph formats and router centroids are built now so the first chat does not pay for them.
+    ensure_index_format(vector_path)
+    load_or_build_centroids(vector_path, store)
+    stats.record('index', store.count, time.perf_counter() - t0)
+
+
+def discard_partial_store(vector_path: str):
+    """Remove what a failed parse or embed left behind (a store without its manifest)."""
+    if not store_exists(vector_path):
+        shutil.rmtree(vector_path, ignore_errors=True)
+
+
+def prepare_existing_index(vector_path: str, stats: StageStats):
+    """
+    Reused stores are searched straight from disk by the index registry, so
+    nothing is loaded here; older stores are only migrated to the native
+    layout and get their configured index format built if it is missing.
+    """
+    t0 = time.perf_counter()
+    ensure_index_format(vector_path)
+    stats.record('load', 1, time.perf_counter() - t0)
+
+
+def run_pipeline(items: List[Dict], embedding_model, stats: StageStats = None, on_progress=None) -> List[Dict]:
+    """
+    Ingest a batch of already-hashed PDFs.
+
+    Each item needs ``filename``, ``filepath``, ``pdf_hash`` and
+    ``vector_path``. Parsing runs in the process pool and streams each
+    document's chunks to disk; finished documents are embedded in batches
+    as soon as they arrive, and index builds run on the index pool so they
+    overlap with the next document's parse and embed. Per-page parse times
+    are summarized in the ``page_parse`` timing.
+
+    Returns one result dict per item, in input order, with ``error`` set on
+    failure, plus per-file stage ``timings``.
+    ``on_progress(index, status)`` is called as each item changes stage.
+    """
+    stats = stats or StageStats()
+    parse_pool, index_pool = _get_pools()
+    results = [{'filename': item['filename'], 'error': None, 'reused': False, 'timings': {}} for item in items]
+
+    def progress(i, status):
+        if on_progress:
+            on_progress(i, status)
+
+    parse_futures = {}
+    index_futures = {}
+    for i, item in enumerate(items):
+        if store_exists(item['vector_path']):
+            print(f"Reusing existing embeddings for {item['filename']}")
+            results[i]['reused'] = True
+            progress(i, 'loading')
+            index_futures[index_pool.submit(
+                _timed, prepare_existing_index, item['vector_path'], stats
+            )] = (i, 'load')
+        else:
+            print(f"Creating new embeddings for {item['filename']}")
+            progress(i, 'parsing')
+            future = parse_pool.submit(
+                parse_pdf, item['filepath'], item['filename'], item['pdf_hash'], item['vector_path']
+            )
+            parse_futures[future] = i
+
+    for future in as_completed(parse_futures):
+        i = parse_futures[future]
+        try:
+            parsed = future.result()
+            text_side = parsed['store']
+            stats.record('parse', parsed['pages'], parsed['parse_seconds'])
+            for seconds in parsed['page_seconds']:
+                STAGE_SECONDS.observe(seconds, route=stats.route, stage='page_parse')
+            stats.record('split', text_side['count'], parsed['split_seconds'])
+            results[i]['timings'].update({
+                'parse': round(parsed['parse_seconds'], 4),
+                'split': round(parsed['split_seconds'], 4),
+                'page_parse': summarize_pages(parsed['page_seconds']),
+            })
+            progress(i, 'embedding')
+            vector_path = items[i]['vector_path']
+            dim, embed_seconds = _timed(embed_in_batches, vector_path, embedding_model, stats)
+            write_manifest(vector_path, text_side['count'], dim, text_side['shared'], text_side['columns'])
+            results[i]['timings']['embed'] = round(embed_seconds, 4)
+            progress(i, 'indexing')
+            index_futures[index_pool.submit(
+                _timed, build_index, vector_path, items[i]['pdf_hash'], stats
+            )] = (i, 'index')
+        except Exception as e:
+            discard_partial_store(items[i]['vector_path'])
+            results[i]['error'] = str(e)
+            progress(i, 'error')
+
+    for future in as_completed(index_futures):
+        i, stage = index_futures[future]
+        try:
+            _, seconds = future.result()
+            results[i]['timings'][stage] = round(seconds, 4)
+            progress(i, 'done')
+        except Exception as e:
+            results[i]['error'] = str(e)
+            progress(i, 'error')
+
+    return results
@@ -0,0 +1,193 @@
+import os
+import time
+import uuid
+import queue
+import threading
+from typing import Dict, List
+
+from index_registry import StorePins
+from ingest import StageStats, run_pipeline
+
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", 2))
+UPLOAD_QUEUE_SIZE = int(os.environ.get("UPLOAD_QUEUE_SIZE", 32))
+# Finished jobs are kept around this many at a time so clients can poll them.
+JOB_HISTORY_LIMIT = int(os.environ.get("JOB_HISTORY_LIMIT", 500))
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class UploadJobManager:
+    """
+    Runs upload ingestion on a fixed pool of background threads.
+
+    Jobs wait in a bounded queue; ``submit`` raises ``QueueFullError`` instead
+    of blocking the request thread when it is full. Files whose vector path is
+    already being built by another job are coalesced: the second job waits for
+    the first build and then reuses the saved index instead of embedding again.
+    Every vector path a job touches stays pinned in ``pins`` (the index
+    registry's ``StorePins``) until its documents are registered, so a
+    concurrent delete cannot remove a store the job is using.
+    """
+
+    def __init__(self, get_embedding_model, on_complete, workers=UPLOAD_WORKERS, queue_size=UPLOAD_QUEUE_SIZE,
+                 pins: StorePins = None):
+        self._get_embedding_model = get_embedding_model
+        self._on_complete = on_complete
+        self._pins = pins or StorePins()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jobs: Dict[str, Dict] = {}
+        self._finished: List[str] = []
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._workers = []
+        for n in range(workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"upload-worker-{n}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, user_email: str, items: List[Dict], request_id: str = None) -> Dict:
+        job_id = uuid.uuid4().hex
+        job = {
+            'job_id': job_id,
+            'request_id': request_id,
+            'user_email': user_email,
+            'status': 'queued',
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'files': [
+                {'filename': item['filename'], 'status': 'queued', 'error': None, 'reused': False, 'timings': {}}
+                for item in items
+            ],
+            'stats': None,
+            'error': None,
+            '_items': items,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job_id]
+            raise QueueFullError("Upload queue is full, try again shortly")
+        return self.get(job_id)
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return self._public_view(job)
+
+    def list_for_user(self, user_email: str) -> List[Dict]:
+        with self._lock:
+            return [self._public_view(j) for j in self._jobs.values() if j['user_email'] == user_email]
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @staticmethod
+    def _public_view(job: Dict) -> Dict:
+        view = {k: v for k, v in job.items() if not k.startswith('_')}
+        view['files'] = [dict(f) for f in job['files']]
+        return view
+
+    def _set_file(self, job, i, **fields):
+        with self._lock:
+            job['files'][i].update(fields)
+
+    def _worker_loop(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                job = self._jobs[job_id]
+                with self._pins.pinned([item['vector_path'] for item in job['_items']]):
+                    self._run(job)
+            except Exception as e:
+                print(f"❌ [{self._jobs[job_id].get('request_id')}] Upload job {job_id} crashed: {e}")
+                with self._lock:
+                    self._jobs[job_id].update({'status': 'failed', 'error': str(e), 'finished_at': time.time()})
+            finally:
+                self._retire(job_id)
+                self._queue.task_done()
+
+    def _retire(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.pop('_items', None)
+            self._finished.append(job_id)
+            while len(self._finished) > JOB_HISTORY_LIMIT:
+                self._jobs.pop(self._finished.pop(0), None)
+
+    def _run(self, job: Dict):
+        items = job['_items']
+        with self._lock:
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+
+        # Claim every vector path nobody else is building; the rest wait.
+        owned, waiting = [], []
+        with self._lock:
+            for i, item in enumerate(items):
+                key = item['vector_path']
+                if key in self._inflight:
+                    waiting.append((i, self._inflight[key]))
+                    job['files'][i]['status'] = 'coalesced'
+                else:
+                    self._inflight[key] = threading.Event()
+                    owned.append(i)
+
+        stats = StageStats()
+        results = [None] * len(items)
+        try:
+            owned_results = run_pipeline(
+                [items[i] for i in owned],
+                self._get_embedding_model(),
+                stats,
+                on_progress=lambda n, status: self._set_file(job, owned[n], status=status)
+            )
+            for n, result in zip(owned, owned_results):
+                results[n] = result
+        finally:
+            with self._lock:
+                for i in owned:
+                    self._inflight.pop(items[i]['vector_path']).set()
+
+        for i, event in waiting:
+            event.wait()
+            results[i] = run_pipeline([items[i]], self._get_embedding_model(), stats)[0]
+
+        for item in items:
+            if os.path.exists(item['filepath']):
+                os.remove(item['filepath'])
+
+        for i, result in enumerate(results):
+            self._set_file(
+                job, i,
+                status='error' if result['error'] else 'done',
+                error=result['error'],
+                reused=result['reused'],
+                timings=result['timings']
+            )
+
+        completed = [
+            items[i]
+            for i, result in enumerate(results) if not result['error']
+        ]
+        if completed:
+            self._on_complete(job['user_email'], completed)
+
+        with self._lock:
+            failed = [f['filename'] for f in job['files'] if f['status'] == 'error']
+            job['stats'] = stats.summary()
+            job['finished_at'] = time.time()
+            if not failed:
+                job['status'] = 'done'
+            elif len(failed) == len(items):
+                job['status'] = 'failed'
+            else:
+                job['status'] = 'partial'
@@ -0,0 +1,511 @@
+import os
+import time
+import random
+import asyncio
+import itertools
+import threading
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from chat_pipeline import ainvoke_model, astream_model
+
+# Clients built per model; calls go to the least busy one.
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", 2))
+# Seconds one attempt may take (a whole completion, or a stream's first token).
+LLM_CALL_TIMEOUT = float(os.environ.get("LLM_CALL_TIMEOUT", 60))
+LLM_FIRST_TOKEN_TIMEOUT = float(os.environ.get("LLM_FIRST_TOKEN_TIMEOUT", 30))
+# Extra attempts after a retryable failure, with full-jitter exponential backoff.
+LLM_RETRIES = int(os.environ.get("LLM_RETRIES", 2))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 8))
+# Send a second (hedged) request when the first is slower than this percentile
+# of recent latencies (0 disables hedging).
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", 0))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", 20))
+LATENCY_WINDOW = 200
+# Models tried, in order, after the selected one fails or is unavailable
+# (comma-separated names; empty means every other configured model).
+LLM_FAILOVER = [m.strip() for m in os.environ.get("LLM_FAILOVER", "").split(',') if m.strip()]
+# Consecutive failures that open a model's circuit, and how long it stays open.
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", 30))
+
+_RETRYABLE_STATUS = frozenset([408, 409, 425, 429, 500, 502, 503, 504, 529])
+_RETRYABLE_TEXT = ('timeout', 'timed out', 'connection', 'rate limit', 'overloaded', 'temporarily',
+                   'unavailable', '429', '502', '503', '504')
+
+
+class ModelUnavailable(Exception):
+    """No configured model can take the call right now (every circuit is open)."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ModelTimeout(TimeoutError):
+    pass
+
+
+def status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status if isinstance(status, int) else None
+
+
+def is_auth_error(error: Exception) -> bool:
+    text = str(error).lower()
+    return status_code(error) in (401, 403) or 'invalid_api_key' in text or 'invalid api key' in text
+
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, connection errors, rate limits and 5xx; never auth or other 4xx errors."""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = status_code(error)
+    if status is not None:
+        return status in _RETRYABLE_STATUS
+    if is_auth_error(error):
+        return False
+    text = str(error).lower()
+    return any(marker in text for marker in _RETRYABLE_TEXT)
+
+
+def is_provider_fault(error: Exception) -> bool:
+    """Failures that say the model is unhealthy (they count against its circuit and allow failover)."""
+    return isinstance(error, ModelUnavailable) or is_retryable(error) or is_auth_error(error)
+
+
+def backoff_delay(attempt: int, base: float = LLM_BACKOFF_BASE, cap: float = LLM_BACKOFF_MAX) -> float:
+    """Full jitter: uniform over [0, min(cap, base * 2**(attempt - 1))]."""
+    return random.uniform(0, min(cap, base * 2 ** max(0, attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    closed -> open after ``failures`` consecutive failures; open -> half-open
+    once ``cooldown`` has passed, letting one probe call through; the probe's
+    success closes the circuit and its failure opens it again.
+    """
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._probing = False
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self._opened_at >= self.cooldown else 'open'
+
+    def available(self) -> bool:
+        """Whether a call could be let through now (without claiming the half-open probe)."""
+        with self._lock:
+            state = self._state()
+            return state == 'closed' or (state == 'half_open' and not self._probing)
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def retry_after(self) -> int:
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(1, int(self.cooldown - (time.monotonic() - self._opened_at) + 0.999))
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            probing, self._probing = self._probing, False
+            if probing or (self._opened_at is None and self.failures and self._consecutive >= self.failures):
+                if self._opened_at is None:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """The half-open probe ended without a verdict (cancelled); let another call probe."""
+        with self._lock:
+            self._probing = False
+
+
+class ModelEndpoint:
+    """One configured model: its client pool, recent latencies and circuit breaker."""
+
+    def __init__(self, name: str, clients: List, breaker: CircuitBreaker = None):
+        self.name = name
+        self.clients = clients
+        self.breaker = breaker or CircuitBreaker()
+        self._inflight = [0] * len(clients)
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        # Seconds per successful completion, and to the first token of a stream.
+        self.latency = deque(maxlen=LATENCY_WINDOW)
+        self.first_token = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {'calls': 0, 'failures': 0, 'timeouts': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0}
+
+    def checkout(self, avoid: int = None) -> int:
+        """Index of the least busy client (round robin among ties), preferring one other than ``avoid``."""
+        with self._lock:
+            start = next(self._next)
+            order = [(start + i) % len(self.clients) for i in range(len(self.clients))]
+            if avoid is not None and len(order) > 1:
+                order.remove(avoid)
+            slot = min(order, key=self._inflight.__getitem__)
+            self._inflight[slot] += 1
+            return slot
+
+    def release(self, slot: int):
+        with self._lock:
+            self._inflight[slot] -= 1
+
+    def count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._counters[key] += amount
+
+    def hedge_delay(self, percentile: float, samples: deque) -> Optional[float]:
+        with self._lock:
+            if not percentile or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100.0))]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+            latency = sorted(self.latency)
+            inflight = sum(self._inflight)
+        p50 = latency[len(latency) // 2] if latency else None
+        p95 = latency[min(len(latency) - 1, int(0.95 * len(latency)))] if latency else None
+        return dict(counters, state=self.breaker.state, available=self.breaker.available(),
+                    retry_after=self.breaker.retry_after(), breaker_opened=self.breaker.opened,
+                    pool_size=len(self.clients), inflight=inflight,
+                    p50_seconds=round(p50, 4) if p50 is not None else None,
+                    p95_seconds=round(p95, 4) if p95 is not None else None)
+
+
+class _Stream:
+    """An opened model stream: its first chunk, the rest of the iterator and the client slot it holds."""
+
+    def __init__(self, endpoint: ModelEndpoint, slot: int, chunks, first, started: float):
+        self.endpoint = endpoint
+        self.slot = slot
+        self.chunks = chunks
+        self.first = first
+        self.started = started
+
+    async def close(self):
+        try:
+            await self.chunks.aclose()
+        finally:
+            self.endpoint.release(self.slot)
+
+
+_EMPTY = object()
+
+
+class LLMGateway:
+    """
+    Every chat model call goes through here.
+
+    Each model has a pool of clients (``LLM_POOL_SIZE``) and a circuit
+    breaker. A call is one or more attempts on the selected model: each
+    attempt has its own timeout, retryable failures (timeouts, connection
+    errors, 429 and 5xx) are retried after a jittered backoff, and once an
+    attempt is slower than the ``hedge_percentile`` of the model's recent
+    latencies a second request is sent on another client and the first
+    answer wins. When a model's attempts are exhausted, or its circuit is
+    open, the call fails over to the next model of ``failover``. Streams
+    are retried, hedged and failed over only until their first token;
+    after that an error reaches the caller.
+
+    ``model(name)`` returns a per-request handle with the ``ainvoke`` /
+    ``astream`` shape of a LangChain chat model that also records which
+    model answered.
+    """
+
+    def __init__(self, endpoints: Dict[str, ModelEndpoint], failover: List[str] = None,
+                 retries: int = LLM_RETRIES, call_timeout: float = LLM_CALL_TIMEOUT,
+                 first_token_timeout: float = LLM_FIRST_TOKEN_TIMEOUT,
+                 hedge_percentile: float = LLM_HEDGE_PERCENTILE, backoff_base: float = LLM_BACKOFF_BASE,
+                 backoff_max: float = LLM_BACKOFF_MAX):
+        self.endpoints = endpoints
+        self.failover = [m for m in (failover if failover is not None else LLM_FAILOVER) if m in endpoints]
+        self.retries = retries
+        self.call_timeout = call_timeout
+        self.first_token_timeout = first_token_timeout
+        self.hedge_percentile = hedge_percentile
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._counters = {'failovers': 0, 'unavailable': 0}
+
+    @classmethod
+    def from_factories(cls, factories: Dict[str, Callable], pool_size: int = LLM_POOL_SIZE, **kwargs):
+        """Build ``pool_size`` clients per model; a model whose client cannot be built is left out."""
+        endpoints = {}
+        for name, factory in factories.items():
+            try:
+                endpoints[name] = ModelEndpoint(name, [factory() for _ in range(max(1, pool_size))])
+                print(f"Initialized LLM model: {name}")
+            except Exception as e:
+                print(f"Failed to initialize {name}: {e}")
+        return cls(endpoints, **kwargs) if endpoints else None
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.endpoints)
+
+    def available(self) -> List[str]:
+        """Models that would take a call now (circuit closed, or half-open and free to probe)."""
+        return [name for name, e in self.endpoints.items() if e.breaker.available()]
+
+    def unavailable(self) -> Dict[str, int]:
+        """Models whose circuit is open, with seconds until they are probed again."""
+        return {name: e.breaker.retry_after() for name, e in self.endpoints.items() if not e.breaker.available()}
+
+    def model(self, name: str) -> 'GatewayModel':
+        return GatewayModel(self, name)
+
+    def _chain(self, name: str) -> List[ModelEndpoint]:
+        order = [name] + [m for m in (self.failover or self.endpoints) if m != name]
+        return [self.endpoints[m] for m in order]
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    def _unavailable(self, chain: List[ModelEndpoint]) -> ModelUnavailable:
+        self._count('unavailable')
+        retry_after = min(e.breaker.retry_after() for e in chain)
+        return ModelUnavailable(
+            f"{chain[0].name} is temporarily unavailable (too many recent failures); retry in {retry_after}s",
+            retry_after
+        )
+
+    async def ainvoke(self, name: str, prompt, report: Dict = None):
+        chain = self._chain(name)
+        error = None
+        for endpoint in chain:
+            if not endpoint.breaker.allow():
+                continue
+            if endpoint is not chain[0]:
+                self._count('failovers')
+            try:
+                response = await self._with_retries(
+                    endpoint, lambda avoid, claimed: self._invoke_once(endpoint, prompt, avoid, claimed),
+                    endpoint.latency, report
+                )
+                if report is not None:
+                    report['model'] = endpoint.name
+                return response
+            except Exception as e:
+                if not is_provider_fault(e):
+                    raise
+                error = e
+        raise error or self._unavailable(chain)
+
+    async def astream(self, name: str, prompt, report: Dict = None) -> AsyncIterator:
+        chain = self._chain(name)
+        error, stream = None, None
+        for endpoint in chain:
+            if not endpoint.breaker.allow():
+                continue
+            if endpoint is not chain[0]:
+                self._count('failovers')
+            try:
+                stream = await self._with_retries(
+                    endpoint, lambda avoid, claimed: self._open_stream(endpoint, prompt, avoid, claimed),
+                    endpoint.first_token, report
+                )
+                break
+            except Exception as e:
+                if not is_provider_fault(e):
+                    raise
+                error = e
+        if stream is None:
+            raise error or self._unavailable(chain)
+
+        if report is not None:
+            report['model'] = stream.endpoint.name
+        try:
+            if stream.first is not _EMPTY:
+                yield stream.first
+            async for chunk in stream.chunks:
+                yield chunk
+        except Exception as e:
+            stream.endpoint.count('failures')
+            if is_provider_fault(e):
+                stream.endpoint.breaker.record_failure()
+            raise
+        else:
+            with stream.endpoint._lock:
+                stream.endpoint.latency.append(time.perf_counter() - stream.started)
+        finally:
+            await stream.close()
+
+    async def _with_retries(self, endpoint: ModelEndpoint, attempt_once: Callable, samples: deque, report: Dict):
+        """Attempts (hedged when slow) with backoff between them; the circuit hears about every outcome."""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                if not endpoint.breaker.allow():
+                    raise ModelUnavailable(f"{endpoint.name} circuit opened while retrying",
+                                           endpoint.breaker.retry_after())
+                endpoint.count('retries')
+                await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+            if report is not None:
+                report['attempts'] = report.get('attempts', 0) + 1
+            try:
+                result = await self._hedged(endpoint, attempt_once, samples, report)
+            except asyncio.CancelledError:
+                endpoint.breaker.release_probe()
+                raise
+            except Exception as e:
+                endpoint.count('failures')
+                if isinstance(e, TimeoutError):
+                    endpoint.count('timeouts')
+                if not is_provider_fault(e):
+                    # The provider answered (e.g. 400 for this prompt): the model itself is healthy.
+                    endpoint.breaker.record_success()
+                    raise
+                endpoint.breaker.record_failure()
+                if not is_retryable(e) or attempt == self.retries:
+                    raise
+                print(f"⚠️ {endpoint.name} attempt {attempt + 1} failed, retrying: {e}")
+                continue
+            endpoint.breaker.record_success()
+            return result
+
+    async def _hedged(self, endpoint: ModelEndpoint, attempt_once: Callable, samples: deque, report: Dict):
+        delay = endpoint.hedge_delay(self.hedge_percentile, samples)
+        claimed = {}
+        if delay is None:
+            return await attempt_once(None, claimed)
+        first = asyncio.ensure_future(attempt_once(None, claimed))
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+        except asyncio.CancelledError:
+            await _discard(first)
+            raise
+        if done:
+            return first.result()
+
+        endpoint.count('hedges')
+        if report is not None:
+            report['hedged'] = report.get('hedged', 0) + 1
+        second = asyncio.ensure_future(attempt_once(claimed.get('slot'), {}))
+        pending, error, winner = {first, second}, None, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        if task is second:
+                            endpoint.count('hedge_wins')
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (first, second):
+                if task is not winner:
+                    await _discard(task)
+
+    async def _invoke_once(self, endpoint: ModelEndpoint, prompt, avoid: int = None, claimed: Dict = None):
+        slot = endpoint.checkout(avoid)
+        if claimed is not None:
+            claimed['slot'] = slot
+        endpoint.count('calls')
+        t0 = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(ainvoke_model(endpoint.clients[slot], prompt), self.call_timeout)
+        except asyncio.TimeoutError:
+            raise ModelTimeout(f"{endpoint.name} did not answer within {self.call_timeout:.0f}s")
+        finally:
+            endpoint.release(slot)
+        with endpoint._lock:
+            endpoint.latency.append(time.perf_counter() - t0)
+        return response
+
+    async def _open_stream(self, endpoint: ModelEndpoint, prompt, avoid: int = None, claimed: Dict = None) -> _Stream:
+        slot = endpoint.checkout(avoid)
+        if claimed is not None:
+            claimed['slot'] = slot
+        endpoint.count('calls')
+        t0 = time.perf_counter()
+        chunks = astream_model(endpoint.clients[slot], prompt)
+        stream = _Stream(endpoint, slot, chunks, _EMPTY, t0)
+        try:
+            stream.first = await asyncio.wait_for(chunks.__anext__(), self.first_token_timeout)
+        except StopAsyncIteration:
+            pass
+        except asyncio.TimeoutError:
+            await stream.close()
+            raise ModelTimeout(f"{endpoint.name} sent no token within {self.first_token_timeout:.0f}s")
+        except BaseException:
+            await stream.close()
+            raise
+        with endpoint._lock:
+            endpoint.first_token.append(time.perf_counter() - t0)
+        return stream
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._counters)
+        out.update(retries=self.retries, call_timeout=self.call_timeout, hedge_percentile=self.hedge_percentile,
+                   failover=self.failover or self.names,
+                   models={name: e.stats() for name, e in self.endpoints.items()})
+        return out
+
+
+async def _discard(task):
+    """Cancel a losing hedge attempt; a stream it already opened is closed and its client released."""
+    if not task.done():
+        task.cancel()
+    try:
+        result = await task
+    except BaseException:
+        return
+    if isinstance(result, _Stream):
+        await result.close()
+
+
+class GatewayModel:
+    """
+    Per-request handle on one model of an ``LLMGateway``, usable wherever
+    a chat model is (``ainvoke``/``astream``). ``report`` collects which
+    model answered and how many attempts and hedges it took.
+    """
+
+    def __init__(self, gateway: LLMGateway, name: str):
+        self.gateway = gateway
+        self.name = name
+        self.report: Dict = {'requested': name}
+
+    async def ainvoke(self, prompt):
+        return await self.gateway.ainvoke(self.name, prompt, self.report)
+
+    def astream(self, prompt) -> AsyncIterator:
+        return self.gateway.astream(self.name, prompt, self.report)
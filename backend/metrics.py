@@ -0,0 +1,184 @@
+import re
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+_NAME_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def request_id_from(header: Optional[str]) -> str:
+    """The caller's request id when it is a sane token, else a fresh one."""
+    if header and _REQUEST_ID_RE.match(header):
+        return header
+    return uuid.uuid4().hex[:16]
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(list(zip(self.labelnames, key)))} {_number(v)}" for key, v in values]
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram per label set, in the Prometheus layout."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label key -> [per-bucket counts (+Inf last), sum]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        out = []
+        for key, (counts, total) in series:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                out.append(f"{self.name}_bucket{_labels(pairs + [('le', _number(bound))])} {cumulative}")
+            out.append(f"{self.name}_sum{_labels(pairs)} {_number(round(total, 6))}")
+            out.append(f"{self.name}_count{_labels(pairs)} {cumulative}")
+        return out
+
+
+class MetricsRegistry:
+    """
+    Metrics of this process, rendered in the Prometheus text format.
+
+    Besides counters and histograms, collectors export the numeric fields
+    of existing ``stats()`` dicts (chat pipeline, caches, index registry)
+    as gauges named ``<prefix>_<path>``, read at scrape time.
+    """
+
+    def __init__(self, namespace: str = 'rag'):
+        self.namespace = namespace
+        self._metrics: List = []
+        self._collectors: List[Tuple[str, Callable[[], Dict]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(f"{self.namespace}_{name}", help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(f"{self.namespace}_{name}", help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, prefix: str, stats: Callable[[], Dict]):
+        self._collectors.append((prefix, stats))
+
+    def render(self) -> str:
+        out = []
+        for metric in self._metrics:
+            out.append(f"# HELP {metric.name} {metric.help}")
+            out.append(f"# TYPE {metric.name} {metric.kind}")
+            out.extend(metric.lines())
+        for prefix, stats in self._collectors:
+            try:
+                values = stats() or {}
+            except Exception as e:
+                print(f"⚠️ Metrics collector {prefix} failed: {e}")
+                continue
+            for name, value in _flatten(f"{self.namespace}_{prefix}", values):
+                out.append(f"# TYPE {name} gauge")
+                out.append(f"{name} {_number(value)}")
+        return '\n'.join(out) + '\n'
+
+
+def _flatten(prefix: str, values: Dict):
+    for key, value in values.items():
+        name = _NAME_RE.sub('_', f"{prefix}_{key}")
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+REGISTRY = MetricsRegistry()
+REQUESTS = REGISTRY.counter('http_requests_total', 'HTTP requests by route, method and status',
+                            ('route', 'method', 'status'))
+REQUEST_SECONDS = REGISTRY.histogram('http_request_seconds', 'Time to respond (to the first byte for streams)',
+                                     ('route',))
+STAGE_SECONDS = REGISTRY.histogram('stage_seconds', 'Time spent in one stage of a chat or upload',
+                                   ('route', 'stage'))
+STAGE_ITEMS = REGISTRY.counter('stage_items_total', 'Items (files, pages, chunks, vectors) processed per stage',
+                               ('route', 'stage'))
+
+
+def observe_stages(route: str, timings: Dict):
+    """Record every numeric entry of a request's ``timings`` dict as a stage observation."""
+    for stage, seconds in timings.items():
+        if isinstance(seconds, (int, float)) and not isinstance(seconds, bool):
+            STAGE_SECONDS.observe(seconds, route=route, stage=stage)
@@ -0,0 +1,285 @@
+import os
+import json
+import mmap
+import pickle
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+try:
+    from langchain_core.documents import Document
+except Exception:
+    Document = None
+
+# On-disk layout of one PDF's store (everything but store.json is raw data
+# that can be memory-mapped; nothing is unpickled on load):
+#   store.json      small manifest: version, count, dim, metadata shared by all chunks
+#   vectors.f32     count x dim float32, row-major
+#   chunks.txt      UTF-8 chunk texts back to back
+#   chunks.offsets  count + 1 uint64 byte offsets into chunks.txt
+#   metadata.json   per-chunk metadata columns (e.g. page), read on first use
+STORE_VERSION = 1
+MANIFEST_FILENAME = 'store.json'
+VECTORS_FILENAME = 'vectors.f32'
+TEXT_FILENAME = 'chunks.txt'
+OFFSETS_FILENAME = 'chunks.offsets'
+COLUMNS_FILENAME = 'metadata.json'
+# Written by LangChain's FAISS.save_local before this layout existed.
+LEGACY_INDEX_FILENAME = 'index.faiss'
+LEGACY_DOCSTORE_FILENAME = 'index.pkl'
+
+
+def chunk_key(pdf_hash: str, row: int) -> str:
+    """Id of one chunk across a user's whole library (also the BM25 posting key)."""
+    return f"{pdf_hash}-{row}"
+
+
+def chunk_row(key: str) -> Tuple[str, int]:
+    pdf_hash, _, row = key.rpartition('-')
+    return pdf_hash, int(row)
+
+
+def is_native_store(vector_path: str) -> bool:
+    # store.json is written last, so its presence means the store is complete.
+    return os.path.exists(os.path.join(vector_path, MANIFEST_FILENAME))
+
+
+def is_legacy_store(vector_path: str) -> bool:
+    return os.path.exists(os.path.join(vector_path, LEGACY_DOCSTORE_FILENAME))
+
+
+def store_exists(vector_path: str) -> bool:
+    return is_native_store(vector_path) or is_legacy_store(vector_path)
+
+
+def _replace_with(path: str, write):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class ChunkWriter:
+    """
+    Streams the text side of a store (chunk text, offsets, metadata
+    columns) to disk a batch at a time, so a long PDF is never held in
+    memory. Only the metadata keys whose values differ between chunks
+    (e.g. page) are kept until ``close``, which publishes the files and
+    returns what the manifest needs. The store stays incomplete until
+    ``write_vectors`` and ``write_manifest`` have run.
+    """
+
+    def __init__(self, vector_path: str):
+        os.makedirs(vector_path, exist_ok=True)
+        self.path = vector_path
+        self.count = 0
+        self._offset = 0
+        self._keys: List[str] = []
+        self._shared: Dict = {}
+        self._columns: Dict[str, List] = {}
+        # Rows whose value equals the shared one but not as JSON (1 vs 1.0).
+        self._variants: Dict[str, Dict[int, object]] = {}
+        self._text = open(os.path.join(vector_path, f"{TEXT_FILENAME}.tmp"), 'wb')
+        self._offsets = open(os.path.join(vector_path, f"{OFFSETS_FILENAME}.tmp"), 'wb')
+        self._offsets.write(np.zeros(1, dtype='uint64').tobytes())
+
+    def append(self, texts: List[str], metadatas: List[Dict]):
+        encoded = [t.encode('utf-8') for t in texts]
+        offsets = np.cumsum([len(b) for b in encoded], dtype='uint64') + np.uint64(self._offset)
+        self._text.write(b''.join(encoded))
+        self._offsets.write(offsets.tobytes())
+        if encoded:
+            self._offset = int(offsets[-1])
+        for meta in metadatas:
+            self._add_metadata(meta)
+
+    def _add_metadata(self, meta: Dict):
+        # Metadata is split into values shared by every chunk and per-chunk
+        # columns, decided incrementally: a key stays shared while every
+        # chunk so far has it with the first value.
+        for key in meta:
+            if key not in self._shared and key not in self._columns:
+                self._keys.append(key)
+                if self.count == 0:
+                    self._shared[key] = meta[key]
+                else:
+                    self._columns[key] = [None] * self.count
+        for key, value in list(self._shared.items()):
+            if key not in meta or meta[key] != value:
+                column = [self._shared.pop(key)] * self.count
+                for row, variant in self._variants.pop(key, {}).items():
+                    column[row] = variant
+                self._columns[key] = column
+            elif type(meta[key]) is not type(value):
+                self._variants.setdefault(key, {})[self.count] = meta[key]
+        for key, values in self._columns.items():
+            values.append(meta.get(key))
+        self.count += 1
+
+    def close(self) -> Dict:
+        self._text.close()
+        self._offsets.close()
+        for name in (TEXT_FILENAME, OFFSETS_FILENAME):
+            path = os.path.join(self.path, name)
+            os.replace(f"{path}.tmp", path)
+        columns = {k: self._columns[k] for k in self._keys if k in self._columns}
+        _replace_with(os.path.join(self.path, COLUMNS_FILENAME), lambda f: f.write(json.dumps(columns).encode('utf-8')))
+        return {'count': self.count, 'shared': {k: self._shared[k] for k in self._keys if k in self._shared},
+                'columns': list(columns)}
+
+    def abort(self):
+        self._text.close()
+        self._offsets.close()
+
+
+def iter_text_batches(vector_path: str, batch_size: int) -> Iterator[List[str]]:
+    """
+    Chunk texts written by a ``ChunkWriter``, ``batch_size`` at a time.
+    Each batch is read on its own (not mapped) so a pass over a large store
+    does not leave all of it resident.
+    """
+    offsets = np.fromfile(os.path.join(vector_path, OFFSETS_FILENAME), dtype='uint64')
+    with open(os.path.join(vector_path, TEXT_FILENAME), 'rb') as f:
+        for start in range(0, len(offsets) - 1, batch_size):
+            bounds = offsets[start:start + batch_size + 1].tolist()
+            f.seek(bounds[0])
+            data = f.read(bounds[-1] - bounds[0])
+            yield [data[a - bounds[0]:b - bounds[0]].decode('utf-8') for a, b in zip(bounds, bounds[1:])]
+
+
+def write_vectors(vector_path: str, batches) -> int:
+    """Append each batch of vectors to the store's vector file; returns the dimension (0 if empty)."""
+    dim = 0
+    path = os.path.join(vector_path, VECTORS_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for batch in batches:
+            batch = np.ascontiguousarray(batch, dtype='float32')
+            if batch.ndim == 2 and len(batch):
+                dim = batch.shape[1]
+            f.write(batch.tobytes())
+    os.replace(tmp_path, path)
+    return dim
+
+
+def write_manifest(vector_path: str, count: int, dim: int, shared: Dict, columns: List[str]):
+    """Written last: its presence marks the store complete."""
+    manifest = {'version': STORE_VERSION, 'count': count, 'dim': dim if count else 0, 'shared': shared,
+                'columns': columns}
+    _replace_with(os.path.join(vector_path, MANIFEST_FILENAME), lambda f: f.write(json.dumps(manifest).encode('utf-8')))
+
+
+def write_store(vector_path: str, texts: List[str], metadatas: List[Dict], vectors):
+    """Write one PDF's chunks and vectors in the native layout, manifest last."""
+    writer = ChunkWriter(vector_path)
+    writer.append(texts, metadatas)
+    text_side = writer.close()
+    dim = write_vectors(vector_path, [vectors])
+    write_manifest(vector_path, text_side['count'], dim, text_side['shared'], text_side['columns'])
+
+
+def migrate_legacy_store(vector_path: str):
+    """
+    Rewrite a LangChain ``index.faiss``/``index.pkl`` store in the native
+    layout. This is the only place a docstore is still unpickled, once per
+    store; row order follows ``index_to_docstore_id`` so any prebuilt
+    ``index.<format>.faiss`` beside it stays valid.
+    """
+    import faiss
+    with open(os.path.join(vector_path, LEGACY_DOCSTORE_FILENAME), 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    index = faiss.read_index(os.path.join(vector_path, LEGACY_INDEX_FILENAME))
+    docs = [docstore.search(index_to_docstore_id[i]) for i in range(index.ntotal)]
+    write_store(
+        vector_path,
+        [d.page_content for d in docs],
+        [d.metadata for d in docs],
+        index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype='float32')
+    )
+    # Postings were keyed by docstore UUIDs; they are rebuilt with chunk keys on load.
+    for name in ('bm25.json', LEGACY_DOCSTORE_FILENAME, LEGACY_INDEX_FILENAME):
+        path = os.path.join(vector_path, name)
+        if os.path.exists(path):
+            os.remove(path)
+    print(f"Migrated {vector_path} to the native store layout ({len(docs)} chunks)")
+
+
+class NativeStore:
+    """
+    Read side of the native layout.
+
+    Vectors, offsets and chunk text are memory-mapped, so opening a store
+    costs a JSON read regardless of its size, pages are shared between
+    worker processes, and only the chunks actually returned are decoded.
+    """
+
+    def __init__(self, vector_path: str):
+        self.path = vector_path
+        with open(os.path.join(vector_path, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported store version {manifest.get('version')} in {vector_path}")
+        self.count = manifest['count']
+        self.dim = manifest['dim']
+        self.shared = manifest['shared']
+        self.column_names = manifest['columns']
+        if self.count:
+            self.vectors = np.memmap(os.path.join(vector_path, VECTORS_FILENAME), dtype='float32', mode='r',
+                                     shape=(self.count, self.dim))
+            self.offsets = np.memmap(os.path.join(vector_path, OFFSETS_FILENAME), dtype='uint64', mode='r')
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype='float32')
+            self.offsets = np.zeros(1, dtype='uint64')
+        self._text = None
+        self._columns = None
+
+    def _text_map(self):
+        if self._text is None:
+            path = os.path.join(self.path, TEXT_FILENAME)
+            if os.path.getsize(path) == 0:
+                self._text = b''
+            else:
+                with open(path, 'rb') as f:
+                    self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._text
+
+    def _column_data(self) -> Dict[str, List]:
+        if self._columns is None:
+            with open(os.path.join(self.path, COLUMNS_FILENAME), 'r', encoding='utf-8') as f:
+                self._columns = json.load(f)
+        return self._columns
+
+    def column(self, key: str) -> Optional[List]:
+        """Per-chunk values of a metadata key that differs between chunks, or None."""
+        return self._column_data().get(key)
+
+    def text(self, row: int) -> str:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return self._text_map()[start:end].decode('utf-8')
+
+    def metadata(self, row: int) -> Dict:
+        meta = dict(self.shared)
+        for key, values in self._column_data().items():
+            if values[row] is not None:
+                meta[key] = values[row]
+        return meta
+
+    def document(self, row: int):
+        return Document(page_content=self.text(row), metadata=self.metadata(row))
+
+    def iter_texts(self) -> Iterator[Tuple[int, str]]:
+        for row in range(self.count):
+            yield row, self.text(row)
+
+    def mapped_bytes(self) -> int:
+        return sum(
+            os.path.getsize(os.path.join(self.path, name))
+            for name in (VECTORS_FILENAME, TEXT_FILENAME, OFFSETS_FILENAME)
+        )
+
+    def private_bytes(self) -> int:
+        # Metadata columns (once read); a rough per-value cost is enough for the LRU budget.
+        return self.count * len(self.column_names) * 64
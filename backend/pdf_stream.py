@@ -0,0 +1,76 @@
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+# Refuse PDFs beyond these before parsing a single page (0 disables a guard).
+INGEST_MAX_PAGES = int(os.environ.get("INGEST_MAX_PAGES", 2000))
+INGEST_MAX_BYTES = int(os.environ.get("INGEST_MAX_BYTES", 200 * 1024 * 1024))
+
+
+class DocumentTooLarge(ValueError):
+    """A PDF exceeds the configured page or byte limit."""
+
+
+def check_limits(filepath: str, page_count: int = None,
+                 max_pages: int = INGEST_MAX_PAGES, max_bytes: int = INGEST_MAX_BYTES):
+    size = os.path.getsize(filepath)
+    if max_bytes and size > max_bytes:
+        raise DocumentTooLarge(f"PDF is {size / 2**20:.1f} MB, the limit is {max_bytes / 2**20:.1f} MB")
+    if max_pages and page_count is not None and page_count > max_pages:
+        raise DocumentTooLarge(f"PDF has {page_count} pages, the limit is {max_pages}")
+
+
+def iter_pages(filepath: str, filename: str, pdf_hash: str, max_pages: int = INGEST_MAX_PAGES,
+               max_bytes: int = INGEST_MAX_BYTES) -> Iterator[Tuple[object, float]]:
+    """
+    Yield ``(Document, parse_seconds)`` one page at a time.
+
+    Page documents carry the same metadata PyMuPDFLoader produces, but
+    unlike ``PyMuPDFLoader.load`` (which builds every page before returning)
+    only the current page is in memory. Limits are checked on the file size
+    and the page count before any page is parsed.
+    """
+    import fitz
+    from langchain_core.documents import Document
+
+    check_limits(filepath, max_pages=0, max_bytes=max_bytes)
+    uploaded_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with fitz.open(filepath) as doc:
+        check_limits(filepath, doc.page_count, max_pages=max_pages, max_bytes=0)
+        info = {k: v for k, v in doc.metadata.items() if type(v) in [str, int]}
+        for number in range(doc.page_count):
+            t0 = time.perf_counter()
+            text = doc.load_page(number).get_text()
+            metadata = dict(
+                {"source": filepath, "file_path": filepath, "page": number, "total_pages": doc.page_count}, **info
+            )
+            metadata.update({"source": filename, "hash": pdf_hash, "uploaded_at": uploaded_at})
+            yield Document(page_content=text, metadata=metadata), time.perf_counter() - t0
+
+
+def iter_chunks(pages, splitter) -> Iterator[Tuple[List, float]]:
+    """
+    Split each page as it arrives, yielding ``(chunks, split_seconds)``.
+    Splitting never crosses pages, so this gives the same chunks as
+    ``splitter.split_documents`` over the whole document.
+    """
+    for page in pages:
+        t0 = time.perf_counter()
+        chunks = splitter.split_documents([page])
+        yield chunks, time.perf_counter() - t0
+
+
+def summarize_pages(page_seconds: List[float], slowest: int = 5) -> Dict:
+    """Per-page parse times reduced to what a job status can carry."""
+    if not page_seconds:
+        return {'pages': 0}
+    ordered = sorted(page_seconds)
+    worst = sorted(range(len(page_seconds)), key=page_seconds.__getitem__, reverse=True)[:slowest]
+    return {
+        'pages': len(page_seconds),
+        'mean_ms': round(1000 * sum(page_seconds) / len(page_seconds), 3),
+        'p95_ms': round(1000 * ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+        'max_ms': round(1000 * ordered[-1], 3),
+        'slowest': [{'page': p, 'ms': round(1000 * page_seconds[p], 3)} for p in worst],
+    }
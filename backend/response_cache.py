@@ -0,0 +1,135 @@
+import os
+import math
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional
+
+RESPONSE_CACHE_THRESHOLD = float(os.environ.get("RESPONSE_CACHE_THRESHOLD", 0.95))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 3600))
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 2000))
+# Generators (MCQs, exam papers) are expected to vary between calls, so they are not cached.
+RESPONSE_CACHE_TOOLS = set(
+    t.strip() for t in os.environ.get(
+        "RESPONSE_CACHE_TOOLS", "concept_explainer,summarizer,notes_maker,exam_prep_agent,ai_chat"
+    ).split(',') if t.strip()
+)
+
+
+def chunk_id(doc) -> str:
+    """Stable id for a retrieved chunk: source PDF hash, page and content."""
+    meta = doc.metadata
+    raw = f"{meta.get('hash', '')}\x00{meta.get('page', '')}\x00{doc.page_content}"
+    return hashlib.sha1(raw.encode('utf-8', 'ignore')).hexdigest()
+
+
+def context_id(context: str) -> str:
+    return hashlib.sha1(context.encode('utf-8', 'ignore')).hexdigest()
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class SemanticResponseCache:
+    """
+    Answers keyed by tool, model and the exact set of retrieved chunks.
+
+    Within one (tool, model, chunks) bucket a stored answer is reused when
+    the new query's embedding has cosine similarity >= ``threshold`` with
+    the stored query. Because the chunk set is part of the key, the prompt
+    context of a hit is identical to the one the answer was generated from.
+    Entries expire after ``ttl`` seconds, the oldest are dropped beyond
+    ``max_entries``, and ``invalidate_user`` drops everything a user's
+    requests stored when their index changes.
+    """
+
+    def __init__(self, threshold: float = RESPONSE_CACHE_THRESHOLD, ttl: float = RESPONSE_CACHE_TTL,
+                 max_entries: int = RESPONSE_CACHE_SIZE, tools=None):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.tools = RESPONSE_CACHE_TOOLS if tools is None else set(tools)
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._buckets: Dict[tuple, List[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0, 'saved_llm_seconds': 0.0}
+
+    def enabled_for(self, tool: str) -> bool:
+        return tool in self.tools
+
+    @staticmethod
+    def _bucket_key(tool: str, model: str, chunk_ids: FrozenSet[str]) -> tuple:
+        return (tool, model, chunk_ids)
+
+    def lookup(self, tool: str, model: str, chunk_ids: FrozenSet[str], query_vector: List[float]) -> Optional[Dict]:
+        key = self._bucket_key(tool, model, chunk_ids)
+        query_vector = _normalize(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            best, best_score = None, self.threshold
+            for entry_id in list(self._buckets.get(key, [])):
+                entry = self._entries.get(entry_id)
+                if entry is None:
+                    continue
+                if entry['expires_at'] < now:
+                    self._drop(entry_id)
+                    continue
+                score = sum(a * b for a, b in zip(query_vector, entry['vector']))
+                if score >= best_score:
+                    best, best_score = entry, score
+            if best is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['hits'] += 1
+            self._counters['saved_llm_seconds'] += best['llm_seconds']
+            return {'response': best['response'], 'similarity': round(best_score, 4)}
+
+    def store(self, tool: str, model: str, chunk_ids: FrozenSet[str], query_vector: List[float],
+              response: str, llm_seconds: float, user_email: str):
+        key = self._bucket_key(tool, model, chunk_ids)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                'key': key,
+                'vector': _normalize(query_vector),
+                'response': response,
+                'llm_seconds': llm_seconds,
+                'user_email': user_email,
+                'expires_at': time.monotonic() + self.ttl,
+            }
+            self._buckets.setdefault(key, []).append(entry_id)
+            self._counters['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_user(self, user_email: str):
+        with self._lock:
+            stale = [i for i, e in self._entries.items() if e['user_email'] == user_email]
+            for entry_id in stale:
+                self._drop(entry_id)
+            self._counters['invalidations'] += len(stale)
+
+    def _drop(self, entry_id: int):
+        # Caller holds self._lock.
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        bucket = self._buckets.get(entry['key'])
+        if bucket is not None:
+            bucket.remove(entry_id)
+            if not bucket:
+                del self._buckets[entry['key']]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            c = dict(self._counters)
+            total = c['hits'] + c['misses']
+            c['saved_llm_seconds'] = round(c['saved_llm_seconds'], 4)
+            c['hit_rate'] = round(c['hits'] / total, 4) if total else None
+            c['entries'] = len(self._entries)
+            return c
@@ -0,0 +1,328 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from native_store import chunk_row
+
+RETRIEVER_K = 10
+# Candidates taken from each of the dense and sparse branches before fusion.
+HYBRID_FETCH_K = int(os.environ.get("HYBRID_FETCH_K", 30))
+RRF_K = 60
+# Optional CPU cross-encoder, e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2". Unset disables reranking.
+RERANKER_MODEL = os.environ.get("RERANKER_MODEL")
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", 20))
+BM25_FILENAME = 'bm25.json'
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Approximate CPython cost of a document's in-memory postings (fitted with
+# tracemalloc; within about 25% across vocabulary and chunk sizes): per
+# (term, chunk) entry, per term bucket and per chunk.
+BM25_POSTING_BYTES = 24
+BM25_TERM_BYTES = 220
+BM25_CHUNK_BYTES = 380
+
+# Keeps dotted/hyphenated tokens such as "4.2.1" or "navier-stokes" whole so
+# section numbers and formula names match exactly.
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with what "
+    "which who how why when where do does explain define describe".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def build_bm25_data(chunks: List[Tuple[str, str]]) -> Dict:
+    """Postings for one document's chunks, given as ``(chunk_key, text)`` pairs."""
+    lengths = {}
+    postings = defaultdict(list)
+    for chunk_id, text in chunks:
+        counts = Counter(tokenize(text))
+        lengths[chunk_id] = sum(counts.values())
+        for term, tf in counts.items():
+            postings[term].append([chunk_id, tf])
+    return {'lengths': lengths, 'postings': dict(postings)}
+
+
+def save_bm25(vector_path: str, data: Dict):
+    path = os.path.join(vector_path, BM25_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def load_or_build_bm25(vector_path: str, shard) -> Dict:
+    """Read the postings saved beside a vector store, building (and saving) them for older stores."""
+    path = os.path.join(vector_path, BM25_FILENAME)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    data = build_bm25_data(shard.iter_texts())
+    if os.path.isdir(vector_path):
+        save_bm25(vector_path, data)
+    return data
+
+
+class DocumentPostings:
+    """
+    One document's BM25 postings: term -> {chunk key: term frequency},
+    plus each chunk's length. Read-only once built, so a single copy can
+    serve every user index that holds the document (see SharedPostings).
+    Chunk keys are stored once and referenced from every posting.
+    """
+
+    def __init__(self, data: Dict):
+        keys = {chunk_id: chunk_id for chunk_id in data['lengths']}
+        self.lengths: Dict[str, int] = {keys[c]: n for c, n in data['lengths'].items()}
+        self.postings: Dict[str, Dict[str, int]] = {
+            term: {keys.get(c, c): tf for c, tf in entries} for term, entries in data['postings'].items()
+        }
+        self.total_length = sum(self.lengths.values())
+        self.entries = sum(len(bucket) for bucket in self.postings.values())
+
+    def size_bytes(self) -> int:
+        """Estimated memory, from the entry, term and chunk counts."""
+        return (self.entries * BM25_POSTING_BYTES + len(self.postings) * BM25_TERM_BYTES
+                + len(self.lengths) * BM25_CHUNK_BYTES)
+
+
+class SharedPostings:
+    """
+    Postings loaded once per content-addressed store, however many users
+    hold the document. ``acquire`` returns the store's DocumentPostings
+    (loading them on first use) and ``release`` drops a reference; the
+    last release forgets them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List] = {}  # vector path -> [DocumentPostings, references]
+
+    def acquire(self, vector_path: str, shard) -> DocumentPostings:
+        with self._lock:
+            entry = self._entries.get(vector_path)
+            if entry is not None:
+                entry[1] += 1
+                return entry[0]
+        # Loaded outside the lock; if two users race, the first one stored wins.
+        postings = DocumentPostings(load_or_build_bm25(vector_path, shard))
+        with self._lock:
+            entry = self._entries.setdefault(vector_path, [postings, 0])
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, vector_path: str):
+        with self._lock:
+            entry = self._entries.get(vector_path)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._entries[vector_path]
+
+    def references(self, vector_path: str) -> int:
+        with self._lock:
+            entry = self._entries.get(vector_path)
+            return entry[1] if entry else 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = list(self._entries.values())
+        return {
+            'documents': len(entries),
+            'references': sum(refs for _, refs in entries),
+            'bytes': sum(postings.size_bytes() for postings, _ in entries),
+        }
+
+
+class BM25Index:
+    """
+    BM25 over many documents' chunks; documents can be added and removed.
+
+    Each document contributes its own DocumentPostings, typically shared
+    with other users' indexes, so adding or removing one never copies or
+    edits postings. Corpus statistics (chunk count, average length and
+    each term's document frequency) are taken over all documents at
+    query time.
+    """
+
+    def __init__(self):
+        self._docs: Dict[str, DocumentPostings] = {}
+        self._chunks = 0
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def add(self, doc_key: str, postings):
+        """Add a document's ``DocumentPostings`` (or the raw postings dict, which is converted)."""
+        if not isinstance(postings, DocumentPostings):
+            postings = DocumentPostings(postings)
+        with self._lock:
+            if doc_key in self._docs:
+                return
+            self._docs[doc_key] = postings
+            self._chunks += len(postings.lengths)
+            self._total_length += postings.total_length
+
+    def remove(self, doc_key: str):
+        with self._lock:
+            postings = self._docs.pop(doc_key, None)
+            if postings is None:
+                return
+            self._chunks -= len(postings.lengths)
+            self._total_length -= postings.total_length
+
+    def documents(self) -> Dict[str, DocumentPostings]:
+        with self._lock:
+            return dict(self._docs)
+
+    def size_bytes(self) -> int:
+        """Estimated memory of every document's postings (shared ones included)."""
+        with self._lock:
+            return sum(postings.size_bytes() for postings in self._docs.values())
+
+    def search(self, query: str, k: int, allow: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, float]]:
+        """Top ``k`` chunks by BM25; ``allow`` (chunk key -> bool) drops chunks while scoring."""
+        with self._lock:
+            docs = list(self._docs.values())
+            n = self._chunks
+            total_length = self._total_length
+        if n == 0:
+            return []
+        avg_len = total_length / n or 1.0
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            buckets = [(doc.lengths, doc.postings[term]) for doc in docs if term in doc.postings]
+            df = sum(len(bucket) for _, bucket in buckets)
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for lengths, bucket in buckets:
+                for chunk_id, tf in bucket.items():
+                    if allow is not None and not allow(chunk_id):
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[chunk_id] / avg_len)
+                    scores[chunk_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+
+
+def chunk_filter(scope: Optional[Dict]) -> Optional[Callable[[str], bool]]:
+    """
+    Predicate over chunk keys for a search scope (see ``UserIndex.search_scope``):
+    the chunk's document is in scope and, where rows are given, so is its row.
+    """
+    if scope is None:
+        return None
+    rows = {h: None if r is None else set(r.tolist()) for h, r in scope.items()}
+
+    def allow(chunk_id: str) -> bool:
+        pdf_hash, row = chunk_row(chunk_id)
+        if pdf_hash not in rows:
+            return False
+        allowed = rows[pdf_hash]
+        return allowed is None or row in allowed
+    return allow
+
+
+def rrf_fuse(rankings: List[List[str]], k: int = RRF_K) -> List[str]:
+    """Reciprocal rank fusion of several ranked id lists."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (k + rank + 1)
+    return [item for item, _ in sorted(scores.items(), key=lambda kv: kv[1], reverse=True)]
+
+
+def embed_query_for(embedding, query: str) -> List[float]:
+    return embedding.embed_query(query) if hasattr(embedding, 'embed_query') else embedding(query)
+
+
+def cosine_similarity(a, b) -> Optional[float]:
+    if a is None or b is None:
+        return None
+    dot = sum(float(x) * float(y) for x, y in zip(a, b))
+    norm = math.sqrt(sum(float(x) * float(x) for x in a)) * math.sqrt(sum(float(y) * float(y) for y in b))
+    return dot / norm if norm else None
+
+
+def dense_search_ids(user_index, query: str, k: int, scope: Optional[Dict] = None) -> List[str]:
+    """Chunk keys of the ``k`` nearest chunks, straight from the vector shards."""
+    if user_index is None or not user_index.shards or user_index.embedding is None:
+        return []
+    return user_index.dense_search(embed_query_for(user_index.embedding, query), k, scope)
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    global _reranker
+    if not RERANKER_MODEL:
+        return None
+    with _reranker_lock:
+        if _reranker is None:
+            try:
+                from sentence_transformers import CrossEncoder
+                _reranker = CrossEncoder(RERANKER_MODEL, device='cpu')
+            except Exception as e:
+                print(f"⚠️ Reranker {RERANKER_MODEL} unavailable: {e}")
+                _reranker = False
+        return _reranker or None
+
+
+class HybridRetriever:
+    """
+    Dense + BM25 retrieval over one user's index.
+
+    Both branches return ``fetch_k`` candidates, which are fused with
+    reciprocal rank fusion and optionally reranked by a cross-encoder.
+    A ``DocumentFilter`` limits both branches to some documents or pages
+    while they search; dense search may further be routed to the documents
+    nearest the query (see ``DocumentRouter``). Exposes ``invoke(query)``
+    like a LangChain retriever.
+    """
+
+    def __init__(self, user_index, k: int = RETRIEVER_K, fetch_k: int = HYBRID_FETCH_K):
+        self.user_index = user_index
+        self.k = k
+        self.fetch_k = fetch_k
+
+    def ranked_ids(self, query: str, filters=None) -> List[str]:
+        return self._ranked(query, self.user_index.search_scope(filters))[0]
+
+    def _ranked(self, query: str, scope: Optional[Dict] = None) -> Tuple[List[str], Optional[float]]:
+        """Fused chunk keys, plus the cosine similarity of the query to the nearest dense chunk."""
+        dense, relevance = [], None
+        if self.user_index.embedding is not None:
+            vector = embed_query_for(self.user_index.embedding, query)
+            dense = self.user_index.dense_search(vector, self.fetch_k, scope)
+            if dense:
+                relevance = cosine_similarity(vector, self.user_index.chunk_vector(dense[0]))
+        sparse = [chunk_id for chunk_id, _ in self.user_index.bm25.search(query, self.fetch_k, chunk_filter(scope))]
+        return rrf_fuse([dense, sparse]), relevance
+
+    def retrieve(self, query: str, filters=None) -> Tuple[List, Optional[float]]:
+        """Top ``k`` documents and the best dense relevance (None without dense hits)."""
+        if not self.user_index.shards:
+            return [], None
+        scope = self.user_index.search_scope(filters)
+        if scope is not None and not scope:
+            return [], None
+        ids, relevance = self._ranked(query, scope)
+        reranker = get_reranker()
+        docs = [self.user_index.get_document(i) for i in ids[:RERANK_CANDIDATES if reranker else self.k]]
+        docs = [d for d in docs if hasattr(d, 'page_content')]
+        if reranker and docs:
+            scores = reranker.predict([(query, d.page_content) for d in docs])
+            docs = [d for _, d in sorted(zip(scores, docs), key=lambda pair: pair[0], reverse=True)]
+        return docs[:self.k], relevance
+
+    def invoke(self, query: str):
+        return self.retrieve(query)[0]
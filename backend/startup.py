@@ -0,0 +1,89 @@
+import os
+import time
+import threading
+from typing import Callable, Dict, List
+
+# eager: build every component while app.py is imported (the old behaviour).
+# background: start building them on daemon threads; the app serves at once.
+# lazy: build each component on first use (a readiness probe also starts warming).
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "background")
+
+
+class LazyComponent:
+    """
+    A heavy dependency (model, client) built exactly once, on first use or
+    in the background.
+
+    ``get()`` blocks until the value exists, so request handlers keep their
+    old semantics whatever the startup mode; ``peek()`` never blocks and is
+    what liveness/metrics endpoints use. A factory returning a falsy value
+    marks the component ``unavailable`` (finished, but degraded), and an
+    exception marks it ``failed``; either way it is not retried.
+    """
+
+    def __init__(self, name: str, factory: Callable):
+        self.name = name
+        self._factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+        self._warm_lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+        self.state = 'pending'
+        self.error = None
+        self.seconds = None
+
+    def get(self):
+        if not self._done.is_set():
+            with self._lock:
+                if not self._done.is_set():
+                    self._build()
+        return self._value
+
+    def peek(self):
+        return self._value if self._done.is_set() else None
+
+    def warm(self):
+        """Start building on a daemon thread if nobody has yet. Never blocks."""
+        with self._warm_lock:
+            if self._done.is_set() or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.get, name=f"warm-{self.name}", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def _build(self):
+        # Caller holds self._lock.
+        self.state = 'loading'
+        t0 = time.perf_counter()
+        try:
+            self._value = self._factory()
+            self.state = 'ready' if self._value else 'unavailable'
+        except Exception as e:
+            self._value = None
+            self.error = str(e)
+            self.state = 'failed'
+            print(f"❌ Failed to initialize {self.name}: {e}")
+        finally:
+            self.seconds = round(time.perf_counter() - t0, 4)
+            self._done.set()
+
+    def status(self) -> Dict:
+        return {'state': self.state, 'seconds': self.seconds, 'error': self.error}
+
+
+def start_components(components: List[LazyComponent], mode: str = STARTUP_MODE):
+    if mode == 'eager':
+        for component in components:
+            component.get()
+    elif mode == 'background':
+        for component in components:
+            component.warm()
+    elif mode != 'lazy':
+        print(f"⚠️ Unknown STARTUP_MODE {mode!r}, loading components lazily")
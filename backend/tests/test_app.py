@@ -0,0 +1,85 @@
+"""/api/chat and /api/chat/stream end to end with the offline fake models."""
+import os
+import json
+import socket
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory):
+    # app.py keeps uploads and stores relative to the working directory.
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    previous = {key: os.environ.get(key) for key in ('FAKE_LLM', 'FAKE_LLM_LATENCY', 'FAKE_EMBEDDINGS', 'STARTUP_MODE')}
+    os.environ.update(FAKE_LLM='1', FAKE_LLM_LATENCY='0', FAKE_EMBEDDINGS='1', STARTUP_MODE='eager')
+    try:
+        import app
+        yield app
+    finally:
+        os.chdir(cwd)
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def chat(query='what is entropy'):
+    return {'user_email': 'student@example.com', 'query': query, 'model': 'Fake-LLM', 'no_cache': True}
+
+
+def sse_events(body: str):
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_chat_answers(client):
+    response = client.post('/api/chat', json=chat())
+    assert response.status_code == 200
+    assert response.json['response'].startswith('Fake answer for: ')
+
+
+def test_chat_stream_sends_tokens_then_done(client):
+    response = client.post('/api/chat/stream', json=chat())
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    events = sse_events(response.get_data(as_text=True))
+    names = [name for name, _ in events]
+    assert names[-1] == 'done' and set(names[:-1]) == {'token'}
+    assert "".join(data['token'] for _, data in events[:-1]).startswith('Fake answer for: ')
+    done = events[-1][1]
+    assert done['llm']['model'] == 'Fake-LLM'
+    assert 'llm_first_token' in done['timings']
+
+
+@pytest.mark.parametrize('path', ['/api/chat', '/api/chat/stream'])
+def test_user_over_the_chat_limit_gets_429(client, app_module, monkeypatch, path):
+    monkeypatch.setattr(app_module.chat_pipeline, 'max_per_user', 0)
+    response = client.post(path, json=chat())
+    assert response.status_code == 429
+    assert response.json['reason'] == 'user_limit'
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_disconnected_client_gets_499_and_the_chat_is_cancelled(client, app_module, monkeypatch):
+    for fake in app_module.get_llm_gateway().endpoints['Fake-LLM'].clients:
+        monkeypatch.setattr(fake, 'latency', 5)
+    cancelled = app_module.chat_pipeline.stats()['cancelled']
+    server_side, client_side = socket.socketpair()
+    client_side.close()
+    try:
+        response = client.post('/api/chat', json=chat('a slow question'),
+                               environ_overrides={'werkzeug.socket': server_side})
+    finally:
+        server_side.close()
+    assert response.status_code == 499
+    assert app_module.chat_pipeline.stats()['cancelled'] == cancelled + 1
@@ -0,0 +1,105 @@
+"""ChatPipeline admission control, deadlines, cancellation and stream backpressure."""
+import time
+import socket
+import asyncio
+
+import pytest
+
+from chat_pipeline import ChatPipeline, ClientDisconnected, DeadlineExceeded, OverloadedError
+
+
+async def sleep_then(seconds: float, value='done'):
+    await asyncio.sleep(seconds)
+    return value
+
+
+def wait_until(condition, timeout: float = 2.0):
+    give_up = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < give_up
+        time.sleep(0.01)
+
+
+def test_runs_a_chat_to_completion():
+    pipeline = ChatPipeline(max_concurrent=2)
+    assert pipeline.run('a', lambda: sleep_then(0.01)) == 'done'
+    assert pipeline.stats()['completed'] == 1
+
+
+def test_user_over_its_limit_is_rejected():
+    pipeline = ChatPipeline(max_concurrent=4, max_per_user=1)
+    pipeline.submit('a', lambda: sleep_then(0.5))
+    with pytest.raises(OverloadedError) as raised:
+        pipeline.submit('a', lambda: sleep_then(0.5))
+    assert raised.value.reason == 'user_limit'
+    assert raised.value.retry_after >= 1
+    # Other users are still admitted.
+    assert pipeline.run('b', lambda: sleep_then(0.01)) == 'done'
+
+
+def test_full_queue_is_rejected():
+    pipeline = ChatPipeline(max_concurrent=1, max_per_user=4, queue_size=1)
+    pipeline.submit('a', lambda: sleep_then(0.5))
+    pipeline.submit('b', lambda: sleep_then(0.5))
+    with pytest.raises(OverloadedError) as raised:
+        pipeline.submit('c', lambda: sleep_then(0.5))
+    assert raised.value.reason == 'queue_full'
+    assert pipeline.stats()['rejected_queue'] == 1
+
+
+def test_queued_chat_is_shed_after_the_queue_timeout():
+    pipeline = ChatPipeline(max_concurrent=1, queue_size=4, queue_timeout=0.05)
+    pipeline.submit('a', lambda: sleep_then(0.5))
+    with pytest.raises(OverloadedError) as raised:
+        pipeline.run('b', lambda: sleep_then(0.01))
+    assert raised.value.reason == 'queue_timeout'
+
+
+def test_chat_past_its_deadline_is_cancelled():
+    pipeline = ChatPipeline(max_concurrent=1)
+    with pytest.raises(DeadlineExceeded):
+        pipeline.run('a', lambda: sleep_then(5), deadline=0.05)
+    wait_until(lambda: pipeline.stats()['deadline_exceeded'] == 1)
+    assert pipeline.stats()['running'] == 0
+
+
+def test_client_disconnect_cancels_the_chat():
+    pipeline = ChatPipeline(max_concurrent=1)
+    server_side, client_side = socket.socketpair()
+    client_side.close()
+    try:
+        with pytest.raises(ClientDisconnected):
+            pipeline.run('a', lambda: sleep_then(5), environ={'werkzeug.socket': server_side})
+    finally:
+        server_side.close()
+    wait_until(lambda: pipeline.stats()['cancelled'] == 1)
+    assert pipeline.stats()['users'] == 0
+
+
+def test_stream_pauses_when_the_reader_falls_behind():
+    pipeline = ChatPipeline(max_concurrent=1)
+    produced = []
+
+    async def tokens():
+        for i in range(50):
+            produced.append(i)
+            yield i
+
+    stream = pipeline.stream('a', tokens, buffer=4)
+    time.sleep(0.1)
+    assert len(produced) <= 5
+    assert list(stream) == list(range(50))
+    assert pipeline.stats()['completed'] == 1
+
+
+def test_closing_an_unread_stream_cancels_the_chat():
+    pipeline = ChatPipeline(max_concurrent=1)
+
+    async def tokens():
+        await asyncio.sleep(5)
+        yield 'late'
+
+    stream = pipeline.stream('a', tokens)
+    stream.close()
+    wait_until(lambda: pipeline.stats()['cancelled'] == 1)
+    assert list(stream) == []
@@ -0,0 +1,220 @@
+"""
+``exam_spec`` against the ad hoc ``re.search`` parser it replaced.
+
+``reference_parse`` is the parser that used to live in app.py, kept
+verbatim. Random queries built from the spec vocabulary (number words and
+digits in mixed case, keywords, a few non-ASCII spellings, punctuation,
+odd whitespace) plus the README examples must parse to the same params
+and render the same prompts.
+"""
+import re
+import random
+from typing import Dict
+
+import pytest
+
+from exam_spec import _render_exam_prompt, generate_exam_paper_prompt, parse_exam_paper_params, parse_exam_spec
+
+RANDOM_QUERIES = 5000
+SEED = 7
+
+EXAMPLES = [
+    "generate exam papers",
+    "give me 1 paper with 8 two mark questions, all hard, duration 30 minutes",
+    "create 3 papers, each 7 questions: two 2 marks, two 4 marks, three 10 marks; "
+    "one medium and one hard in each section; duration 90 minutes",
+    "Generate 3 papers all hard",
+    "2 question papers with 2 easy 2 medium 1 hard questions of 5 marks each, time is 45 minutes",
+    "all 4 medium questions, 1 exam",
+]
+
+VOCABULARY = [
+    'paper', 'papers', 'question paper', 'set', 'sets', 'exam', 'exams', 'question', 'questions', 'q', 'qs',
+    'problem', 'problems', 'mark', 'marks', 'each', 'per paper', 'all', 'easy', 'medium', 'hard', 'time',
+    'duration', 'is', 'minute', 'minutes', 'section', 'in each section', 'one medium and one hard',
+    'and', 'with', 'generate', 'phone', 'often', 'Small', 'give me', 'of',
+    # Non-ASCII queries take the IGNORECASE path, where 'ſ' folds to 's'.
+    'ſets', 'queſtions', 'marKs', 'examen', 'épreuve', '٣',
+] + list('0123456789') + ['one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine', 'ten', '12', '100']
+SEPARATORS = [' ', ' ', ' ', '', '  ', ', ', '; ', '\n', ' - ', ': ', '\t']
+
+
+def reference_parse(query: str) -> Dict[str, any]:
+    """``parse_exam_paper_params`` as it was before exam_spec.py (kept verbatim)."""
+    number_words = {
+        'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+        'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10
+    }
+
+    def to_int(token: str) -> int:
+        token = token.lower()
+        return int(token) if token.isdigit() else number_words.get(token, 0)
+
+    params = {
+        'paper_count': 5,
+        'questions_per_paper': 5,
+        'marks_per_question': 10,
+        'difficulty': {'easy': 2, 'medium': 2, 'hard': 1}
+    }
+
+    # Paper count (supports '1 paper', '1 exam', '1 question paper')
+    paper_match = re.search(r'(\d+)\s*(?:question\s+paper|papers?|sets?|exams?)', query, re.IGNORECASE)
+    if paper_match:
+        params['paper_count'] = int(paper_match.group(1))
+
+    # Questions per paper (uniform)
+    question_match = re.search(r'(\d+)\s*(?:questions?|qs?|problems?)(?:\s+(?:each|per\s+paper))?', query, re.IGNORECASE)
+    if question_match:
+        params['questions_per_paper'] = int(question_match.group(1))
+
+    # SECTION-BASED parsing like: "two 2 marks questions, two 4 marks questions, three 10 marks questions"
+    section_pattern = re.compile(
+        r'(?:(one|two|three|four|five|six|seven|eight|nine|ten|\d+)\s+)'
+        r'((?:one|two|three|four|five|six|seven|eight|nine|ten|\d+))\s*mark[s]?\s*(?:questions?)?',
+        re.IGNORECASE
+    )
+    sections = [
+        {'count': to_int(m.group(1)) or 0, 'marks': to_int(m.group(2)) or 0}
+        for m in section_pattern.finditer(query)
+    ]
+    # If user omitted count before marks (rare), ignore those entries
+    sections = [s for s in sections if s['count'] > 0]
+
+    # Difficulty guidance like: "one medium and one hard in each section"
+    per_section_medium_hard = bool(re.search(r'one\s+medium\s+and\s+one\s+hard\s+in\s+each\s+section', query, re.IGNORECASE))
+
+    # Check for global difficulty override: "all hard", "all easy", "all medium"
+    all_difficulty_override = None
+    all_pattern = re.search(r'all\s+(easy|medium|hard)', query, re.IGNORECASE)
+    if all_pattern:
+        all_difficulty_override = all_pattern.group(1).lower()
+
+    # Time override like 'duration is 30 minutes' or 'time 30 minutes'
+    time_match = re.search(r'(?:time|duration)\s*(?:is\s*)?(\d+)\s*minutes?', query, re.IGNORECASE)
+    if time_match:
+        params['time_minutes'] = int(time_match.group(1))
+
+    if sections:
+        # Build difficulties per section
+        detailed_sections = []
+        for s in sections:
+            diff_plan: list[str] = []
+            
+            # PRIORITY 1: Global difficulty override (e.g., "all hard questions")
+            if all_difficulty_override:
+                diff_plan = [all_difficulty_override] * s['count']
+            # PRIORITY 2: Per-section medium/hard rule
+            elif per_section_medium_hard:
+                # Ensure at least one medium and one hard per section when possible
+                if s['count'] >= 2:
+                    diff_plan.extend(['medium', 'hard'])
+                # Fill remaining with easy, then cycle medium, hard
+                while len(diff_plan) < s['count']:
+                    if 'easy' not in diff_plan:
+                        diff_plan.append('easy')
+                    else:
+                        # Alternate medium/hard for the rest
+                        diff_plan.append('medium' if (len(diff_plan) % 2 == 0) else 'hard')
+            # PRIORITY 3: Default distribution based on marks
+            else:
+                # No specific guidance -> distribute roughly easy/medium/hard
+                # Prioritize medium/hard for higher marks
+                if s['marks'] >= 10:
+                    base = ['easy', 'medium', 'hard']
+                elif s['marks'] >= 4:
+                    base = ['medium', 'hard', 'easy']
+                else:
+                    base = ['medium', 'easy', 'hard']
+                i = 0
+                while len(diff_plan) < s['count']:
+                    diff_plan.append(base[i % len(base)])
+                    i += 1
+
+            detailed_sections.append({
+                'count': s['count'],
+                'marks': s['marks'],
+                'difficulties': diff_plan[:s['count']]
+            })
+
+        params['sections'] = detailed_sections
+        params['questions_per_paper'] = sum(s['count'] for s in detailed_sections)
+        # marks_per_question is irrelevant when using sections but keep last marks for compatibility
+        if detailed_sections:
+            params['marks_per_question'] = detailed_sections[-1]['marks']
+        return params
+
+    # If no sections, continue with uniform parsing
+    marks_match = re.search(r'(\d+)\s*marks?(?:\s+each)?', query, re.IGNORECASE)
+    if marks_match:
+        params['marks_per_question'] = int(marks_match.group(1))
+
+    # Flexible difficulty overrides
+    all_pattern = re.search(r'all\s+(?:(\d+)\s+)?(easy|medium|hard)', query, re.IGNORECASE)
+    if all_pattern:
+        count = int(all_pattern.group(1)) if all_pattern.group(1) else params['questions_per_paper']
+        difficulty_level = all_pattern.group(2).lower()
+        params['difficulty'] = {'easy': 0, 'medium': 0, 'hard': 0}
+        params['difficulty'][difficulty_level] = count
+        params['questions_per_paper'] = count
+        return params
+
+    single_difficulty = re.search(r'(\d+)\s+(easy|medium|hard)', query, re.IGNORECASE)
+    if single_difficulty and not re.search(r'(\d+)\s+easy.*?(\d+)\s+medium.*?(\d+)\s+hard', query, re.IGNORECASE):
+        count = int(single_difficulty.group(1))
+        difficulty_level = single_difficulty.group(2).lower()
+        params['difficulty'] = {'easy': 0, 'medium': 0, 'hard': 0}
+        params['difficulty'][difficulty_level] = count
+        params['questions_per_paper'] = count
+        return params
+
+    difficulty_pattern = r'(\d+)\s*easy.*?(\d+)\s*medium.*?(\d+)\s*hard'
+    difficulty_match = re.search(difficulty_pattern, query, re.IGNORECASE)
+    if difficulty_match:
+        easy_count = int(difficulty_match.group(1))
+        medium_count = int(difficulty_match.group(2))
+        hard_count = int(difficulty_match.group(3))
+        total = easy_count + medium_count + hard_count
+        params['difficulty'] = {'easy': easy_count, 'medium': medium_count, 'hard': hard_count}
+        params['questions_per_paper'] = total
+
+    return params
+
+
+def random_query(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(1, 18)):
+        word = rng.choice(VOCABULARY)
+        roll = rng.random()
+        if roll < 0.15:
+            word = word.upper()
+        elif roll < 0.3:
+            word = word.capitalize()
+        parts.append(word)
+        parts.append(rng.choice(SEPARATORS))
+    return ''.join(parts).strip()
+
+
+def assert_equivalent(query: str):
+    expected = reference_parse(query)
+    assert parse_exam_paper_params(query) == expected, query
+    for paper_number in (None, 2):
+        direct = _render_exam_prompt(query, "CONTEXT {x} ]", expected, paper_number)
+        memoized = generate_exam_paper_prompt(query, "CONTEXT {x} ]", parse_exam_spec(query), paper_number)
+        assert memoized == direct, (query, paper_number)
+
+
+@pytest.mark.parametrize('query', EXAMPLES)
+def test_examples_match_reference(query):
+    assert_equivalent(query)
+
+
+def test_random_queries_match_reference():
+    rng = random.Random(SEED)
+    for _ in range(RANDOM_QUERIES):
+        assert_equivalent(random_query(rng))
+
+
+def test_cached_spec_is_reused():
+    parse_exam_spec.cache_clear()
+    assert parse_exam_spec("Generate 3 papers all hard") is parse_exam_spec("Generate 3 papers all hard")
+    assert parse_exam_spec.cache_info().hits == 1
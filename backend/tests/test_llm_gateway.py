@@ -0,0 +1,104 @@
+"""LLMGateway retries, hedging, failover and circuit breaking over FakeChatModel clients."""
+import time
+import asyncio
+
+import pytest
+
+from fakes import FakeChatModel, FakeProviderError
+from llm_gateway import CircuitBreaker, LLMGateway, ModelEndpoint, ModelUnavailable
+
+
+class FailFirst(FakeChatModel):
+    """Fails its first ``failures`` calls with a 503, then answers."""
+
+    def __init__(self, failures: int, **kwargs):
+        super().__init__(reply="ok", latency=0, tokens_per_second=0, **kwargs)
+        self.failures = failures
+
+    def _draw(self):
+        latency, error = super()._draw()
+        return latency, FakeProviderError("down") if self.calls <= self.failures else error
+
+
+def fake(**kwargs):
+    return FakeChatModel(**dict({'reply': "ok", 'latency': 0, 'tokens_per_second': 0}, **kwargs))
+
+
+def gateway(endpoints, **kwargs):
+    return LLMGateway({e.name: e for e in endpoints}, **dict({'retries': 2, 'backoff_base': 0}, **kwargs))
+
+
+def test_retryable_failures_are_retried():
+    endpoint = ModelEndpoint('m', [FailFirst(2)])
+    model = gateway([endpoint]).model('m')
+    assert asyncio.run(model.ainvoke("prompt")).content == "ok"
+    assert model.report['attempts'] == 3
+    assert endpoint.stats()['retries'] == 2
+    assert endpoint.breaker.state == 'closed'
+
+
+def test_streams_are_retried_before_the_first_token():
+    endpoint = ModelEndpoint('m', [FailFirst(1)])
+    model = gateway([endpoint]).model('m')
+
+    async def collect():
+        return "".join([chunk.content async for chunk in model.astream("prompt")])
+
+    assert asyncio.run(collect()) == "ok"
+    assert model.report['attempts'] == 2
+
+
+def test_client_errors_are_not_retried():
+    endpoint = ModelEndpoint('m', [fake(fail=FakeProviderError("bad request", status_code=400))])
+    with pytest.raises(FakeProviderError):
+        asyncio.run(gateway([endpoint]).model('m').ainvoke("prompt"))
+    assert endpoint.stats()['calls'] == 1
+    assert endpoint.breaker.state == 'closed'
+
+
+def test_slow_attempt_is_hedged_on_another_client():
+    endpoint = ModelEndpoint('m', [fake(latency=2.0), fake()])
+    endpoint.latency.extend([0.01] * 20)
+    model = gateway([endpoint], hedge_percentile=90).model('m')
+    started = time.monotonic()
+    assert asyncio.run(model.ainvoke("prompt")).content == "ok"
+    assert time.monotonic() - started < 1.0
+    assert model.report['hedged'] == 1
+    assert endpoint.stats()['hedge_wins'] == 1
+    assert endpoint.stats()['inflight'] == 0
+
+
+def test_open_circuit_fails_over_and_stops_calling_the_broken_model():
+    broken = ModelEndpoint('m', [fake(fail=FakeProviderError("down"))], CircuitBreaker(failures=2, cooldown=30))
+    backup = ModelEndpoint('backup', [fake()])
+    llm = gateway([broken, backup], retries=0)
+    for _ in range(4):
+        model = llm.model('m')
+        assert asyncio.run(model.ainvoke("prompt")).content == "ok"
+        assert model.report['model'] == 'backup'
+    assert broken.stats()['calls'] == 2
+    assert broken.breaker.state == 'open'
+    assert llm.available() == ['backup']
+    assert 0 < llm.unavailable()['m'] <= 30
+
+
+def test_open_circuit_without_failover_raises_model_unavailable():
+    broken = ModelEndpoint('m', [fake(fail=FakeProviderError("down"))], CircuitBreaker(failures=1, cooldown=30))
+    llm = gateway([broken], retries=0, failover=['m'])
+    with pytest.raises(FakeProviderError):
+        asyncio.run(llm.model('m').ainvoke("prompt"))
+    with pytest.raises(ModelUnavailable) as raised:
+        asyncio.run(llm.model('m').ainvoke("prompt"))
+    assert raised.value.retry_after > 0
+    assert broken.stats()['calls'] == 1
+
+
+def test_breaker_lets_one_probe_through_after_the_cooldown():
+    breaker = CircuitBreaker(failures=1, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
@@ -0,0 +1,81 @@
+"""WebContextFetcher against a local stand-in for the search API and result pages."""
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import pytest
+
+from web_context import WebContextFetcher
+
+ARTICLE = """<html><head><title>Entropy</title><style>body { color: red }</style>
+<script>var tracking = true;</script></head>
+<body><nav>Home | About</nav><header>Site banner</header>
+<h1>Entropy</h1><p>Entropy measures the number of microstates &amp; their spread.</p>
+<footer>Copyright</footer></body></html>"""
+ARTICLE_TEXT = "Entropy\nEntropy\nEntropy measures the number of microstates & their spread."
+
+
+class StandIn(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        StandIn.requests.append(path)
+        base = f"http://{self.headers['Host']}"
+        if path == '/search':
+            body = json.dumps({'items': [
+                {'title': 'Entropy', 'link': f"{base}/article", 'snippet': 'article snippet'},
+                {'title': 'Slow page', 'link': f"{base}/slow", 'snippet': 'slow snippet'},
+                {'title': 'Missing', 'link': f"{base}/missing", 'snippet': 'missing snippet'},
+            ]}).encode()
+            content_type = 'application/json'
+        elif path in ('/article', '/slow'):
+            if path == '/slow':
+                time.sleep(1.0)
+            body = ARTICLE.encode()
+            content_type = 'text/html; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StandIn.requests = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_get_context_uses_snippets_for_late_or_failed_pages(server):
+    fetcher = WebContextFetcher('key', 'cx', search_url=f"{server}/search", deadline=0.5, timeout=2)
+    context = fetcher.get_context("entropy", num_results=3)
+    assert context.split("\n\n") == [
+        f"Title: Entropy\nContent: {ARTICLE_TEXT}",
+        "Title: Slow page\nSnippet: slow snippet",
+        "Title: Missing\nSnippet: missing snippet",
+    ]
+
+
+def test_repeated_queries_are_served_from_the_cache(server):
+    fetcher = WebContextFetcher('key', 'cx', search_url=f"{server}/search", deadline=2, timeout=2)
+    first = fetcher.get_context("entropy", num_results=3)
+    fetched = list(StandIn.requests)
+    assert fetcher.get_context("entropy", num_results=3) == first
+    # Only the page that failed is requested again.
+    assert StandIn.requests[len(fetched):] == ['/missing']
+    assert fetcher.stats()['search_cache']['hits'] == 1
+    assert fetcher.stats()['page_cache']['hits'] == 2
+
@@ -0,0 +1,308 @@
+import os
+import time
+from typing import List, Optional, Tuple
+
+try:
+    import faiss
+    import numpy as np
+except Exception:
+    faiss = None
+    np = None
+
+from native_store import NativeStore, chunk_key, chunk_row, is_legacy_store, is_native_store, migrate_legacy_store
+
+# flat | hnsw | sq8 | ivf_sq8 | ivf_pq. Stores smaller than INDEX_FORMAT_MIN_VECTORS
+# stay flat: quantizers need training data and exact search is already fast there.
+INDEX_FORMAT = os.environ.get("VECTOR_INDEX_FORMAT", "flat")
+INDEX_FORMAT_MIN_VECTORS = int(os.environ.get("VECTOR_INDEX_FORMAT_MIN_VECTORS", 2000))
+# Memory-map index files so every worker process shares the same page-cache pages.
+INDEX_MMAP = os.environ.get("VECTOR_INDEX_MMAP", "1") == "1"
+HNSW_M = 32
+HNSW_EF_SEARCH = int(os.environ.get("HNSW_EF_SEARCH", 64))
+IVF_NPROBE = int(os.environ.get("IVF_NPROBE", 32))
+PQ_MAX_BITS = 8
+# Centroids per document kept for the document router (fewer for short documents).
+ROUTER_CENTROIDS = int(os.environ.get("DOC_ROUTER_CENTROIDS", 8))
+CENTROIDS_FILENAME = 'centroids.f32'
+
+INDEX_FORMATS = ('flat', 'hnsw', 'sq8', 'ivf_sq8', 'ivf_pq')
+# FAISS 1.7 only memory-maps IVF inverted lists; other index types are read into private memory.
+MAPPED_FORMATS = ('ivf_sq8', 'ivf_pq')
+
+
+def format_filename(fmt: str) -> str:
+    return f"index.{fmt}.faiss"
+
+
+def effective_format(ntotal: int, fmt: str = INDEX_FORMAT) -> str:
+    if fmt not in INDEX_FORMATS:
+        print(f"⚠️ Unknown VECTOR_INDEX_FORMAT {fmt!r}, using flat")
+        return 'flat'
+    return fmt if ntotal >= INDEX_FORMAT_MIN_VECTORS else 'flat'
+
+
+def _ivf_lists(ntotal: int) -> int:
+    # ~sqrt(n) lists, with enough points per list to train the centroids.
+    return max(1, min(int(ntotal ** 0.5), ntotal // 39))
+
+
+def _pq_subquantizers(dim: int) -> int:
+    for m in (dim // 8, dim // 4, dim // 2, dim):
+        if m and dim % m == 0:
+            return m
+    return dim
+
+
+def _pq_bits(ntotal: int) -> int:
+    # FAISS wants ~39 training points per PQ centroid (2**bits of them).
+    bits = PQ_MAX_BITS
+    while bits > 4 and ntotal < 39 * 2 ** bits:
+        bits -= 1
+    return bits
+
+
+def build_faiss_index(vectors, fmt: str):
+    """Build a FAISS index of ``fmt`` over an ``(n, d)`` float32 array (L2 distance)."""
+    n, dim = vectors.shape
+    if fmt == 'flat':
+        index = faiss.IndexFlatL2(dim)
+    elif fmt == 'hnsw':
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+    elif fmt == 'sq8':
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+    elif fmt == 'ivf_sq8':
+        index = faiss.IndexIVFScalarQuantizer(faiss.IndexFlatL2(dim), dim, _ivf_lists(n), faiss.ScalarQuantizer.QT_8bit)
+    elif fmt == 'ivf_pq':
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, _ivf_lists(n), _pq_subquantizers(dim), _pq_bits(n))
+    else:
+        raise ValueError(f"Unknown index format: {fmt}")
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def tune_for_search(index):
+    """Apply the search-time knobs (efSearch, nprobe) that are not stored in the file."""
+    if hasattr(index, 'hnsw'):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    try:
+        faiss.extract_index_ivf(index).nprobe = IVF_NPROBE
+    except RuntimeError:
+        pass
+    return index
+
+
+def search_parameters(index, selector):
+    """Search parameters restricting ``index`` to the ids ``selector`` accepts, keeping the tuned knobs."""
+    if hasattr(index, 'hnsw'):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=HNSW_EF_SEARCH)
+    try:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(index).nprobe)
+    except RuntimeError:
+        return faiss.SearchParameters(sel=selector)
+
+
+def build_centroids(vectors, k: int = ROUTER_CENTROIDS):
+    """
+    Up to ``k`` unit-length centroids of a document's vectors (spherical
+    k-means, one centroid per ~39 vectors so every one is trained; a
+    single mean for short documents). Long documents are sampled evenly,
+    as k-means itself would, so a large mapped store is not read whole.
+    """
+    n = len(vectors)
+    if not n:
+        return np.zeros((0, vectors.shape[1]), dtype='float32')
+    k = max(1, min(k, n // 39))
+    if n > 256 * k:
+        vectors = vectors[np.linspace(0, n - 1, 256 * k).astype('int64')]
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    if k == 1:
+        centroids = vectors.mean(axis=0, keepdims=True)
+    else:
+        kmeans = faiss.Kmeans(vectors.shape[1], k, niter=10, spherical=True, seed=1234)
+        kmeans.train(vectors)
+        centroids = kmeans.centroids
+    return (centroids / np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)).astype('float32')
+
+
+def load_or_build_centroids(vector_path: str, store: NativeStore):
+    """Read the router centroids saved beside a store, building (and saving) them for older stores."""
+    if not store.count:
+        return np.zeros((0, store.dim), dtype='float32')
+    path = os.path.join(vector_path, CENTROIDS_FILENAME)
+    if os.path.exists(path):
+        return np.fromfile(path, dtype='float32').reshape(-1, store.dim)
+    centroids = build_centroids(store.vectors)
+    if os.path.isdir(vector_path):
+        tmp_path = f"{path}.tmp"
+        centroids.tofile(tmp_path)
+        os.replace(tmp_path, path)
+    return centroids
+
+
+def read_faiss_index(path: str, mmap: bool = INDEX_MMAP):
+    if mmap:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # Older FAISS builds cannot map every index type.
+            pass
+    return faiss.read_index(path)
+
+
+def _write_atomic(index, path: str):
+    tmp_path = f"{path}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def open_store(vector_path: str) -> NativeStore:
+    """Open a store, first rewriting it in the native layout if it predates it."""
+    if not is_native_store(vector_path) and is_legacy_store(vector_path):
+        migrate_legacy_store(vector_path)
+    return NativeStore(vector_path)
+
+
+def ensure_index_format(vector_path: str, fmt: str = INDEX_FORMAT, store: NativeStore = None) -> Tuple[str, Optional[float]]:
+    """
+    Make sure the store at ``vector_path`` has an index file in the format
+    it should be searched with, building it from the raw vectors if not.
+
+    Flat search runs straight over the mapped ``vectors.f32``, which stays
+    the source of truth, so changing ``VECTOR_INDEX_FORMAT`` (or going back
+    to flat) only ever adds a file. Returns the effective format and the
+    build time (None if nothing was built).
+    """
+    store = store or open_store(vector_path)
+    fmt = effective_format(store.count, fmt)
+    path = os.path.join(vector_path, format_filename(fmt))
+    if fmt == 'flat' or os.path.exists(path):
+        return fmt, None
+    t0 = time.perf_counter()
+    _write_atomic(build_faiss_index(np.asarray(store.vectors), fmt), path)
+    elapsed = time.perf_counter() - t0
+    print(f"Built {fmt} index for {vector_path} ({store.count} vectors) in {elapsed:.2f}s")
+    return fmt, elapsed
+
+
+class VectorShard:
+    """
+    One PDF's vectors and chunks inside a user's index.
+
+    Backed by a ``NativeStore``: flat search scans the memory-mapped vector
+    file and other formats search their index file, mapped where FAISS
+    supports it. Identical PDFs (and every worker process) therefore share
+    the same pages, and chunk text is only read for the hits returned.
+    """
+
+    def __init__(self, pdf_hash: str, store: NativeStore, index=None, fmt: str = 'flat', index_bytes: int = 0):
+        self.pdf_hash = pdf_hash
+        self.store = store
+        self.index = index
+        self.format = fmt
+        self.index_bytes = index_bytes
+        self._centroids = None
+        self._pages = None
+
+    @classmethod
+    def load(cls, pdf_hash: str, vector_path: str, fmt: str = INDEX_FORMAT) -> "VectorShard":
+        store = open_store(vector_path)
+        fmt, _ = ensure_index_format(vector_path, fmt, store)
+        if fmt == 'flat':
+            return cls(pdf_hash, store)
+        path = os.path.join(vector_path, format_filename(fmt))
+        index = tune_for_search(read_faiss_index(path))
+        return cls(pdf_hash, store, index, fmt, os.path.getsize(path))
+
+    @property
+    def ntotal(self) -> int:
+        return self.store.count
+
+    @property
+    def ids(self) -> List[str]:
+        return [chunk_key(self.pdf_hash, row) for row in range(self.store.count)]
+
+    def search(self, vector, k: int, rows=None) -> List[Tuple[float, str]]:
+        """
+        Nearest chunks as ``(distance, chunk key)``. ``rows`` (sorted row
+        numbers) restricts the search to those chunks inside the scan or
+        the index, so a filter never costs recall the way dropping hits
+        afterwards would.
+        """
+        k = min(k, self.store.count if rows is None else len(rows))
+        if k <= 0:
+            return []
+        if rows is None:
+            if self.index is None:
+                distances, indices = faiss.knn(vector, self.store.vectors, k)
+            else:
+                distances, indices = self.index.search(vector, k)
+        else:
+            first, last = int(rows[0]), int(rows[-1])
+            contiguous = last - first + 1 == len(rows)
+            if self.index is None:
+                # Chunks are stored in page order, so a page range is usually one slice of the map.
+                vectors = self.store.vectors[first:last + 1] if contiguous else np.asarray(self.store.vectors[rows])
+                distances, indices = faiss.knn(vector, vectors, k)
+                indices = indices + first if contiguous else np.where(indices >= 0, rows[indices], -1)
+            else:
+                selector = (faiss.IDSelectorRange(first, last + 1) if contiguous
+                            else faiss.IDSelectorBatch(np.asarray(rows, dtype='int64')))
+                distances, indices = self.index.search(vector, k, params=search_parameters(self.index, selector))
+        return [(float(d), chunk_key(self.pdf_hash, int(i))) for d, i in zip(distances[0], indices[0]) if i != -1]
+
+    def page_rows(self, first: int, last: int):
+        """Sorted rows of the chunks whose 0-based ``page`` lies in ``[first, last]``."""
+        if self._pages is None:
+            if 'page' in self.store.shared:
+                pages = np.full(self.store.count, self.store.shared['page'], dtype='int64')
+            else:
+                column = self.store.column('page') or [None] * self.store.count
+                pages = np.asarray([-1 if p is None else p for p in column], dtype='int64')
+            self._pages = pages
+        return np.flatnonzero((self._pages >= first) & (self._pages <= last))
+
+    def centroids(self):
+        """This document's router centroids, read (or built) on first use."""
+        if self._centroids is None:
+            self._centroids = load_or_build_centroids(self.store.path, self.store)
+        return self._centroids
+
+    def get(self, doc_id: str):
+        return self.store.document(chunk_row(doc_id)[1])
+
+    def iter_texts(self):
+        for row, text in self.store.iter_texts():
+            yield chunk_key(self.pdf_hash, row), text
+
+    def first_source(self) -> Optional[str]:
+        if 'source' in self.store.shared:
+            return self.store.shared['source']
+        return self.store.metadata(0).get('source') if self.store.count else None
+
+    def index_mapped(self) -> bool:
+        return INDEX_MMAP and self.format in MAPPED_FORMATS
+
+    def resident_bytes(self) -> int:
+        """Private memory estimate: metadata columns, plus the index file unless it is mapped."""
+        return self.store.private_bytes() + (0 if self.index_mapped() else self.index_bytes)
+
+    def mapped_bytes(self) -> int:
+        return self.store.mapped_bytes() + (self.index_bytes if self.index_mapped() else 0)
+
+
+def search_shards(shards, vector, k: int, rows=None) -> List[str]:
+    """
+    Top-``k`` docstore ids across several shards, merged by L2 distance.
+    ``rows`` optionally maps a shard's hash to the rows it may return.
+    """
+    query = np.asarray(vector, dtype='float32').reshape(1, -1)
+    rows = rows or {}
+    hits = []
+    for shard in shards:
+        hits.extend(shard.search(query, k, rows.get(shard.pdf_hash)))
+    hits.sort(key=lambda hit: hit[0])
+    return [doc_id for _, doc_id in hits[:k]]
+
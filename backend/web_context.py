@@ -0,0 +1,149 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from html_extract import fetch_text
+
+GOOGLE_SEARCH_URL = os.environ.get("GOOGLE_SEARCH_URL", "https://www.googleapis.com/customsearch/v1")
+WEB_FETCH_WORKERS = int(os.environ.get("WEB_FETCH_WORKERS", 8))
+# Whole-request budget for fetching result pages; slower pages fall back to their snippet.
+WEB_FETCH_DEADLINE = float(os.environ.get("WEB_FETCH_DEADLINE", 6))
+WEB_FETCH_TIMEOUT = float(os.environ.get("WEB_FETCH_TIMEOUT", 5))
+WEB_CACHE_TTL = float(os.environ.get("WEB_CACHE_TTL", 900))
+WEB_CACHE_SIZE = int(os.environ.get("WEB_CACHE_SIZE", 1024))
+PAGE_CHAR_LIMIT = 3000
+
+
+class TTLCache:
+    """Small thread-safe LRU whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: "OrderedDict[object, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else None,
+            }
+
+
+class WebContextFetcher:
+    """
+    Google Custom Search plus concurrent page fetching for the web fallback.
+
+    Result pages are fetched in parallel through one pooled ``requests``
+    session and the whole fetch is bounded by ``deadline`` seconds; any page
+    not back in time contributes its search snippet instead. Search results
+    and extracted page text are cached for ``cache_ttl`` seconds, so repeated
+    queries (and the chat error fallback) do not hit the network again.
+    ``search_url`` can point at a local stand-in server.
+    """
+
+    def __init__(self, api_key: Optional[str], cse_id: Optional[str],
+                 search_url: str = GOOGLE_SEARCH_URL, workers: int = WEB_FETCH_WORKERS,
+                 deadline: float = WEB_FETCH_DEADLINE, timeout: float = WEB_FETCH_TIMEOUT,
+                 cache_ttl: float = WEB_CACHE_TTL, cache_size: int = WEB_CACHE_SIZE):
+        self.api_key = api_key
+        self.cse_id = cse_id
+        self.search_url = search_url
+        self.deadline = deadline
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = 'Mozilla/5.0 (compatible; RAGStudyAssistant/1.0)'
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='web-fetch')
+        self.search_cache = TTLCache(cache_ttl, cache_size)
+        self.page_cache = TTLCache(cache_ttl, cache_size)
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key and self.cse_id)
+
+    def search(self, query: str, num_results: int = 5) -> List[Dict]:
+        key = (query, num_results)
+        results = self.search_cache.get(key)
+        if results is not None:
+            return results
+        response = self.session.get(
+            self.search_url,
+            params={'key': self.api_key, 'cx': self.cse_id, 'q': query, 'num': num_results},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        results = [
+            {'title': item.get('title'), 'link': item.get('link'), 'snippet': item.get('snippet')}
+            for item in response.json().get('items', [])
+        ]
+        self.search_cache.set(key, results)
+        return results
+
+    def fetch_page_text(self, url: str) -> str:
+        text = self.page_cache.get(url)
+        if text is not None:
+            return text
+        text = fetch_text(self.session, url, PAGE_CHAR_LIMIT, self.timeout)
+        self.page_cache.set(url, text)
+        return text
+
+    def get_context(self, query: str, num_results: int = 5, cancel: threading.Event = None) -> str:
+        """
+        Search and fetch result pages. Setting ``cancel`` (a speculative
+        fetch that is no longer needed) stops before any page is requested.
+        """
+        results = self.search(query, num_results=num_results)
+        if cancel is not None and cancel.is_set():
+            return ""
+        futures = [self._pool.submit(self.fetch_page_text, res['link']) for res in results]
+        wait(futures, timeout=self.deadline)
+
+        full_contents = []
+        for res, future in zip(results, futures):
+            title = res.get('title') or 'No title'
+            if future.done() and future.exception() is None:
+                full_contents.append(f"Title: {title}\nContent: {future.result()}")
+            else:
+                # Late pages keep downloading and land in the cache for next time.
+                full_contents.append(f"Title: {title}\nSnippet: {res.get('snippet') or 'No snippet'}")
+        return "\n\n".join(full_contents)
+
+    def stats(self) -> Dict:
+        return {
+            'search_cache': self.search_cache.stats(),
+            'page_cache': self.page_cache.stats(),
+        }